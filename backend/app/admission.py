@@ -0,0 +1,218 @@
+"""
+Control de admisión y planificación delante del motor de cálculo
+Cada modo tiene un límite de cálculos simultáneos; lo que no cabe espera en
+una cola acotada. Si la cola está llena, o una petición espera demasiado,
+se rechaza enseguida con 503 y Retry-After en lugar de acumularse hasta que
+Cloud Run corte la conexión.
+
+Además el trabajo se reparte en dos carriles según su coste estimado:
+
+- fast: aritmética (y el modo auto sin variables ni '='). La aritmética pura
+  se resuelve en el propio proceso, sin pasar por el pool; el resto usa el
+  pool sin más límite que el de su modo.
+- heavy: trabajo simbólico (álgebra, ecuaciones, derivadas, integrales y
+  expresiones largas). Todos los modos pesados comparten una capacidad
+  (ADMISSION_HEAVY_CAPACITY, por defecto un worker menos que el pool), así
+  que siempre queda un worker libre para las respuestas rápidas.
+
+Opcionalmente (ADMISSION_DEGRADE=true), con la cola por encima de un umbral
+las peticiones con pasos completos se resuelven con `steps="summary"`
+(solo el resultado), que es varias veces más barato.
+
+Solo se usa desde el event loop, así que los contadores no necesitan locks.
+"""
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List
+from app.executor import engine_executor, DEFAULT_TIMEOUTS
+from app.timing import stage
+import asyncio
+import os
+import re
+
+# Modos con límite propio (el resto comparte el de 'auto')
+ADMISSION_MODES = ("auto",) + tuple(DEFAULT_TIMEOUTS)
+
+# Carriles de ejecución por coste estimado
+LANES = ("fast", "heavy")
+
+# Letras (variables, funciones) o '=': en modo auto indican trabajo simbólico
+_SYMBOLIC_RE = re.compile(r"[A-Za-z=]")
+
+
+class AdmissionRejected(Exception):
+    """
+    El servicio está saturado: la petición no entra en la cola
+    """
+
+    def __init__(self, mode: str, reason: str, retry_after: int):
+        super().__init__(mode, reason, retry_after)
+        self.mode = mode
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def __str__(self):
+        if self.reason == "queue_timeout":
+            return f"Demasiados cálculos en modo '{self.mode}' en espera; inténtalo de nuevo en unos segundos"
+        return "El servicio está saturado; inténtalo de nuevo en unos segundos"
+
+
+class AdmissionController:
+    """
+    Límite de concurrencia por modo y por carril + cola de espera acotada
+    """
+
+    def __init__(self, workers: int = None):
+        workers = max(workers if workers is not None else engine_executor.max_workers, 1)
+        # Aritmética es barata: admite más cálculos a la vez que los modos simbólicos
+        defaults = {mode: workers for mode in ADMISSION_MODES}
+        defaults["arithmetic"] = workers * 4
+        defaults["auto"] = workers * 2
+        self.limits = {
+            mode: int(os.getenv(f"ADMISSION_LIMIT_{mode.upper()}", str(default)))
+            for mode, default in defaults.items()
+        }
+        self.max_queue = int(os.getenv("ADMISSION_MAX_QUEUE", "100"))
+        self.queue_timeout = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))
+        self.retry_after = int(os.getenv("ADMISSION_RETRY_AFTER", "2"))
+        self.degrade_enabled = os.getenv("ADMISSION_DEGRADE", "false").lower() == "true"
+        self.degrade_queue = int(os.getenv("ADMISSION_DEGRADE_QUEUE", str(max(self.max_queue // 2, 1))))
+        self.heavy_capacity = int(os.getenv("ADMISSION_HEAVY_CAPACITY", str(max(workers - 1, 1))))
+        # Expresiones más largas que esto van al carril pesado aunque sean aritmética
+        self.fast_max_chars = int(os.getenv("ADMISSION_FAST_MAX_CHARS", "200"))
+
+        self.running: Dict[str, int] = {mode: 0 for mode in ADMISSION_MODES}
+        self.waiting: Dict[str, int] = {mode: 0 for mode in ADMISSION_MODES}
+        self.admitted: Dict[str, int] = {mode: 0 for mode in ADMISSION_MODES}
+        self.rejected: Dict[str, int] = {mode: 0 for mode in ADMISSION_MODES}
+        self.degraded = 0
+        self.lane_running: Dict[str, int] = {lane: 0 for lane in LANES}
+        self.lane_waiting: Dict[str, int] = {lane: 0 for lane in LANES}
+        self.lane_admitted: Dict[str, int] = {lane: 0 for lane in LANES}
+        # Cálculos del carril rápido resueltos en el proceso, sin pasar por el pool
+        self.inline = 0
+        # Los semáforos se crean con el primer uso, dentro del event loop
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    @staticmethod
+    def _mode_key(mode: str) -> str:
+        return mode if mode in ADMISSION_MODES else "auto"
+
+    def _semaphore(self, key: str, limit: int) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(key)
+        if semaphore is None:
+            semaphore = self._semaphores[key] = asyncio.Semaphore(limit)
+        return semaphore
+
+    def classify(self, expression: str, mode: str) -> str:
+        """
+        Carril según el modo y el coste estimado: 'fast' o 'heavy'
+        """
+        if len(expression) > self.fast_max_chars:
+            return "heavy"
+        if mode == "arithmetic":
+            return "fast"
+        if mode == "auto" and not _SYMBOLIC_RE.search(expression):
+            return "fast"
+        return "heavy"
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(self.waiting.values())
+
+    def should_degrade(self) -> bool:
+        """
+        Si conviene resolver solo el resultado por la presión en la cola
+        """
+        return self.degrade_enabled and self.queue_depth >= self.degrade_queue
+
+    def _reject(self, key: str, reason: str):
+        self.rejected[key] += 1
+        raise AdmissionRejected(key, reason, self.retry_after)
+
+    @staticmethod
+    async def _acquire_all(semaphores: List[asyncio.Semaphore]):
+        # Siempre en el mismo orden (modo, luego carril): no hay interbloqueos
+        acquired = []
+        try:
+            for semaphore in semaphores:
+                await semaphore.acquire()
+                acquired.append(semaphore)
+        except BaseException:
+            for semaphore in acquired:
+                semaphore.release()
+            raise
+
+    @asynccontextmanager
+    async def slot(self, mode: str, lane: str = "heavy"):
+        """
+        Reserva un cálculo simultáneo del modo (y del carril pesado si
+        corresponde), esperando en la cola si hace falta
+
+        Raises:
+            AdmissionRejected: cola llena o espera más larga que ADMISSION_QUEUE_TIMEOUT
+        """
+        key = self._mode_key(mode)
+        semaphores = [self._semaphore(key, self.limits[key])]
+        if lane == "heavy":
+            semaphores.append(self._semaphore("heavy", self.heavy_capacity))
+
+        if any(semaphore.locked() for semaphore in semaphores):
+            if self.queue_depth >= self.max_queue:
+                self._reject(key, "queue_full")
+            self.waiting[key] += 1
+            self.lane_waiting[lane] += 1
+            try:
+                with stage("queue"):
+                    await asyncio.wait_for(self._acquire_all(semaphores), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._reject(key, "queue_timeout")
+            finally:
+                self.waiting[key] -= 1
+                self.lane_waiting[lane] -= 1
+        else:
+            await self._acquire_all(semaphores)
+
+        self.admitted[key] += 1
+        self.running[key] += 1
+        self.lane_admitted[lane] += 1
+        self.lane_running[lane] += 1
+        try:
+            yield
+        finally:
+            self.running[key] -= 1
+            self.lane_running[lane] -= 1
+            for semaphore in reversed(semaphores):
+                semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue": self.max_queue,
+            "queue_timeout_seconds": self.queue_timeout,
+            "limits": self.limits,
+            "running": self.running,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "lanes": {
+                "fast": {
+                    "running": self.lane_running["fast"],
+                    "waiting": self.lane_waiting["fast"],
+                    "admitted": self.lane_admitted["fast"],
+                    "inline": self.inline,
+                    "max_chars": self.fast_max_chars
+                },
+                "heavy": {
+                    "running": self.lane_running["heavy"],
+                    "waiting": self.lane_waiting["heavy"],
+                    "admitted": self.lane_admitted["heavy"],
+                    "capacity": self.heavy_capacity
+                }
+            },
+            "degrade_enabled": self.degrade_enabled,
+            "degraded": self.degraded
+        }
+
+
+# Instancia global
+admission_controller = AdmissionController()
@@ -0,0 +1,301 @@
+"""
+Caché de resultados de cálculo
+Los estudiantes envían las mismas expresiones de libro una y otra vez;
+guardamos el resultado completo (result + steps + mode) para no recalcular
+
+Dos niveles:
+- ResultCache: LRU en memoria, propia de cada proceso de uvicorn
+- SharedResultCache: SQLite en modo WAL compartido por todos los workers
+  del host; sobrevive a reinicios y redeploys
+"""
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+from app.serialization import dumps, loads
+import asyncio
+import threading
+import logging
+import sqlite3
+import json
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(expression: str, mode: str, variables: Optional[Dict] = None, steps: str = "full") -> str:
+    """
+    Clave canónica de una petición: expresión sanitizada, modo, variables
+    y nivel de pasos (omitido en 'full' para conservar las claves existentes)
+    """
+    parts = [expression, mode, variables or {}]
+    if steps != "full":
+        parts.append(steps)
+    return json.dumps(parts, sort_keys=True, default=str)
+
+
+class ResultCache:
+    """
+    Caché LRU en memoria con expiración por TTL
+
+    Solo se usa desde el event loop, por lo que no necesita locks.
+    Se desactiva con CACHE_ENABLED=false (útil para depurar)
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+        self.max_size = int(os.getenv("CACHE_MAX_SIZE", "2048"))
+        self.ttl_seconds = float(os.getenv("CACHE_TTL_SECONDS", "3600"))
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Devuelve el resultado guardado o None si no existe o expiró
+        """
+        if not self.enabled:
+            return None
+
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]):
+        """
+        Guarda un resultado, expulsando el menos usado si se llena
+        """
+        if not self.enabled or self.max_size <= 0:
+            return
+
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Vacía la caché (los contadores se mantienen)
+        """
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Contadores de uso de la caché
+        """
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class SharedResultCache:
+    """
+    Caché de segundo nivel en un archivo SQLite local (WAL + mmap)
+
+    - Las lecturas no bloquean a los escritores (WAL) y se sirven desde
+      memoria mapeada, así que se hacen directamente en el event loop
+    - Las escrituras se envían a un hilo para no añadir latencia
+    - Se expulsan las entradas más antiguas cuando el archivo supera
+      SHARED_CACHE_MAX_MB
+
+    Se activa definiendo SHARED_CACHE_PATH (p. ej. /tmp/educalc-cache.db)
+    """
+
+    # Cada cuántas escrituras se comprueba el tamaño total
+    EVICTION_CHECK_INTERVAL = 64
+
+    # Antigüedad máxima (s) de las entradas y el tamaño que informa stats();
+    # contarlos recorre toda la tabla, así que se recalculan en un hilo
+    TOTALS_MAX_AGE = 10.0
+
+    def __init__(self):
+        self.path = os.getenv("SHARED_CACHE_PATH", "")
+        self.enabled = bool(self.path)
+        self.max_bytes = int(float(os.getenv("SHARED_CACHE_MAX_MB", "64")) * 1024 * 1024)
+        self.ttl_seconds = float(os.getenv("SHARED_CACHE_TTL_SECONDS", "86400"))
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._writes_since_check = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.evictions = 0
+        # (entradas, bytes) de la última vez que se contaron
+        self._totals: Optional[Tuple[int, int]] = None
+        self._totals_at = 0.0
+        self._refreshing = False
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Una conexión por hilo (sqlite3 no comparte conexiones entre hilos)
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=2.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={self.max_bytes * 2}")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, payload TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS results_created_at ON results (created_at)")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Devuelve el resultado guardado o None si no existe o expiró
+        """
+        if not self.enabled:
+            return None
+
+        try:
+            row = self._connection().execute(
+                "SELECT payload FROM results WHERE key = ? AND created_at > ?",
+                (key, time.time() - self.ttl_seconds)
+            ).fetchone()
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"Error leyendo caché compartida: {str(e)}")
+            return None
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return loads(row[0])
+
+    def set(self, key: str, value: Dict[str, Any]):
+        """
+        Guarda un resultado (pensado para ejecutarse en un hilo)
+        """
+        if not self.enabled:
+            return
+
+        payload = dumps(value).decode("utf-8")
+        try:
+            with self._write_lock:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO results (key, payload, size, created_at) VALUES (?, ?, ?, ?)",
+                    (key, payload, len(payload) + len(key), time.time())
+                )
+                self._writes_since_check += 1
+                if self._writes_since_check >= self.EVICTION_CHECK_INTERVAL:
+                    self._writes_since_check = 0
+                    self._evict(conn)
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"Error escribiendo caché compartida: {str(e)}")
+
+    def _evict(self, conn: sqlite3.Connection):
+        """
+        Elimina entradas expiradas y, si hace falta, las más antiguas
+        hasta quedar por debajo del tamaño máximo
+        """
+        conn.execute("DELETE FROM results WHERE created_at <= ?", (time.time() - self.ttl_seconds,))
+        count, total = self._count(conn)
+        if total <= self.max_bytes or not count:
+            return
+
+        # Borrar proporcionalmente al exceso, con un 10% de margen
+        to_delete = max(1, int(count * (1 - self.max_bytes / total)) + count // 10)
+        conn.execute(
+            "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY created_at LIMIT ?)",
+            (to_delete,)
+        )
+        self.evictions += to_delete
+        # El tamaño ya no es el contado: se recalcula en el próximo stats()
+        self._totals_at = 0.0
+
+    def _count(self, conn: sqlite3.Connection) -> Tuple[int, int]:
+        """
+        Cuenta entradas y bytes (recorre la tabla: nunca desde el event loop)
+        """
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        self._totals = (count, total)
+        self._totals_at = time.monotonic()
+        return count, total
+
+    def refresh_totals(self):
+        """
+        Actualiza las entradas y el tamaño que informa stats()
+        """
+        try:
+            self._count(self._connection())
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"Error contando la caché compartida: {str(e)}")
+        finally:
+            self._refreshing = False
+
+    def _schedule_refresh(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Fuera del event loop (scripts, tests) se puede contar directamente
+            self.refresh_totals()
+            return
+        self._refreshing = True
+        loop.run_in_executor(None, self.refresh_totals)
+
+    def clear(self):
+        """
+        Vacía la caché compartida (afecta a todos los workers)
+        """
+        if self.enabled:
+            with self._write_lock:
+                self._connection().execute("DELETE FROM results")
+            self._totals = (0, 0)
+            self._totals_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Contadores de uso de la caché compartida
+
+        `entries` y `size_bytes` son los del último recuento (como mucho
+        TOTALS_MAX_AGE segundos de antigüedad; el primero llega en el
+        siguiente stats() si se pide desde el event loop)
+        """
+        data = {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "evictions": self.evictions
+        }
+        if self.enabled:
+            if not self._refreshing and time.monotonic() - self._totals_at > self.TOTALS_MAX_AGE:
+                self._schedule_refresh()
+            data["max_bytes"] = self.max_bytes
+            if self._totals is not None:
+                data["entries"], data["size_bytes"] = self._totals
+        return data
+
+
+# Instancias globales
+result_cache = ResultCache()
+shared_result_cache = SharedResultCache()
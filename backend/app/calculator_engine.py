@@ -3,17 +3,43 @@ Motor de cálculo matemático con generación de pasos explicativos
 Utiliza SymPy para el procesamiento simbólico
 """
 from sympy import (
-    sympify, simplify, expand, factor, solve, diff, integrate,
+    simplify, expand, factor, solve, diff, integrate,
     Eq, symbols, latex, preorder_traversal, Add, Mul, Pow
 )
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, Generator, Tuple
 from app.models import Step
+from app.fast_arithmetic import parse_arithmetic, simple_operation, reduce_steps, fraction_latex, power
+from app.parser import parse_math, ParseError
+from app.step_templates import step_templates
+from app.timing import stage, timed
 import logging
 from decimal import Decimal
+from fractions import Fraction
 import re
 
 logger = logging.getLogger(__name__)
 
+# Máximo de pasos de reducción PEMDAS antes de resumir el resto
+MAX_REDUCTION_STEPS = 200
+
+# Símbolos para mostrar cada operación en las explicaciones
+OPERATION_SYMBOLS = {"+": "+", "-": "-", "*": "×", "/": "÷", "**": "^"}
+
+# Nivel de detalle de los pasos:
+# - full: explicación completa
+# - summary: solo el paso con el resultado final
+# - none: solo el resultado (sin explicaciones, LaTeX ni pasos)
+STEPS_LEVELS = ("full", "summary", "none")
+
+# Operaciones simples de dos números, calculadas igual que en los _explain_*
+SIMPLE_OPERATIONS = {
+    "division": lambda a, b: a / b,
+    "multiplication": lambda a, b: a * b,
+    "addition": lambda a, b: a + b,
+    "subtraction": lambda a, b: a - b,
+    "power": lambda a, b: a ** b,
+}
+
 
 def format_number(value) -> str:
     """
@@ -23,6 +49,10 @@ def format_number(value) -> str:
     - Elimina ceros innecesarios: 2.72 en lugar de 2.72000000
     """
     try:
+        # Los enteros exactos del evaluador rápido se escriben sin pasar por float
+        if isinstance(value, Fraction) and value.denominator == 1:
+            return str(value.numerator)
+        
         # Convertir a float (maneja objetos SymPy también)
         num = float(value)
         
@@ -40,6 +70,7 @@ def format_number(value) -> str:
         return str(value)
 
 
+@timed("latex")
 def to_latex(expression) -> str:
     """
     Convierte una expresión a formato LaTeX
@@ -54,7 +85,7 @@ def to_latex(expression) -> str:
             except:
                 # Intentar convertir a expresión SymPy
                 try:
-                    expr = sympify(expression)
+                    expr = parse_math(expression)
                     return latex(expr)
                 except:
                     # Si falla, devolver el string original limpio
@@ -68,6 +99,71 @@ def to_latex(expression) -> str:
         return str(expression)
 
 
+@timed("steps_dump")
+def dump_steps(steps: List[Step]) -> List[Dict[str, Any]]:
+    """
+    Convierte los pasos Pydantic a dicts para la respuesta
+    """
+    return [s.model_dump() for s in steps]
+
+
+class ParsedExpression:
+    """
+    Resultado de la etapa de parseo de una petición
+
+    La expresión se parsea una sola vez y el objeto se comparte entre la
+    detección de modo, la validación, los calculadores y el LaTeX.
+    Si el parseo falla, el error se guarda y se lanza cuando un
+    calculador necesita la expresión.
+    
+    Para aritmética pura se guarda el resultado del evaluador rápido
+    (arithmetic) y el objeto SymPy solo se construye si alguien lo pide.
+    """
+
+    def __init__(self, text: str, expr=None, lhs=None, rhs=None, error: Optional[Exception] = None,
+                 arithmetic=None):
+        self.text = text
+        self._expr = expr
+        self.lhs = lhs
+        self.rhs = rhs
+        self.error = error
+        self.arithmetic = arithmetic
+
+    @property
+    def expr(self):
+        if self._expr is None and self.arithmetic is not None:
+            self._expr = parse_math(self.text)
+        return self._expr
+
+    @property
+    def is_equation(self) -> bool:
+        return self.lhs is not None
+
+    @property
+    def valid(self) -> bool:
+        return self.error is None
+
+    def require_expr(self):
+        """
+        Devuelve la expresión parseada o lanza el error de parseo
+        """
+        if self.error is not None:
+            raise self.error
+        if self.expr is None:
+            raise ValueError("La expresión contiene un signo '=': usa el modo 'solve'")
+        return self.expr
+
+    def require_sides(self):
+        """
+        Devuelve los dos lados de una ecuación o lanza el error de parseo
+        """
+        if self.error is not None:
+            raise self.error
+        if not self.is_equation:
+            raise ValueError("La expresión debe contener un signo '='")
+        return self.lhs, self.rhs
+
+
 class CalculatorEngine:
     """
     Motor principal de cálculo con explicaciones paso a paso
@@ -78,7 +174,38 @@ class CalculatorEngine:
             "auto", "arithmetic", "algebra", "solve", "derivative", "integral"
         ]
     
-    def calculate(self, expression: str, mode: str = "auto", variables: Optional[Dict] = None) -> Dict[str, Any]:
+    @timed("parse")
+    def parse(self, expression: str) -> ParsedExpression:
+        """
+        Etapa única de parseo: convierte el texto en objetos SymPy una vez
+        (con app.parser; nunca se evalúa el texto como código)
+        
+        Las ecuaciones (con '=') se parsean lado por lado.
+        Los errores no se lanzan aquí: quedan guardados en el resultado.
+        """
+        try:
+            if "=" in expression:
+                left, _, right = expression.partition("=")
+                extra = right.find("=")
+                if extra >= 0:
+                    raise ParseError("Una ecuación solo puede tener un signo '='", len(left) + 1 + extra)
+                return ParsedExpression(
+                    expression,
+                    lhs=parse_math(left),
+                    rhs=parse_math(right, offset=len(left) + 1)
+                )
+            
+            # Aritmética pura: evaluador rápido, sin SymPy
+            arithmetic = parse_arithmetic(expression)
+            if arithmetic is not None:
+                return ParsedExpression(expression, arithmetic=arithmetic)
+            
+            return ParsedExpression(expression, expr=parse_math(expression))
+        except Exception as e:
+            return ParsedExpression(expression, error=e)
+    
+    def calculate(self, expression: str, mode: str = "auto", variables: Optional[Dict] = None,
+                  parsed: Optional[ParsedExpression] = None, steps: str = "full") -> Dict[str, Any]:
         """
         Método principal que rutea a los calculadores específicos
         
@@ -86,73 +213,290 @@ class CalculatorEngine:
             expression: Expresión matemática
             mode: Modo de cálculo
             variables: Variables para sustituir
+            parsed: Expresión ya parseada (opcional, evita parsear de nuevo)
+            steps: Nivel de detalle de los pasos ('full', 'summary' o 'none')
         
         Returns:
             Dict con result y steps
         """
         try:
+            if steps not in STEPS_LEVELS:
+                raise ValueError(f"Nivel de pasos no soportado: {steps}")
+            
+            if parsed is None:
+                parsed = self.parse(expression)
+            
             # Detectar modo automáticamente si es necesario
             if mode == "auto":
-                mode = self._detect_mode(expression)
+                mode = self._detect_mode(expression, parsed)
             
             # Validar modo
             if mode not in self.supported_modes:
                 raise ValueError(f"Modo no soportado: {mode}")
             
+            # Sin explicaciones: solo las operaciones que producen el resultado
+            if steps != "full":
+                with stage("handler"):
+                    return self._result_only(expression, mode, variables, parsed, steps)
+            
             # Rutear al método apropiado
-            if mode == "arithmetic":
-                return self._arithmetic(expression)
-            elif mode == "algebra":
-                return self._algebra(expression)
-            elif mode == "solve":
-                return self._solve_equation(expression)
-            elif mode == "derivative":
-                return self._derivative(expression, variables)
-            elif mode == "integral":
-                return self._integral(expression, variables)
-            else:
-                raise ValueError(f"Modo no implementado: {mode}")
+            with stage("handler"):
+                if mode == "arithmetic":
+                    return self._arithmetic(expression, parsed)
+                elif mode == "algebra":
+                    return self._algebra(expression, parsed)
+                elif mode == "solve":
+                    return self._solve_equation(expression, parsed)
+                elif mode == "derivative":
+                    return self._derivative(expression, variables, parsed)
+                elif mode == "integral":
+                    return self._integral(expression, variables, parsed)
+                else:
+                    raise ValueError(f"Modo no implementado: {mode}")
         
         except Exception as e:
             logger.error(f"Error en cálculo: {str(e)}")
             raise
     
-    def _detect_mode(self, expression: str) -> str:
+    def iter_calculate(self, expression: str, mode: str = "auto", variables: Optional[Dict] = None,
+                       parsed: Optional[ParsedExpression] = None,
+                       steps: str = "full") -> Generator[Dict[str, Any], None, Dict[str, Any]]:
         """
-        Detecta automáticamente el tipo de operación
+        Variante de calculate que entrega cada paso (como dict) en cuanto existe
+        
+        Los modos simbólicos (álgebra, ecuaciones, derivadas, integrales)
+        producen sus pasos de forma incremental: la introducción llega antes
+        de que SymPy termine. La aritmética es rápida y se entrega completa.
+        
+        Returns:
+            (valor de retorno del generador) el mismo dict que calculate
         """
-        expr_lower = expression.lower()
+        if parsed is None:
+            parsed = self.parse(expression)
+        if mode == "auto":
+            mode = self._detect_mode(expression, parsed)
+        if mode not in self.supported_modes:
+            raise ValueError(f"Modo no soportado: {mode}")
+        
+        if steps != "full":
+            result = self.calculate(expression, mode, variables, parsed=parsed, steps=steps)
+            yield from result["steps"]
+            return result
+        
+        if mode == "algebra":
+            handler = self._iter_algebra(expression, parsed)
+        elif mode == "solve":
+            handler = self._iter_solve_equation(expression, parsed)
+        elif mode == "derivative":
+            handler = self._iter_derivative(expression, variables, parsed)
+        elif mode == "integral":
+            handler = self._iter_integral(expression, variables, parsed)
+        else:
+            result = self.calculate(expression, mode, variables, parsed=parsed)
+            yield from result["steps"]
+            return result
         
-        # Detectar ecuaciones (contiene =)
-        if "=" in expression:
-            return "solve"
+        produced = []
+        with stage("handler"):
+            try:
+                while True:
+                    step = next(handler).model_dump()
+                    produced.append(step)
+                    yield step
+            except StopIteration as done:
+                result = done.value
+        
+        if "steps" in result:
+            # El handler delegó en otro modo (p. ej. álgebra sin variables)
+            yield from result["steps"]
+        else:
+            result["steps"] = produced
+        return result
+    
+    def _result_only(self, expression: str, mode: str, variables: Optional[Dict],
+                     parsed: ParsedExpression, steps: str) -> Dict[str, Any]:
+        """
+        Calcula solo el resultado, con el mismo texto que la explicación completa
         
-        # Detectar derivadas
-        if any(word in expr_lower for word in ["d/dx", "derivative", "diff"]):
-            return "derivative"
+        Para clientes que descartan los pasos (autocorrectores, vista previa):
+        no se construyen explicaciones, LaTeX intermedio ni modelos Step
+        """
+        if mode == "arithmetic":
+            result = self._arithmetic_result(expression, parsed)
+        elif mode == "algebra":
+            result, mode = self._algebra_result(expression, parsed)
+        elif mode == "solve":
+            result = self._solve_result(parsed)
+        elif mode == "derivative":
+            result = self._derivative_result(expression, variables, parsed)
+        elif mode == "integral":
+            result = self._integral_result(expression, variables, parsed)
+        else:
+            raise ValueError(f"Modo no implementado: {mode}")
         
-        # Detectar integrales
-        if any(word in expr_lower for word in ["integral", "integrate"]):
-            return "integral"
+        summary = []
+        if steps == "summary":
+            summary.append(Step(
+                step=1,
+                description="✅ Resultado final",
+                expression=result,
+                expression_latex=to_latex(result) if mode == "arithmetic" else None
+            ).model_dump())
+        return {"result": result, "steps": summary, "mode": mode}
+    
+    def _arithmetic_result(self, expression: str, parsed: ParsedExpression) -> str:
+        """
+        Resultado de _arithmetic sin pasos (misma ruta: operación simple o compuesta)
+        """
+        arithmetic = parsed.arithmetic
+        expr = None
+        try:
+            if arithmetic is None:
+                expr = parsed.require_expr()
+        except Exception as e:
+            raise ValueError(f"Error en aritmética: {str(e)}")
         
-        # Detectar si hay variables (álgebra)
         try:
-            expr = sympify(expression)
-            if expr.free_symbols:
-                return "algebra"
-        except:
+            if arithmetic is not None:
+                op_type, nums = self._detect_operation_type_fast(arithmetic)
+            else:
+                op_type, nums = self._detect_operation_type(expr, expression)
+            if op_type in SIMPLE_OPERATIONS and len(nums) == 2:
+                return format_number(SIMPLE_OPERATIONS[op_type](nums[0], nums[1]))
+        except Exception:
+            # Igual que _arithmetic_detailed: si falla, usar el método compuesto
             pass
         
+        if arithmetic is not None:
+            return format_number(arithmetic.value)
+        try:
+            return format_number(expr.evalf())
+        except Exception:
+            return str(expr)
+    
+    def _algebra_result(self, expression: str, parsed: ParsedExpression):
+        """
+        Resultado de _algebra sin pasos; devuelve (resultado, modo)
+        """
+        try:
+            expr = parsed.require_expr()
+            if not expr.free_symbols:
+                return self._arithmetic_result(expression, parsed), "arithmetic"
+            expr = expand(expr)
+            with stage("simplify"):
+                expr = simplify(expr)
+            return (format_number(expr) if expr.is_number else str(expr)), "algebra"
+        except Exception as e:
+            raise ValueError(f"Error en álgebra: {str(e)}")
+    
+    def _solve_result(self, parsed: ParsedExpression) -> str:
+        """
+        Resultado de _solve_equation sin pasos
+        """
+        try:
+            left_expr, right_expr = parsed.require_sides()
+            equation = Eq(left_expr, right_expr)
+            if not equation.free_symbols:
+                raise ValueError("No se encontró ninguna variable en la ecuación")
+            var = list(equation.free_symbols)[0]
+            return self._solutions_text(var, solve(equation, var))
+        except Exception as e:
+            raise ValueError(f"Error resolviendo ecuación: {str(e)}")
+    
+    def _derivative_result(self, expression: str, variables: Optional[Dict], parsed: ParsedExpression) -> str:
+        """
+        Resultado de _derivative sin pasos
+        """
+        try:
+            expr = parsed.require_expr()
+            var = self._pick_variable(expr, variables)
+            derivative = diff(expr, var)
+            with stage("simplify"):
+                derivative = simplify(derivative)
+            return f"d/d{var}[{expr}] = {derivative}"
+        except Exception as e:
+            raise ValueError(f"Error calculando derivada: {str(e)}")
+    
+    def _integral_result(self, expression: str, variables: Optional[Dict], parsed: ParsedExpression) -> str:
+        """
+        Resultado de _integral sin pasos
+        """
+        try:
+            expr = parsed.require_expr()
+            var = self._pick_variable(expr, variables)
+            return f"∫{expr} d{var} = {integrate(expr, var)} + C"
+        except Exception as e:
+            raise ValueError(f"Error calculando integral: {str(e)}")
+    
+    def _pick_variable(self, expr, variables: Optional[Dict] = None):
+        """
+        Variable de derivación/integración: la indicada en variables['var'],
+        la primera variable libre o x por defecto
+        """
+        if variables and 'var' in variables:
+            return symbols(variables['var'])
+        if expr.free_symbols:
+            return list(expr.free_symbols)[0]
+        return symbols('x')
+    
+    def _solutions_text(self, var, solutions) -> str:
+        """
+        Texto del resultado de una ecuación según el número de soluciones
+        """
+        if not solutions:
+            return "Sin solución"
+        if len(solutions) == 1:
+            return f"{var} = {format_number(solutions[0])}"
+        return f"{var} = {{{', '.join(format_number(s) for s in solutions)}}}"
+    
+    def _collect(self, handler: Generator[Step, None, Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Ejecuta un handler generador completo y arma la respuesta con todos sus pasos
+        """
+        steps = []
+        try:
+            while True:
+                steps.append(next(handler))
+        except StopIteration as done:
+            result = done.value
+        if "steps" not in result:
+            result["steps"] = dump_steps(steps)
+        return result
+    
+    @timed("detect_mode")
+    def _detect_mode(self, expression: str, parsed: Optional[ParsedExpression] = None) -> str:
+        """
+        Detecta automáticamente el tipo de operación
+        """
+        # Detectar ecuaciones (contiene =)
+        if "=" in expression:
+            return "solve"
+        
+        # Detectar si hay variables (álgebra)
+        if parsed is None:
+            parsed = self.parse(expression)
+        if parsed.arithmetic is not None:
+            return "arithmetic"
+        if parsed.valid and parsed.expr is not None and parsed.expr.free_symbols:
+            return "algebra"
+        
         # Por defecto, aritmética
         return "arithmetic"
     
-    def _arithmetic(self, expression: str) -> Dict[str, Any]:
+    def _arithmetic(self, expression: str, parsed: Optional[ParsedExpression] = None) -> Dict[str, Any]:
         """
         Resuelve operaciones aritméticas básicas con explicaciones educativas
         """
         try:
-            # Parsear expresión
-            expr = sympify(expression)
+            # Expresión parseada en la etapa única de parseo
+            if parsed is None:
+                parsed = self.parse(expression)
+            
+            # Aritmética pura: el evaluador rápido ya tiene el resultado exacto
+            if parsed.arithmetic is not None:
+                return self._arithmetic_detailed(expression, None, parsed)
+            
+            expr = parsed.require_expr()
             
             # SIEMPRE intentar primero con explicaciones educativas detalladas
             # Si no funciona, usará el método compuesto automáticamente
@@ -183,13 +527,16 @@ class CalculatorEngine:
         except:
             return False
     
-    def _arithmetic_detailed(self, expression: str, expr) -> Dict[str, Any]:
+    def _arithmetic_detailed(self, expression: str, expr, parsed: Optional[ParsedExpression] = None) -> Dict[str, Any]:
         """
         Explicación educativa detallada para operaciones simples
         """
         try:
-            # Detectar el tipo de operación
-            op_type, nums = self._detect_operation_type(expr, expression)
+            # Detectar el tipo de operación (con el árbol del evaluador rápido si existe)
+            if parsed is not None and parsed.arithmetic is not None:
+                op_type, nums = self._detect_operation_type_fast(parsed.arithmetic)
+            else:
+                op_type, nums = self._detect_operation_type(expr, expression)
             
             # Validar que tengamos 2 números
             if op_type != "unknown" and len(nums) == 2:
@@ -205,78 +552,107 @@ class CalculatorEngine:
                     return self._explain_power(nums[0], nums[1])
             
             # Si no se puede identificar o no es una operación simple válida, usar método compuesto
-            return self._arithmetic_compound(expression, expr)
+            return self._arithmetic_compound(expression, expr, parsed)
         except Exception as e:
             # Si hay cualquier error, usar el método compuesto
-            return self._arithmetic_compound(expression, expr)
+            return self._arithmetic_compound(expression, expr, parsed)
     
-    def _arithmetic_compound(self, expression: str, expr) -> Dict[str, Any]:
+    @timed("latex")
+    def _arithmetic_latex(self, arithmetic) -> str:
+        """
+        LaTeX del resultado del evaluador rápido (equivalente a latex(parse_math(...)))
+        """
+        if arithmetic.exact:
+            return fraction_latex(arithmetic.value)
+        return format_number(arithmetic.value)
+    
+    def _arithmetic_compound(self, expression: str, expr, parsed: Optional[ParsedExpression] = None) -> Dict[str, Any]:
         """
         Explicación para operaciones compuestas (múltiples operadores)
         """
         steps = []
+        arithmetic = parsed.arithmetic if parsed is not None else None
         
         try:
+            expr_latex = self._arithmetic_latex(arithmetic) if arithmetic is not None else to_latex(expr)
+            
             # Paso 1: Expresión original con introducción
-            steps.append(Step(
-                step=1,
-                description="💡 Expresión original",
+            steps.append(step_templates.step(
+                1, "arithmetic.intro",
                 expression=expression,
-                expression_latex=to_latex(expr),
-                detail="Vamos a resolver esta expresión matemática paso a paso, siguiendo el orden correcto de operaciones."
+                expression_latex=expr_latex
             ))
             
             # Generar pasos intermedios del cálculo
-            calculation_steps = self._generate_calculation_steps(expression, expr)
+            calculation_steps = self._generate_calculation_steps(expression, expr, expr_latex, arithmetic)
             steps.extend(calculation_steps)
             
             # Paso final: Evaluar y mostrar resultado
-            result = expr.evalf()
+            result = arithmetic.value if arithmetic is not None else expr.evalf()
             result_formatted = format_number(result)
             
             # Resultado final
-            steps.append(Step(
-                step=len(steps) + 1,
-                description="✅ Resultado final",
+            steps.append(step_templates.step(
+                len(steps) + 1, "arithmetic.result",
                 expression=result_formatted,
                 expression_latex=to_latex(result_formatted),
-                detail=f"🎉 La respuesta es {result_formatted}"
+                result=result_formatted
             ))
             
             return {
                 "result": result_formatted,
-                "steps": [s.model_dump() for s in steps],
+                "steps": dump_steps(steps),
                 "mode": "arithmetic"
             }
         except Exception as e:
             # Si hay un error, devolver una respuesta básica
-            try:
-                result = expr.evalf()
-                result_formatted = format_number(result)
-            except:
-                result_formatted = str(expr)
+            if arithmetic is not None:
+                expr_latex = self._arithmetic_latex(arithmetic)
+                result_formatted = format_number(arithmetic.value)
+            else:
+                expr_latex = to_latex(expr)
+                try:
+                    result = expr.evalf()
+                    result_formatted = format_number(result)
+                except:
+                    result_formatted = str(expr)
             
             return {
                 "result": result_formatted,
                 "steps": [
-                    Step(
-                        step=1,
-                        description="Expresión",
+                    step_templates.step(
+                        1, "arithmetic.fallback",
                         expression=expression,
-                        expression_latex=to_latex(expr),
-                        detail="Calculando resultado..."
+                        expression_latex=expr_latex
                     ).model_dump(),
-                    Step(
-                        step=2,
-                        description="Resultado",
+                    step_templates.step(
+                        2, "arithmetic.fallback_result",
                         expression=result_formatted,
                         expression_latex=to_latex(result_formatted),
-                        detail=f"El resultado es: {result_formatted}"
+                        result=result_formatted
                     ).model_dump()
                 ],
                 "mode": "arithmetic"
             }
     
+    def _detect_operation_type_fast(self, arithmetic):
+        """
+        Igual que _detect_operation_type pero usando el árbol ya parseado
+        (respeta la precedencia: -2**2 no es una potencia simple)
+        """
+        operation = simple_operation(arithmetic.tree)
+        if operation is None:
+            return "unknown", []
+        op, left, right = operation
+        op_types = {
+            "/": "division",
+            "*": "multiplication",
+            "**": "power",
+            "+": "addition",
+            "-": "subtraction"
+        }
+        return op_types[op], [float(left), float(right)]
+    
     def _detect_operation_type(self, expr, expression: str):
         """
         Detecta el tipo de operación y extrae los números
@@ -364,118 +740,88 @@ class CalculatorEngine:
         
         return "unknown", []
     
-    def _generate_calculation_steps(self, expression: str, expr) -> List[Step]:
+    def _generate_calculation_steps(self, expression: str, expr, expr_latex: Optional[str] = None,
+                                    arithmetic=None) -> List[Step]:
         """
         Genera pasos intermedios para expresiones compuestas
+        
+        Con el árbol del evaluador rápido se resuelve una operación por paso
+        (PEMDAS); para expresiones que solo entiende SymPy se da un paso general.
         """
         steps = []
-        current_expr = expression
         step_num = 2
         
         try:
+            if expr_latex is None:
+                expr_latex = to_latex(expr)
+            
             # Paso 2: Explicar PEMDAS
-            steps.append(Step(
-                step=step_num,
-                description="📋 Orden de operaciones (PEMDAS)",
-                expression=current_expr,
-                expression_latex=to_latex(expr),
-                detail="Seguimos el orden PEMDAS:\n\n1️⃣ Paréntesis\n2️⃣ Exponentes\n3️⃣ Multiplicación/División (izquierda a derecha)\n4️⃣ Suma/Resta (izquierda a derecha)"
+            steps.append(step_templates.step(
+                step_num, "arithmetic.pemdas",
+                expression=expression,
+                expression_latex=expr_latex
             ))
             step_num += 1
             
-            # Procesar paréntesis primero
-            parentheses_processed = self._process_parentheses(current_expr)
-            if parentheses_processed != current_expr:
-                steps.append(Step(
-                    step=step_num,
-                    description="🔧 Resolver paréntesis",
-                    expression=parentheses_processed,
-                    expression_latex=to_latex(sympify(parentheses_processed)),
-                    detail="Resolvemos las operaciones dentro de los paréntesis primero."
+            if arithmetic is None:
+                steps.append(step_templates.step(
+                    step_num, "arithmetic.step_by_step",
+                    expression=expression,
+                    expression_latex=expr_latex
                 ))
-                current_expr = parentheses_processed
-                step_num += 1
+                return steps
             
-            # Procesar multiplicaciones y divisiones
-            md_processed = self._process_multiplication_division(current_expr)
-            if md_processed != current_expr:
-                steps.append(Step(
-                    step=step_num,
-                    description="✖️ Resolver multiplicación/división",
-                    expression=md_processed,
-                    expression_latex=to_latex(sympify(md_processed)),
-                    detail="Resolvemos multiplicaciones y divisiones de izquierda a derecha."
-                ))
-                current_expr = md_processed
+            latex_formatter = fraction_latex if arithmetic.exact else format_number
+            reductions = reduce_steps(arithmetic.tree, format_number, latex_formatter)
+            for reduction in reductions:
+                if len(steps) > MAX_REDUCTION_STEPS:
+                    # Expresiones enormes: resumir el resto en un solo paso
+                    steps.append(step_templates.step(
+                        step_num, "arithmetic.remaining",
+                        expression=format_number(arithmetic.value),
+                        expression_latex=self._arithmetic_latex(arithmetic)
+                    ))
+                    break
+                steps.append(self._reduction_step(step_num, reduction))
                 step_num += 1
-            
-            # Procesar sumas y restas
-            as_processed = self._process_addition_subtraction(current_expr)
-            if as_processed != current_expr:
-                steps.append(Step(
-                    step=step_num,
-                    description="➕ Resolver suma/resta",
-                    expression=as_processed,
-                    expression_latex=to_latex(sympify(as_processed)),
-                    detail="Resolvemos sumas y restas de izquierda a derecha."
-                ))
-                current_expr = as_processed
-                step_num += 1
-            
+        
         except Exception as e:
             # Si hay error, agregar paso genérico
-            steps.append(Step(
-                step=step_num,
-                description="✏️ Resolver paso a paso",
+            steps.append(step_templates.step(
+                step_num, "arithmetic.step_by_step",
                 expression=expression,
-                expression_latex=to_latex(expr),
-                detail="Aplicamos el orden PEMDAS para resolver la expresión."
+                expression_latex=expr_latex if expr_latex is not None else to_latex(expr)
             ))
         
         return steps
     
-    def _process_parentheses(self, expression: str) -> str:
-        """
-        Procesa las operaciones dentro de paréntesis
-        """
-        import re
-        
-        # Buscar paréntesis simples (sin anidamiento)
-        pattern = r'\(([^()]+)\)'
-        
-        def replace_parentheses(match):
-            inner_expr = match.group(1)
-            try:
-                # Usar sympify para evaluación más segura
-                result = sympify(inner_expr)
-                # Si es un número, devolverlo formateado
-                if result.is_number:
-                    return format_number(float(result))
-                else:
-                    return str(result)
-            except:
-                return match.group(0)  # Si no se puede evaluar, mantener original
-        
-        # Aplicar reemplazo
-        processed = re.sub(pattern, replace_parentheses, expression)
-        
-        return processed
-    
-    def _process_multiplication_division(self, expression: str) -> str:
-        """
-        Procesa multiplicaciones y divisiones de izquierda a derecha
+    def _reduction_step(self, step_num: int, reduction) -> Step:
         """
-        # Esta es una implementación simplificada
-        # En una versión más completa, se procesarían paso a paso
-        return expression
-    
-    def _process_addition_subtraction(self, expression: str) -> str:
+        Paso explicativo para una operación resuelta por el reductor PEMDAS
         """
-        Procesa sumas y restas de izquierda a derecha
-        """
-        # Esta es una implementación simplificada
-        # En una versión más completa, se procesarían paso a paso
-        return expression
+        left = format_number(reduction.left)
+        right = format_number(reduction.right)
+        result = format_number(reduction.result)
+        
+        if reduction.in_parentheses:
+            template_id = "arithmetic.parentheses"
+        elif reduction.op == "**":
+            template_id = "arithmetic.power"
+        elif reduction.op in ("*", "/"):
+            template_id = "arithmetic.multiplication_division"
+        else:
+            template_id = "arithmetic.addition_subtraction"
+        
+        symbol = OPERATION_SYMBOLS[reduction.op]
+        if reduction.right < 0:
+            right = f"({right})"
+        
+        return step_templates.step(
+            step_num, template_id,
+            expression=reduction.expression,
+            expression_latex=reduction.expression_latex,
+            operation=f"{left} {symbol} {right} = {result}"
+        )
     
     def _explain_division(self, dividend: float, divisor: float) -> Dict[str, Any]:
         """
@@ -487,36 +833,31 @@ class CalculatorEngine:
         dividend_int = int(dividend) if dividend == int(dividend) else dividend
         divisor_int = int(divisor) if divisor == int(divisor) else divisor
         
-        # Crear expresión SymPy para LaTeX
-        div_expr = sympify(f"{dividend_int}/{divisor_int}")
+        # LaTeX de la división (para enteros sin pasar por SymPy)
+        if isinstance(dividend_int, int) and isinstance(divisor_int, int):
+            div_latex = fraction_latex(Fraction(dividend_int, divisor_int))
+        else:
+            div_latex = to_latex(parse_math(f"{dividend_int}/{divisor_int}"))
         
         # Paso 1: Introducción conceptual
-        steps.append(Step(
-            step=1,
-            description="💡 ¿Qué significa dividir?",
+        steps.append(step_templates.step(
+            1, "division.meaning",
             expression=f"{dividend_int} ÷ {divisor_int}",
-            expression_latex=to_latex(div_expr),
-            detail="Dividir es repartir en partes iguales.\n\nPor ejemplo:\nSi tienes {} {} y los quieres repartir entre {} {}, la división te dice cuánto le toca a cada uno.".format(
-                dividend_int,
-                "caramelos" if dividend_int != 1 else "caramelo",
-                divisor_int,
-                "amigos" if divisor_int != 1 else "amigo"
-            )
+            expression_latex=div_latex,
+            dividend=dividend_int,
+            items="caramelos" if dividend_int != 1 else "caramelo",
+            divisor=divisor_int,
+            people="amigos" if divisor_int != 1 else "amigo"
         ))
         
         # Paso 2: Plantear la pregunta
-        steps.append(Step(
-            step=2,
-            description="✏️ ¿Qué es {} ÷ {}?".format(dividend_int, divisor_int),
+        steps.append(step_templates.step(
+            2, "division.question",
             expression=f"{dividend_int} ÷ {divisor_int}",
-            expression_latex=to_latex(div_expr),
-            detail="Eso quiere decir:\n¿Cuántas veces cabe el {} en el {}?\nO: ¿Cuánto le toca a cada uno si repartimos {} entre {} {}?".format(
-                divisor_int,
-                dividend_int,
-                dividend_int,
-                divisor_int,
-                "personas" if divisor_int > 1 else "persona"
-            )
+            expression_latex=div_latex,
+            dividend=dividend_int,
+            divisor=divisor_int,
+            people="personas" if divisor_int > 1 else "persona"
         ))
         
         # Calcular resultado
@@ -530,56 +871,46 @@ class CalculatorEngine:
             steps.extend(self._explain_long_division(int(dividend_int), int(divisor_int)))
         else:
             # División simple
-            result_expr = sympify(f"Eq({dividend_int}/{divisor_int}, {result_int})")
-            steps.append(Step(
-                step=3,
-                description="🔢 Resolver la división",
+            steps.append(step_templates.step(
+                3, "division.solve",
                 expression=f"{dividend_int} ÷ {divisor_int} = {result_int}",
                 expression_latex=f"\\frac{{{dividend_int}}}{{{divisor_int}}} = {result_int}",
-                detail="Para resolver esta división, pensamos:\n¿Cuántas veces cabe el {} en {}?\n👉 Cabe {} veces{}".format(
-                    divisor_int,
-                    dividend_int,
-                    result_int,
-                    f", porque {divisor_int} × {result_int} = {dividend_int}" if remainder == 0 else f" y sobra {int(remainder)}"
-                )
+                divisor=divisor_int,
+                dividend=dividend_int,
+                result=result_int,
+                reason=f", porque {divisor_int} × {result_int} = {dividend_int}" if remainder == 0 else f" y sobra {int(remainder)}"
             ))
         
         # Paso 4: Verificación
         if remainder == 0:
             verify_expr = f"{divisor_int} \\times {result_int} = {dividend_int}"
-            steps.append(Step(
-                step=len(steps) + 1,
-                description="✓ Verificar el resultado",
+            steps.append(step_templates.step(
+                len(steps) + 1, "division.verify",
                 expression=f"{divisor_int} × {result_int} = {dividend_int}",
                 expression_latex=verify_expr,
-                detail="Podemos verificar multiplicando: {} × {} = {}. ¡Correcto! ✓".format(
-                    divisor_int,
-                    result_int,
-                    dividend_int
-                )
+                divisor=divisor_int,
+                result=result_int,
+                dividend=dividend_int
             ))
         
         # Paso final: Resultado con contexto
         final_latex = f"\\frac{{{dividend_int}}}{{{divisor_int}}} = {result_int}"
-        steps.append(Step(
-            step=len(steps) + 1,
-            description="✅ Resultado final",
+        steps.append(step_templates.step(
+            len(steps) + 1, "division.result",
             expression=f"{dividend_int} ÷ {divisor_int} = {result_int}",
             expression_latex=final_latex,
-            detail="🎉 Entonces, {} ÷ {} = {}\n\n{}".format(
-                dividend_int,
-                divisor_int,
+            dividend=dividend_int,
+            divisor=divisor_int,
+            result=result_int,
+            context="Cada uno recibe {} {} si los repartimos en partes iguales.".format(
                 result_int,
-                "Cada uno recibe {} {} si los repartimos en partes iguales.".format(
-                    result_int,
-                    "caramelos" if result_int != 1 else "caramelo"
-                ) if remainder == 0 else "El resultado es {} con un residuo de {}.".format(result_int, int(remainder))
-            )
+                "caramelos" if result_int != 1 else "caramelo"
+            ) if remainder == 0 else "El resultado es {} con un residuo de {}.".format(result_int, int(remainder))
         ))
         
         return {
             "result": format_number(result),
-            "steps": [s.model_dump() for s in steps],
+            "steps": dump_steps(steps),
             "mode": "arithmetic"
         }
     
@@ -593,11 +924,9 @@ class CalculatorEngine:
         current = 0
         position = 0
         
-        steps.append(Step(
-            step=3,
-            description="✅ Paso a paso con división larga",
-            expression=f"{dividend} ÷ {divisor}",
-            detail="Vamos a dividir usando una técnica fácil llamada división larga."
+        steps.append(step_templates.step(
+            3, "division.long",
+            expression=f"{dividend} ÷ {divisor}"
         ))
         
         step_details = []
@@ -665,49 +994,39 @@ class CalculatorEngine:
         result_int = int(result) if result == int(result) else result
         
         # Introducción
-        steps.append(Step(
-            step=1,
-            description="💡 ¿Qué significa multiplicar?",
+        steps.append(step_templates.step(
+            1, "multiplication.meaning",
             expression=f"{num1_int} × {num2_int}",
-            detail="Multiplicar es sumar un número varias veces.\n\nPor ejemplo:\n{} × {} significa sumar {} veces el número {}.".format(
-                num1_int, num2_int, num2_int, num1_int
-            )
+            a=num1_int, b=num2_int
         ))
         
         # Explicación visual (si los números son pequeños)
         if num1_int <= 12 and num2_int <= 12:
             sum_representation = " + ".join([str(num1_int)] * int(num2_int)) if num2_int <= 5 else f"{num1_int} (sumado {num2_int} veces)"
-            steps.append(Step(
-                step=2,
-                description="✏️ Representar como suma",
+            steps.append(step_templates.step(
+                2, "multiplication.as_sum",
                 expression=sum_representation if num2_int <= 5 else f"{num1_int} × {num2_int}",
-                detail="Podemos pensar en esto como:\n{} = {}".format(
-                    sum_representation if num2_int <= 5 else f"{num1_int} + {num1_int} + ... ({num2_int} veces)",
-                    result_int
-                )
+                sum=sum_representation if num2_int <= 5 else f"{num1_int} + {num1_int} + ... ({num2_int} veces)",
+                result=result_int
             ))
         
         # Resultado
-        steps.append(Step(
-            step=len(steps) + 1,
-            description="🔢 Calcular el producto",
+        steps.append(step_templates.step(
+            len(steps) + 1, "multiplication.product",
             expression=f"{num1_int} × {num2_int} = {result_int}",
-            detail="Multiplicamos: {} × {} = {}".format(num1_int, num2_int, result_int)
+            a=num1_int, b=num2_int, result=result_int
         ))
         
         # Resultado final
-        steps.append(Step(
-            step=len(steps) + 1,
-            description="✅ Resultado final",
+        steps.append(step_templates.step(
+            len(steps) + 1, "multiplication.result",
             expression=str(result_int),
-            detail="🎉 Entonces, {} × {} = {}\n\nSi tienes {} grupos de {} elementos, en total tienes {} elementos.".format(
-                num1_int, num2_int, result_int, num2_int, num1_int, result_int
-            )
+            a=num1_int, b=num2_int, result=result_int
         ))
         
         return {
             "result": format_number(result),
-            "steps": [s.model_dump() for s in steps],
+            "steps": dump_steps(steps),
             "mode": "arithmetic"
         }
     
@@ -723,36 +1042,29 @@ class CalculatorEngine:
         result_int = int(result) if result == int(result) else result
         
         # Introducción
-        steps.append(Step(
-            step=1,
-            description="💡 ¿Qué significa sumar?",
+        steps.append(step_templates.step(
+            1, "addition.meaning",
             expression=f"{num1_int} + {num2_int}",
-            detail="Sumar es juntar o combinar cantidades.\n\nPor ejemplo:\nSi tienes {} manzanas y consigues {} más, ¿cuántas manzanas tienes en total?".format(
-                num1_int, num2_int
-            )
+            a=num1_int, b=num2_int
         ))
         
         # Proceso
-        steps.append(Step(
-            step=2,
-            description="✏️ Sumar los números",
+        steps.append(step_templates.step(
+            2, "addition.sum",
             expression=f"{num1_int} + {num2_int} = {result_int}",
-            detail="Juntamos las dos cantidades:\n{} + {} = {}".format(num1_int, num2_int, result_int)
+            a=num1_int, b=num2_int, result=result_int
         ))
         
         # Resultado final
-        steps.append(Step(
-            step=3,
-            description="✅ Resultado final",
+        steps.append(step_templates.step(
+            3, "addition.result",
             expression=str(result_int),
-            detail="🎉 Entonces, {} + {} = {}\n\nEn total tienes {} elementos.".format(
-                num1_int, num2_int, result_int, result_int
-            )
+            a=num1_int, b=num2_int, result=result_int
         ))
         
         return {
             "result": format_number(result),
-            "steps": [s.model_dump() for s in steps],
+            "steps": dump_steps(steps),
             "mode": "arithmetic"
         }
     
@@ -768,37 +1080,30 @@ class CalculatorEngine:
         result_int = int(result) if result == int(result) else result
         
         # Introducción
-        steps.append(Step(
-            step=1,
-            description="💡 ¿Qué significa restar?",
+        steps.append(step_templates.step(
+            1, "subtraction.meaning",
             expression=f"{num1_int} - {num2_int}",
-            detail="Restar es quitar o encontrar la diferencia entre dos cantidades.\n\nPor ejemplo:\nSi tienes {} galletas y comes {}, ¿cuántas galletas te quedan?".format(
-                num1_int, num2_int
-            )
+            a=num1_int, b=num2_int
         ))
         
         # Proceso
-        steps.append(Step(
-            step=2,
-            description="✏️ Restar los números",
+        steps.append(step_templates.step(
+            2, "subtraction.difference",
             expression=f"{num1_int} - {num2_int} = {result_int}",
-            detail="Quitamos la segunda cantidad de la primera:\n{} - {} = {}".format(num1_int, num2_int, result_int)
+            a=num1_int, b=num2_int, result=result_int
         ))
         
         # Resultado final
-        steps.append(Step(
-            step=3,
-            description="✅ Resultado final",
+        steps.append(step_templates.step(
+            3, "subtraction.result",
             expression=str(result_int),
-            detail="🎉 Entonces, {} - {} = {}\n\n{}".format(
-                num1_int, num2_int, result_int,
-                f"Te quedan {result_int} elementos." if result_int >= 0 else f"El resultado es negativo: {result_int}"
-            )
+            a=num1_int, b=num2_int, result=result_int,
+            context=f"Te quedan {result_int} elementos." if result_int >= 0 else f"El resultado es negativo: {result_int}"
         ))
         
         return {
             "result": format_number(result),
-            "steps": [s.model_dump() for s in steps],
+            "steps": dump_steps(steps),
             "mode": "arithmetic"
         }
     
@@ -810,113 +1115,106 @@ class CalculatorEngine:
         
         base_int = int(base) if base == int(base) else base
         exp_int = int(exponent) if exponent == int(exponent) else exponent
-        result = base ** exponent
-        result_int = int(result) if result == int(result) else result
+        # Potencia exacta y acotada (MAX_POWER_BITS): con floats 3**40 perdía
+        # las últimas cifras y un exponente enorme no tenía límite
+        result = power(Fraction(base), Fraction(exponent))
+        if result is None:
+            if exponent == int(exponent):
+                # Demasiado grande: el llamador recurre al método compuesto
+                raise ValueError("Potencia demasiado grande para explicarla")
+            result = base ** exponent
+        result_int = format_number(result)
         
         # Introducción
-        steps.append(Step(
-            step=1,
-            description="💡 ¿Qué significa una potencia?",
+        steps.append(step_templates.step(
+            1, "power.meaning",
             expression=f"{base_int}^{exp_int}",
             expression_latex=f"{base_int}^{{{exp_int}}}",
-            detail="Una potencia significa multiplicar un número por sí mismo varias veces.\n\n{}^{} significa multiplicar {} por sí mismo {} veces.".format(
-                base_int, exp_int, base_int, exp_int
-            )
+            base=base_int, exponent=exp_int
         ))
         
         # Explicación visual (si el exponente es pequeño)
         if exp_int <= 5 and exp_int == int(exp_int) and exp_int > 0:
             mult_representation = " × ".join([str(base_int)] * int(exp_int))
             mult_latex = " \\times ".join([str(base_int)] * int(exp_int))
-            steps.append(Step(
-                step=2,
-                description="✏️ Representar como multiplicación",
+            steps.append(step_templates.step(
+                2, "power.as_product",
                 expression=mult_representation,
                 expression_latex=mult_latex,
-                detail="Podemos escribir esto como:\n{}^{} = {}".format(
-                    base_int, exp_int, mult_representation
-                )
+                base=base_int, exponent=exp_int, product=mult_representation
             ))
         
         # Resultado
-        steps.append(Step(
-            step=len(steps) + 1,
-            description="🔢 Calcular la potencia",
+        steps.append(step_templates.step(
+            len(steps) + 1, "power.compute",
             expression=f"{base_int}^{exp_int} = {result_int}",
             expression_latex=f"{base_int}^{{{exp_int}}} = {result_int}",
-            detail="Calculamos: {}^{} = {}".format(base_int, exp_int, result_int)
+            base=base_int, exponent=exp_int, result=result_int
         ))
         
         # Resultado final
-        steps.append(Step(
-            step=len(steps) + 1,
-            description="✅ Resultado final",
+        steps.append(step_templates.step(
+            len(steps) + 1, "power.result",
             expression=str(result_int),
             expression_latex=str(result_int),
-            detail="🎉 Entonces, {}^{} = {}".format(base_int, exp_int, result_int)
+            base=base_int, exponent=exp_int, result=result_int
         ))
         
         return {
             "result": format_number(result),
-            "steps": [s.model_dump() for s in steps],
+            "steps": dump_steps(steps),
             "mode": "arithmetic"
         }
     
-    def _algebra(self, expression: str) -> Dict[str, Any]:
+    def _algebra(self, expression: str, parsed: Optional[ParsedExpression] = None) -> Dict[str, Any]:
+        return self._collect(self._iter_algebra(expression, parsed))
+    
+    def _iter_algebra(self, expression: str, parsed: Optional[ParsedExpression] = None) -> Iterator[Step]:
         """
         Simplifica y expande expresiones algebraicas con explicaciones educativas
         """
         steps = []
         
         try:
-            expr = sympify(expression)
+            if parsed is None:
+                parsed = self.parse(expression)
+            expr = parsed.require_expr()
             
             # Identificar variables
             variables = list(expr.free_symbols)
             
             # Si no hay variables, es aritmética pura - redirigir
             if not variables:
-                return self._arithmetic(expression)
+                return self._arithmetic(expression, parsed)
             
             # Paso 1: Introducción a álgebra
-            steps.append(Step(
-                step=1,
-                description="💡 ¿Qué es una expresión algebraica?",
-                expression=expression,
-                detail="Una expresión algebraica usa letras (variables) para representar números desconocidos.\n\nPor ejemplo: En '2x + 3', la 'x' puede valer cualquier número.\n\nVamos a simplificar esta expresión paso a paso."
-            ))
+            steps.append(step_templates.step(1, "algebra.intro", expression=expression))
+            yield steps[-1]
             
             if variables:
                 var_names = ", ".join(str(v) for v in variables)
-                steps.append(Step(
-                    step=2,
-                    description="📝 Identificar variables",
+                steps.append(step_templates.step(
+                    2, "algebra.variables",
                     expression=expression,
-                    detail=f"Las variables en esta expresión son: {var_names}\n\nEstas letras representan números que aún no conocemos."
+                    variables=var_names
                 ))
+                yield steps[-1]
             
             # Paso: Expandir
             expanded = expand(expr)
             if expanded != expr:
                 expanded_str = format_number(expanded) if expanded.is_number else str(expanded)
-                steps.append(Step(
-                    step=len(steps) + 1,
-                    description="✏️ Expandir expresión",
-                    expression=expanded_str,
-                    detail="Aplicamos la propiedad distributiva:\na(b + c) = ab + ac\n\nMultiplicamos cada término dentro de los paréntesis."
-                ))
+                steps.append(step_templates.step(len(steps) + 1, "algebra.expand", expression=expanded_str))
+                yield steps[-1]
                 expr = expanded
             
             # Paso: Simplificar
-            simplified = simplify(expr)
+            with stage("simplify"):
+                simplified = simplify(expr)
             if simplified != expr:
                 simplified_str = format_number(simplified) if simplified.is_number else str(simplified)
-                steps.append(Step(
-                    step=len(steps) + 1,
-                    description="🔢 Simplificar y combinar términos",
-                    expression=simplified_str,
-                    detail="Combinamos los términos semejantes (términos con las mismas variables y exponentes).\n\nPor ejemplo: 2x + 3x = 5x"
-                ))
+                steps.append(step_templates.step(len(steps) + 1, "algebra.simplify", expression=simplified_str))
+                yield steps[-1]
                 expr = simplified
             
             # Paso final: Resultado
@@ -926,60 +1224,51 @@ class CalculatorEngine:
                 result_str = format_number(expr)
             
             if len(steps) <= 2:
-                steps.append(Step(
-                    step=len(steps) + 1,
-                    description="✅ Expresión simplificada",
-                    expression=result_str,
-                    detail="Esta expresión ya está en su forma más simple. No necesita más simplificación."
-                ))
+                steps.append(step_templates.step(len(steps) + 1, "algebra.already_simple", expression=result_str))
+                yield steps[-1]
             else:
-                steps.append(Step(
-                    step=len(steps) + 1,
-                    description="✅ Resultado final",
+                steps.append(step_templates.step(
+                    len(steps) + 1, "algebra.result",
                     expression=result_str,
-                    detail=f"🎉 La expresión simplificada es: {result_str}\n\nEsta es la forma más sencilla de escribir la expresión original."
+                    result=result_str
                 ))
+                yield steps[-1]
             
             return {
                 "result": result_str,
-                "steps": [s.model_dump() for s in steps],
                 "mode": "algebra"
             }
         
         except Exception as e:
             raise ValueError(f"Error en álgebra: {str(e)}")
     
-    def _solve_equation(self, expression: str) -> Dict[str, Any]:
+    def _solve_equation(self, expression: str, parsed: Optional[ParsedExpression] = None) -> Dict[str, Any]:
+        return self._collect(self._iter_solve_equation(expression, parsed))
+    
+    def _iter_solve_equation(self, expression: str, parsed: Optional[ParsedExpression] = None) -> Iterator[Step]:
         """
         Resuelve ecuaciones con explicaciones educativas detalladas
         """
         steps = []
         
         # Paso 1: Introducción a ecuaciones
-        steps.append(Step(
-            step=1,
-            description="💡 ¿Qué es una ecuación?",
-            expression=expression,
-            detail="Una ecuación es como una balanza en equilibrio.\n\nEl signo '=' dice que ambos lados valen lo mismo.\n\nNuestra meta es encontrar el valor de la incógnita (variable) que hace que la ecuación sea verdadera."
-        ))
+        steps.append(step_templates.step(1, "solve.intro", expression=expression))
+        yield steps[-1]
         
         try:
-            # Separar por el signo =
-            if "=" not in expression:
-                raise ValueError("La expresión debe contener un signo '='")
-            
-            left, right = expression.split("=")
-            left_expr = sympify(left.strip())
-            right_expr = sympify(right.strip())
+            # Los dos lados ya vienen parseados de la etapa de parseo
+            if parsed is None:
+                parsed = self.parse(expression)
+            left_expr, right_expr = parsed.require_sides()
             
             # Paso 2: Crear ecuación
             equation = Eq(left_expr, right_expr)
-            steps.append(Step(
-                step=2,
-                description="📋 Los dos lados de la ecuación",
+            steps.append(step_templates.step(
+                2, "solve.sides",
                 expression=f"{left_expr} = {right_expr}",
-                detail=f"Lado izquierdo: {left_expr}\nLado derecho: {right_expr}\n\nAmbos lados deben ser iguales."
+                left=left_expr, right=right_expr
             ))
+            yield steps[-1]
             
             # Paso 3: Identificar variable
             free_vars = equation.free_symbols
@@ -987,211 +1276,163 @@ class CalculatorEngine:
                 raise ValueError("No se encontró ninguna variable en la ecuación")
             
             var = list(free_vars)[0]  # Tomar la primera variable
-            steps.append(Step(
-                step=3,
-                description=f"🔍 Identificar la incógnita",
-                expression=str(equation),
-                detail=f"La variable que debemos encontrar es '{var}'.\n\nVamos a despejar '{var}' para encontrar su valor."
-            ))
+            steps.append(step_templates.step(3, "solve.unknown", expression=str(equation), var=var))
+            yield steps[-1]
             
             # Paso 4: Proceso de resolución
-            steps.append(Step(
-                step=4,
-                description="✏️ Resolver la ecuación",
-                expression=str(equation),
-                detail="Para resolver, aplicamos operaciones a ambos lados de la ecuación:\n\n• Si sumamos/restamos algo, lo hacemos en ambos lados\n• Si multiplicamos/dividimos, lo hacemos en ambos lados\n• Así mantenemos el equilibrio de la balanza"
-            ))
+            steps.append(step_templates.step(4, "solve.method", expression=str(equation)))
+            yield steps[-1]
             
             # Paso 5: Resolver
             solutions = solve(equation, var)
             
             # Paso 6: Presentar solución
+            result_str = self._solutions_text(var, solutions)
             if not solutions:
-                result_str = "Sin solución"
-                detail = "❌ Esta ecuación no tiene soluciones reales.\n\nEsto significa que no existe ningún valor de {} que haga verdadera la ecuación.".format(var)
+                template_id, params = "solve.no_solution", {"var": var}
             elif len(solutions) == 1:
                 sol_formatted = format_number(solutions[0])
-                result_str = f"{var} = {sol_formatted}"
                 
                 # Verificar la solución
                 verification = left_expr.subs(var, solutions[0])
-                steps.append(Step(
-                    step=5,
-                    description="✓ Verificar la solución",
+                steps.append(step_templates.step(
+                    5, "solve.verify",
                     expression=f"{var} = {sol_formatted}",
-                    detail=f"Vamos a comprobar que la solución es correcta.\n\nSustituimos {var} = {sol_formatted} en la ecuación original:\n{left_expr.subs(var, solutions[0])} = {right_expr}\n\n¡Es correcto! ✓"
+                    var=var, solution=sol_formatted, check=verification, right=right_expr
                 ))
+                yield steps[-1]
                 
-                detail = f"La solución es {var} = {sol_formatted}"
+                template_id, params = "solve.single", {"var": var, "solution": sol_formatted}
             else:
                 sols_formatted = [format_number(s) for s in solutions]
-                result_str = f"{var} = {{{', '.join(sols_formatted)}}}"
-                detail = f"Esta ecuación tiene múltiples soluciones:\n{var} = {' o '.join(sols_formatted)}\n\nCualquiera de estos valores hace verdadera la ecuación."
+                template_id, params = "solve.multiple", {"var": var, "solutions": " o ".join(sols_formatted)}
             
-            steps.append(Step(
-                step=len(steps) + 1,
-                description="✅ Resultado final",
-                expression=result_str,
-                detail=f"🎉 {detail}"
-            ))
+            steps.append(step_templates.step(len(steps) + 1, template_id, expression=result_str, **params))
+            yield steps[-1]
             
             return {
                 "result": result_str,
-                "steps": [s.model_dump() for s in steps],
                 "mode": "solve"
             }
         
         except Exception as e:
             raise ValueError(f"Error resolviendo ecuación: {str(e)}")
     
-    def _derivative(self, expression: str, variables: Optional[Dict] = None) -> Dict[str, Any]:
+    def _derivative(self, expression: str, variables: Optional[Dict] = None,
+                    parsed: Optional[ParsedExpression] = None) -> Dict[str, Any]:
+        return self._collect(self._iter_derivative(expression, variables, parsed))
+    
+    def _iter_derivative(self, expression: str, variables: Optional[Dict] = None,
+                         parsed: Optional[ParsedExpression] = None) -> Iterator[Step]:
         """
         Calcula derivadas con explicaciones educativas
         """
         steps = []
         
         # Paso 1: Introducción a derivadas
-        steps.append(Step(
-            step=1,
-            description="💡 ¿Qué es una derivada?",
-            expression=expression,
-            detail="La derivada nos dice qué tan rápido cambia algo.\n\nPor ejemplo:\n• La velocidad es la derivada de la posición (qué tan rápido cambia tu ubicación)\n• La aceleración es la derivada de la velocidad\n\nVamos a calcular la derivada de esta función."
-        ))
+        steps.append(step_templates.step(1, "derivative.intro", expression=expression))
+        yield steps[-1]
         
         try:
-            expr = sympify(expression)
+            expr = (parsed or self.parse(expression)).require_expr()
             
-            # Determinar variable
-            var = symbols('x')  # Por defecto x
-            if variables and 'var' in variables:
-                var = symbols(variables['var'])
-            elif expr.free_symbols:
-                var = list(expr.free_symbols)[0]
+            # Determinar variable (por defecto x)
+            var = self._pick_variable(expr, variables)
             
-            steps.append(Step(
-                step=2,
-                description=f"📝 Variable de derivación",
-                expression=str(expr),
-                detail=f"Vamos a derivar con respecto a '{var}'.\n\nEsto significa que veremos cómo cambia la función cuando {var} cambia."
-            ))
+            steps.append(step_templates.step(2, "derivative.variable", expression=str(expr), var=var))
+            yield steps[-1]
             
             # Identificar el tipo de función
-            func_type = self._identify_function_type(expr, var)
-            steps.append(Step(
-                step=3,
-                description="🔍 Identificar tipo de función",
-                expression=str(expr),
-                detail=func_type
-            ))
+            func_type, params = self._identify_function_type(expr, var)
+            steps.append(step_templates.step(3, func_type, expression=str(expr), **params))
+            yield steps[-1]
             
             # Calcular derivada
             derivative = diff(expr, var)
             
-            steps.append(Step(
-                step=4,
-                description="✏️ Aplicar reglas de derivación",
-                expression=str(derivative),
-                detail=self._explain_derivative_rule(expr, var)
+            steps.append(step_templates.step(
+                4, self._explain_derivative_rule(expr, var),
+                expression=str(derivative)
             ))
+            yield steps[-1]
             
             # Simplificar si es posible
-            simplified = simplify(derivative)
+            with stage("simplify"):
+                simplified = simplify(derivative)
             if simplified != derivative:
-                steps.append(Step(
-                    step=5,
-                    description="🔢 Simplificar",
-                    expression=str(simplified),
-                    detail="Simplificamos la expresión para obtener la forma más clara."
-                ))
+                steps.append(step_templates.step(5, "derivative.simplify", expression=str(simplified)))
+                yield steps[-1]
                 derivative = simplified
             
             # Resultado final
-            steps.append(Step(
-                step=len(steps) + 1,
-                description="✅ Resultado final",
+            steps.append(step_templates.step(
+                len(steps) + 1, "derivative.result",
                 expression=f"d/d{var}[{expr}] = {derivative}",
-                detail=f"🎉 La derivada es: {derivative}\n\nEsta función nos dice la tasa de cambio instantánea."
+                result=derivative
             ))
+            yield steps[-1]
             
             return {
                 "result": f"d/d{var}[{expr}] = {derivative}",
-                "steps": [s.model_dump() for s in steps],
                 "mode": "derivative"
             }
         
         except Exception as e:
             raise ValueError(f"Error calculando derivada: {str(e)}")
     
-    def _integral(self, expression: str, variables: Optional[Dict] = None) -> Dict[str, Any]:
+    def _integral(self, expression: str, variables: Optional[Dict] = None,
+                  parsed: Optional[ParsedExpression] = None) -> Dict[str, Any]:
+        return self._collect(self._iter_integral(expression, variables, parsed))
+    
+    def _iter_integral(self, expression: str, variables: Optional[Dict] = None,
+                       parsed: Optional[ParsedExpression] = None) -> Iterator[Step]:
         """
         Calcula integrales con explicaciones educativas
         """
         steps = []
         
         # Paso 1: Introducción a integrales
-        steps.append(Step(
-            step=1,
-            description="💡 ¿Qué es una integral?",
-            expression=expression,
-            detail="La integral es lo opuesto de la derivada.\n\nPodemos pensar en ella como:\n• Encontrar el área bajo una curva\n• Sumar infinitos pedacitos pequeños\n• Revertir el proceso de derivación\n\nVamos a calcular la integral de esta función."
-        ))
+        steps.append(step_templates.step(1, "integral.intro", expression=expression))
+        yield steps[-1]
         
         try:
-            expr = sympify(expression)
+            expr = (parsed or self.parse(expression)).require_expr()
             
             # Determinar variable
-            var = symbols('x')
-            if variables and 'var' in variables:
-                var = symbols(variables['var'])
-            elif expr.free_symbols:
-                var = list(expr.free_symbols)[0]
+            var = self._pick_variable(expr, variables)
             
-            steps.append(Step(
-                step=2,
-                description=f"📝 Variable de integración",
-                expression=str(expr),
-                detail=f"Vamos a integrar con respecto a '{var}'.\n\nEsto significa que estamos 'sumando' o 'acumulando' valores a medida que {var} cambia."
-            ))
+            steps.append(step_templates.step(2, "integral.variable", expression=str(expr), var=var))
+            yield steps[-1]
             
             # Identificar el tipo de función
-            func_type = self._identify_function_type(expr, var)
-            steps.append(Step(
-                step=3,
-                description="🔍 Identificar tipo de función",
-                expression=str(expr),
-                detail=func_type
-            ))
+            func_type, params = self._identify_function_type(expr, var)
+            steps.append(step_templates.step(3, func_type, expression=str(expr), **params))
+            yield steps[-1]
             
             # Calcular integral
             integral_result = integrate(expr, var)
             
-            steps.append(Step(
-                step=4,
-                description="✏️ Aplicar reglas de integración",
-                expression=str(integral_result),
-                detail=self._explain_integration_rule(expr, var)
+            steps.append(step_templates.step(
+                4, self._explain_integration_rule(expr, var),
+                expression=str(integral_result)
             ))
+            yield steps[-1]
             
             # Añadir constante
             result_str = f"{integral_result} + C"
-            steps.append(Step(
-                step=5,
-                description="➕ Añadir constante",
-                expression=result_str,
-                detail="Añadimos '+ C' (constante de integración).\n\n¿Por qué?\nCuando derivamos una constante, se vuelve 0. Por eso, al integrar, no sabemos si había una constante originalmente.\n\nLa 'C' puede ser cualquier número."
-            ))
+            steps.append(step_templates.step(5, "integral.constant", expression=result_str))
+            yield steps[-1]
             
             # Resultado final
-            steps.append(Step(
-                step=6,
-                description="✅ Resultado final",
+            steps.append(step_templates.step(
+                6, "integral.result",
                 expression=f"∫{expr} d{var} = {result_str}",
-                detail=f"🎉 La integral es: {result_str}\n\nEsta función representa la 'antiderivada' o la acumulación de la función original."
+                result=result_str
             ))
+            yield steps[-1]
             
             return {
                 "result": f"∫{expr} d{var} = {result_str}",
-                "steps": [s.model_dump() for s in steps],
                 "mode": "integral"
             }
         
@@ -1214,74 +1455,74 @@ class CalculatorEngine:
         
         return list(operations)
     
-    def _identify_function_type(self, expr, var) -> str:
+    def _identify_function_type(self, expr, var) -> Tuple[str, Dict[str, Any]]:
         """
         Identifica el tipo de función para dar contexto educativo
+        (plantilla y sus parámetros)
         """
         from sympy import sin, cos, tan, exp, log
         
         if expr.is_polynomial(var):
             degree = expr.as_poly(var).degree() if expr.as_poly(var) else 0
             if degree == 1:
-                return "Esta es una función lineal (una línea recta)."
+                return "function.linear", {}
             elif degree == 2:
-                return "Esta es una función cuadrática (una parábola)."
+                return "function.quadratic", {}
             else:
-                return f"Esta es una función polinomial de grado {degree}."
+                return "function.polynomial", {"degree": degree}
         elif expr.has(sin, cos, tan):
-            return "Esta es una función trigonométrica (relacionada con ángulos y círculos)."
+            return "function.trigonometric", {}
         elif expr.has(exp):
-            return "Esta es una función exponencial (crece muy rápidamente)."
+            return "function.exponential", {}
         elif expr.has(log):
-            return "Esta es una función logarítmica (lo opuesto de la exponencial)."
+            return "function.logarithmic", {}
         else:
-            return "Vamos a trabajar con esta función matemática."
+            return "function.general", {}
     
     def _explain_derivative_rule(self, expr, var) -> str:
         """
-        Genera explicación de la regla de derivación aplicada
+        Plantilla con la regla de derivación aplicada
         """
         from sympy import sin, cos, tan, exp, log
         
         if expr.is_polynomial(var):
-            return "Aplicamos la regla de la potencia:\n\nd/dx[x^n] = n × x^(n-1)\n\nBajamos el exponente y restamos 1 al exponente.\n\nPor ejemplo: d/dx[x³] = 3x²"
+            return "derivative.rule_power"
         elif expr.has(sin):
-            return "Reglas trigonométricas:\n• d/dx[sin(x)] = cos(x)\n• d/dx[cos(x)] = -sin(x)\n• d/dx[tan(x)] = sec²(x)"
+            return "derivative.rule_trig"
         elif expr.has(exp):
-            return "Regla de la exponencial:\nd/dx[e^x] = e^x\n\nLa exponencial es especial: ¡su derivada es ella misma!"
+            return "derivative.rule_exp"
         elif expr.has(log):
-            return "Regla del logaritmo:\nd/dx[ln(x)] = 1/x"
+            return "derivative.rule_log"
         else:
-            return "Aplicamos las reglas de derivación correspondientes, como:\n• Regla del producto\n• Regla de la cadena\n• Regla del cociente"
+            return "derivative.rule_general"
     
     def _explain_integration_rule(self, expr, var) -> str:
         """
-        Genera explicación de la regla de integración aplicada
+        Plantilla con la regla de integración aplicada
         """
         from sympy import sin, cos, tan, exp, log
         
         if expr.is_polynomial(var):
-            return "Aplicamos la regla de la potencia para integración:\n\n∫x^n dx = x^(n+1)/(n+1) + C\n\nSumamos 1 al exponente y dividimos por el nuevo exponente.\n\nPor ejemplo: ∫x² dx = x³/3 + C"
+            return "integral.rule_power"
         elif expr.has(sin, cos):
-            return "Reglas trigonométricas de integración:\n• ∫sin(x) dx = -cos(x) + C\n• ∫cos(x) dx = sin(x) + C"
+            return "integral.rule_trig"
         elif expr.has(exp):
-            return "Regla de la exponencial:\n∫e^x dx = e^x + C\n\nLa integral de e^x es e^x."
+            return "integral.rule_exp"
         elif str(expr) == "1/x" or expr.has(log):
-            return "Regla especial:\n∫(1/x) dx = ln|x| + C"
+            return "integral.rule_log"
         else:
-            return "Aplicamos las reglas de integración correspondientes."
+            return "integral.rule_general"
     
-    def validate_expression(self, expression: str, mode: str = "auto") -> bool:
+    def validate_expression(self, expression: str, mode: str = "auto",
+                            parsed: Optional[ParsedExpression] = None) -> bool:
         """
         Valida que una expresión sea parseable y segura
         """
-        try:
-            # Intentar parsear
-            expr = sympify(expression, evaluate=False)
-            return True
-        except Exception as e:
-            logger.warning(f"Expresión inválida: {expression}, error: {str(e)}")
-            return False
+        if parsed is None:
+            parsed = self.parse(expression)
+        if not parsed.valid:
+            logger.warning(f"Expresión inválida: {expression}, error: {str(parsed.error)}")
+        return parsed.valid
 
 
 
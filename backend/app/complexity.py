@@ -0,0 +1,433 @@
+"""
+Estimación del coste de una expresión antes de ejecutarla
+Un análisis léxico barato (sin SymPy) mide:
+
+- tokens: número de elementos (números, nombres, operadores)
+- depth: profundidad máxima de paréntesis
+- result_digits: dígitos estimados del mayor número que aparece
+  (literales, potencias numéricas como 9**9**9 o 0.5**-20000, factoriales);
+  un número muy pequeño exacto (2**-20000) cuenta lo mismo que su inverso
+- max_exponent: mayor exponente aplicado a una expresión simbólica (x**500)
+- functions: llamadas a funciones
+- max_factorial: mayor argumento numérico de factorial
+
+Cada modo tiene un presupuesto. Si la expresión lo supera se rechaza
+(ComplexityExceeded, un ValueError: HTTP 400) antes de llegar a SymPy; si
+solo supera el límite de pasos completos, se resuelve con steps="summary".
+
+Las magnitudes se calculan como log10 con floats, así que estimar
+9**9**9**9 cuesta lo mismo que estimar 2 + 2.
+"""
+from typing import Dict, Any, Optional, List, Tuple
+from app.fast_arithmetic import OPERATOR_ALIASES
+import math
+import os
+import re
+
+# Presupuestos por modo ('auto' usa el del modo que se deduce de la expresión)
+DEFAULT_BUDGETS = {
+    "arithmetic": {
+        "max_tokens": 4000, "max_tokens_full_steps": 300, "max_depth": 100,
+        "max_result_digits": 4000, "max_exponent": 100_000, "max_functions": 50, "max_factorial": 1000
+    },
+    "algebra": {
+        "max_tokens": 600, "max_tokens_full_steps": 600, "max_depth": 50,
+        "max_result_digits": 4000, "max_exponent": 200, "max_functions": 30, "max_factorial": 1000
+    },
+    "solve": {
+        "max_tokens": 300, "max_tokens_full_steps": 300, "max_depth": 30,
+        "max_result_digits": 1000, "max_exponent": 20, "max_functions": 10, "max_factorial": 100
+    },
+    "derivative": {
+        "max_tokens": 600, "max_tokens_full_steps": 600, "max_depth": 50,
+        "max_result_digits": 1000, "max_exponent": 200, "max_functions": 30, "max_factorial": 100
+    },
+    "integral": {
+        "max_tokens": 300, "max_tokens_full_steps": 300, "max_depth": 30,
+        "max_result_digits": 1000, "max_exponent": 50, "max_functions": 10, "max_factorial": 100
+    },
+}
+
+# Profundidad a partir de la cual no se recorre el árbol (protege la recursión del analizador;
+# ningún presupuesto admite más de 100 niveles)
+_MAX_PARSE_DEPTH = 100
+
+# Magnitudes (log10) por encima de esto se tratan como infinitas
+_MAX_LOG10 = 1e300
+
+_TOKEN_RE = re.compile(r"\s*(?:(\d+\.?\d*|\.\d+)|([A-Za-z_][A-Za-z_0-9]*)|(\*\*|[-+*/%^()=!,÷×·−]))")
+
+# Marcas que pueden producir números enormes: sin ellas no hace falta recorrer el árbol
+_MAGNITUDE_HINTS = ("**", "^", "!", "factorial")
+
+# Funciones cuyo valor no crece más que su argumento (a efectos de la estimación)
+_BOUNDED_FUNCTIONS = {"sin", "cos", "tan", "asin", "acos", "atan", "sqrt", "log", "ln", "abs", "Abs"}
+
+# Precedencias: = < + - < * / % < unario < ** (asociativo por la derecha)
+_BINARY = {"=": 1, "+": 2, "-": 2, "*": 3, "/": 3, "%": 3, "**": 5, "^": 5}
+_UNARY = 4
+
+
+class ComplexityExceeded(ValueError):
+    """
+    La expresión supera el presupuesto de su modo
+    """
+
+    def __init__(self, mode: str, metric: str, value: float, limit: float, message: str):
+        super().__init__(message)
+        self.mode = mode
+        self.metric = metric
+        self.value = value
+        self.limit = limit
+
+
+class ComplexityReport:
+    """
+    Resultado del análisis de una expresión
+    """
+    __slots__ = ("tokens", "depth", "result_digits", "max_exponent", "functions", "max_factorial")
+
+    def __init__(self):
+        self.tokens = 0
+        self.depth = 0
+        self.result_digits = 0.0
+        self.max_exponent = 0.0
+        self.functions = 0
+        self.max_factorial = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _tokenize(expression: str, report: ComplexityReport) -> List[Tuple[str, str]]:
+    """
+    Tokens ('num' | 'name' | 'op', texto); cuenta tokens y profundidad de paréntesis
+    y se detiene en el primer carácter desconocido (SymPy dará el error)
+    """
+    tokens = []
+    depth = 0
+    pos = 0
+    length = len(expression)
+    while pos < length:
+        match = _TOKEN_RE.match(expression, pos)
+        if match is None:
+            break
+        pos = match.end()
+        number, name, op = match.groups()
+        if number is not None:
+            tokens.append(("num", number))
+            digits = len(number.split(".")[0].lstrip("0"))
+            report.result_digits = max(report.result_digits, digits)
+        elif name is not None:
+            tokens.append(("name", name))
+        else:
+            tokens.append(("op", OPERATOR_ALIASES.get(op, op)))
+            if op == "(":
+                depth += 1
+                report.depth = max(report.depth, depth)
+            elif op == ")":
+                depth -= 1
+    report.tokens = len(tokens)
+    return tokens
+
+
+def _add_log(a: float, b: float) -> float:
+    # log10(10**a + 10**b) acotado por arriba
+    return max(a, b) + 0.302
+
+
+def _factorial_log(n_log: float) -> float:
+    # log10(n!) ≈ n·log10(n) (Stirling, cota superior)
+    if n_log > 300:
+        return math.inf
+    n = 10 ** n_log
+    return n * n_log
+
+
+class _MagnitudeParser:
+    """
+    Analizador descendente que calcula, para cada subexpresión, una
+    estimación del log10 de su valor absoluto, con signo: negativa para
+    valores menores que 1 (None si es simbólica)
+
+    Solo los paréntesis (acotados por _MAX_PARSE_DEPTH) añaden niveles de
+    recursión: los signos seguidos y las cadenas de potencias (2**2**2...)
+    se recorren con bucles
+    """
+
+    def __init__(self, tokens: List[Tuple[str, str]], report: ComplexityReport):
+        self.tokens = tokens
+        self.pos = 0
+        self.report = report
+
+    def peek(self) -> Optional[Tuple[str, str]]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self) -> Tuple[str, str]:
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def note(self, magnitude: Optional[float]) -> Optional[float]:
+        if magnitude is not None:
+            self.report.result_digits = max(self.report.result_digits, abs(magnitude))
+        return magnitude
+
+    def parse(self):
+        while self.pos < len(self.tokens):
+            self.note(self.expression(0))
+            # Saltar lo que no se entienda (p. ej. ')' sobrante); SymPy dará el error
+            if self.pos < len(self.tokens):
+                self.pos += 1
+
+    def expression(self, min_precedence: int) -> Optional[float]:
+        left = self.unary()
+        while True:
+            token = self.peek()
+            if token is None:
+                return left
+            kind, op = token
+            if kind != "op" or op == "(":
+                # Multiplicación implícita (2x, 2(x+1)): se trata como '*'
+                if min_precedence <= _BINARY["*"]:
+                    left = self.combine("*", left, self.expression(_BINARY["*"] + 1))
+                    continue
+                return left
+            if op == "!":
+                self.pos += 1
+                left = self.factorial(left)
+                continue
+            precedence = _BINARY.get(op)
+            if precedence is None or precedence < min_precedence:
+                return left
+            if op in ("**", "^"):
+                left = self.power_chain(left)
+                continue
+            self.pos += 1
+            right = self.expression(precedence + 1)
+            left = self.combine(op, left, right)
+
+    def power_chain(self, base: Optional[float]) -> Optional[float]:
+        """
+        a ** b ** c...: lee los exponentes en un bucle y los agrupa por la
+        derecha, a ** (b ** c). El signo de cada exponente se conserva:
+        0.5**-20000 es tan grande como 2**20000
+        """
+        operands = [(base, False)]
+        while self.peek() in (("op", "**"), ("op", "^")):
+            self.pos += 1
+            negative = False
+            while self.peek() in (("op", "-"), ("op", "+")):
+                negative ^= self.take()[1] == "-"
+            operand = self.atom()
+            while self.peek() == ("op", "!"):
+                self.pos += 1
+                operand = self.factorial(operand)
+            operands.append((operand, negative))
+        value, negative = operands.pop()
+        while operands:
+            base, base_negative = operands.pop()
+            value = self.power(base, value, negative)
+            negative = base_negative
+        return value
+
+    def combine(self, op: str, left: Optional[float], right: Optional[float]) -> Optional[float]:
+        if left is None or right is None:
+            return None
+        if op in ("+", "-"):
+            return self.note(_add_log(left, right))
+        if op == "*":
+            return self.note(left + right)
+        if op == "/":
+            return self.note(left - right)
+        if op == "%":
+            # |a % b| < |b|
+            return right
+        return None
+
+    def power(self, base: Optional[float], exponent: Optional[float], negative: bool = False) -> Optional[float]:
+        if exponent is None:
+            return None
+        exponent_value = 10 ** exponent if exponent < 300 else math.inf
+        if base is None:
+            # Potencia simbólica (x**500): el coste depende del grado
+            self.report.max_exponent = max(self.report.max_exponent, exponent_value)
+            return None
+        if base == 0:
+            # |a| = 1 (o a = 0): la potencia no crece
+            return 0.0
+        # log10|a ** ±b| = ±b·log10|a|: con a < 1 y exponente negativo es positivo
+        magnitude = -base * exponent_value if negative else base * exponent_value
+        if abs(magnitude) > _MAX_LOG10:
+            return self.note(math.copysign(math.inf, magnitude))
+        return self.note(magnitude)
+
+    def factorial(self, argument: Optional[float]) -> Optional[float]:
+        if argument is None:
+            return None
+        self.report.max_factorial = max(self.report.max_factorial, 10 ** argument if argument < 300 else math.inf)
+        return self.note(_factorial_log(argument))
+
+    def unary(self) -> Optional[float]:
+        # El signo no cambia la magnitud: los signos seguidos (---x) se saltan en un bucle
+        signs = 0
+        while self.peek() in (("op", "-"), ("op", "+")):
+            self.pos += 1
+            signs += 1
+        if signs:
+            return self.expression(_UNARY)
+        return self.atom()
+
+    def atom(self) -> Optional[float]:
+        token = self.peek()
+        if token is None:
+            return None
+        kind, text = self.take()
+        if kind == "num":
+            value = float(text) if len(text) < 300 else math.inf
+            if value == 0:
+                return 0.0
+            return math.log10(value) if value < math.inf else math.inf
+        if kind == "name":
+            following = self.peek()
+            if following == ("op", "("):
+                self.pos += 1
+                self.report.functions += 1
+                arguments = self.arguments()
+                first = arguments[0] if arguments else None
+                if text == "factorial":
+                    return self.factorial(first)
+                if text in _BOUNDED_FUNCTIONS:
+                    return first
+                return None
+            return None
+        if text == "(":
+            value = self.expression(0)
+            if self.peek() == ("op", ")"):
+                self.pos += 1
+            return value
+        return None
+
+    def arguments(self) -> List[Optional[float]]:
+        values = []
+        while self.peek() is not None and self.peek() != ("op", ")"):
+            values.append(self.expression(0))
+            if self.peek() == ("op", ","):
+                self.pos += 1
+            elif self.peek() != ("op", ")"):
+                break
+        if self.peek() == ("op", ")"):
+            self.pos += 1
+        return values
+
+
+def analyze(expression: str) -> ComplexityReport:
+    """
+    Análisis léxico de la expresión (sin SymPy); nunca lanza excepciones
+    """
+    report = ComplexityReport()
+    tokens = _tokenize(expression, report)
+    if report.depth <= _MAX_PARSE_DEPTH and any(hint in expression for hint in _MAGNITUDE_HINTS):
+        _MagnitudeParser(tokens, report).parse()
+    return report
+
+
+def budget_mode(expression: str, mode: str) -> str:
+    """
+    Modo cuyo presupuesto se aplica: en 'auto', el que deduciría el motor
+    con las mismas pistas de texto (sin parsear)
+    """
+    if mode in DEFAULT_BUDGETS:
+        return mode
+    lower = expression.lower()
+    if "=" in expression:
+        return "solve"
+    if re.search(r"[a-z]", lower.replace("factorial", "").replace("sqrt", "")):
+        return "algebra"
+    return "arithmetic"
+
+
+def _digits(value: float) -> str:
+    return "incontables" if value == math.inf else f"unos {int(value) + 1:,}".replace(",", ".")
+
+
+class ComplexityEstimator:
+    """
+    Aplica los presupuestos por modo (COMPLEXITY_BUDGET_SCALE los multiplica)
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("COMPLEXITY_ENABLED", "true").lower() == "true"
+        scale = float(os.getenv("COMPLEXITY_BUDGET_SCALE", "1"))
+        self.budgets = {
+            mode: {name: limit * scale for name, limit in limits.items()}
+            for mode, limits in DEFAULT_BUDGETS.items()
+        }
+        self.rejected: Dict[str, int] = {}
+        self.downgraded = 0
+
+    def _reject(self, mode: str, metric: str, value: float, limit: float, message: str):
+        self.rejected[metric] = self.rejected.get(metric, 0) + 1
+        raise ComplexityExceeded(mode, metric, value, limit, message)
+
+    def check(self, expression: str, mode: str = "auto", steps: str = "full") -> str:
+        """
+        Comprueba el presupuesto antes de ejecutar nada
+
+        Returns:
+            El nivel de pasos a usar: `steps`, o "summary" si la expresión es
+            demasiado larga para explicarla paso a paso
+
+        Raises:
+            ComplexityExceeded: si supera el presupuesto de su modo
+        """
+        if not self.enabled:
+            return steps
+        report = analyze(expression)
+        mode = budget_mode(expression, mode)
+        budget = self.budgets[mode]
+
+        if report.tokens > budget["max_tokens"]:
+            self._reject(mode, "tokens", report.tokens, budget["max_tokens"],
+                         f"La expresión es demasiado larga para el modo '{mode}': {report.tokens} elementos "
+                         f"(máximo {budget['max_tokens']:g}). Divídela en partes más pequeñas.")
+        if report.depth > budget["max_depth"]:
+            self._reject(mode, "depth", report.depth, budget["max_depth"],
+                         f"Demasiados paréntesis anidados: {report.depth} niveles (máximo {budget['max_depth']:g}).")
+        if report.max_factorial > budget["max_factorial"]:
+            self._reject(mode, "factorial", report.max_factorial, budget["max_factorial"],
+                         f"El factorial es demasiado grande para calcularlo (máximo {budget['max_factorial']:g}!).")
+        if report.result_digits > budget["max_result_digits"]:
+            self._reject(mode, "result_digits", report.result_digits, budget["max_result_digits"],
+                         f"El resultado tendría {_digits(report.result_digits)} dígitos "
+                         f"(máximo {budget['max_result_digits']:g}). Prueba con números más pequeños.")
+        if report.max_exponent > budget["max_exponent"]:
+            self._reject(mode, "exponent", report.max_exponent, budget["max_exponent"],
+                         f"El exponente es demasiado grande para el modo '{mode}' (máximo {budget['max_exponent']:g}).")
+        if report.functions > budget["max_functions"]:
+            self._reject(mode, "functions", report.functions, budget["max_functions"],
+                         f"Demasiadas funciones en la expresión: {report.functions} "
+                         f"(máximo {budget['max_functions']:g}).")
+
+        if steps == "full" and report.tokens > budget["max_tokens_full_steps"]:
+            self.downgraded += 1
+            return "summary"
+        return steps
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "rejected": self.rejected,
+            "downgraded": self.downgraded
+        }
+
+
+# Instancia global
+complexity_estimator = ComplexityEstimator()
+
+
+def check_complexity(expression: str, mode: str = "auto", steps: str = "full") -> str:
+    """
+    Atajo para las rutas: ver ComplexityEstimator.check
+    """
+    return complexity_estimator.check(expression, mode, steps)
@@ -0,0 +1,203 @@
+"""
+Compresión de respuestas (brotli o gzip según Accept-Encoding)
+- CompressionMiddleware: comprime las respuestas de un solo bloque que
+  superan un tamaño mínimo. Las respuestas en streaming (SSE, NDJSON) se
+  envían sin comprimir para que cada evento llegue en cuanto se produce.
+- PrecompressedBody: cuerpos estáticos (/, /health, /operations, /templates)
+  que se serializan y comprimen una sola vez al arrancar y se reutilizan en
+  cada petición, con ETag para responder 304 a las peticiones condicionales.
+
+Brotli es opcional: si el paquete no está instalado solo se ofrece gzip.
+"""
+from typing import Dict, Optional, List, Tuple
+from fastapi import Request, Response
+import gzip
+import hashlib
+import os
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli es opcional
+    brotli = None
+
+# Configuración
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "500"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+# Respuestas que se envían por partes y no deben acumularse para comprimir
+STREAMING_MEDIA_TYPES = ("text/event-stream", "application/x-ndjson")
+
+
+def supported_encodings() -> Tuple[str, ...]:
+    """
+    Codificaciones disponibles, en orden de preferencia
+    """
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Elige la codificación preferida que el cliente acepta (None = sin comprimir)
+    """
+    if not accept_encoding:
+        return None
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.partition(";")
+        params = params.replace(" ", "")
+        try:
+            quality = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            quality = 0.0
+        if quality > 0:
+            accepted.add(name.strip())
+    for encoding in supported_encodings():
+        if encoding in accepted or "*" in accepted:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str, best: bool = False) -> bytes:
+    """
+    Comprime con el nivel configurado, o con el máximo (`best`) para los
+    cuerpos estáticos, cuyo coste se paga una sola vez
+    """
+    if encoding == "br":
+        return brotli.compress(body, quality=11 if best else BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=9 if best else GZIP_LEVEL, mtime=0)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Si la cabecera If-None-Match incluye el ETag (comparación débil)
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    weak = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == weak:
+            return True
+    return False
+
+
+class PrecompressedBody:
+    """
+    Cuerpo estático serializado y comprimido una sola vez
+
+    El ETag es un hash del cuerpo (o el que se indique, p. ej. la versión
+    del catálogo de plantillas), así que cambia solo cuando cambia el
+    contenido; si el cliente ya lo tiene se responde 304 sin cuerpo. Cada
+    codificación es una representación distinta con su propio ETag fuerte
+    ("abc" sin comprimir, "abc-br", "abc-gzip").
+    """
+
+    def __init__(self, body: bytes, media_type: str = "application/json",
+                 cache_control: Optional[str] = None, etag: Optional[str] = None):
+        self.media_type = media_type
+        self.etag = etag or f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        self.headers: Dict[str, str] = {}
+        if cache_control:
+            self.headers["Cache-Control"] = cache_control
+        self.variants: Dict[str, bytes] = {"identity": body}
+        self.etags: Dict[str, str] = {"identity": self.etag}
+        if COMPRESSION_ENABLED and len(body) >= COMPRESSION_MIN_SIZE:
+            for encoding in supported_encodings():
+                self.variants[encoding] = compress(body, encoding, best=True)
+                self.etags[encoding] = f'{self.etag[:-1]}-{encoding}"'
+            self.headers["Vary"] = "Accept-Encoding"
+
+    def response(self, request: Request) -> Response:
+        """
+        304 si el cliente ya tiene esta versión; si no, la variante que
+        acepta (el middleware la deja pasar porque ya lleva Content-Encoding)
+        """
+        encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+        if encoding not in self.variants:
+            encoding = "identity"
+        headers = {**self.headers, "ETag": self.etags[encoding]}
+        if etag_matches(request.headers.get("if-none-match", ""), self.etags[encoding]):
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(content=self.variants[encoding], media_type=self.media_type, headers=headers)
+
+
+class CompressionMiddleware:
+    """
+    Middleware ASGI que comprime el cuerpo completo de la respuesta
+
+    Solo actúa cuando la respuesta llega en un único mensaje, no trae ya
+    Content-Encoding y mide al menos `minimum_size` bytes.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            headers: List[Tuple[bytes, bytes]] = list(start_message.get("headers", []))
+            body = message.get("body", b"")
+            if (message.get("more_body", False)
+                    or len(body) < self.minimum_size
+                    or not self._compressible(headers)):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            body = compress(body, encoding)
+            headers = [(name, value) for name, value in headers if name != b"content-length"]
+            headers.append((b"content-encoding", encoding.encode("latin-1")))
+            headers.append((b"content-length", str(len(body)).encode("latin-1")))
+            headers.append((b"vary", b"Accept-Encoding"))
+            await send({**start_message, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+    @staticmethod
+    def _compressible(headers: List[Tuple[bytes, bytes]]) -> bool:
+        for name, value in headers:
+            if name == b"content-encoding":
+                return False
+            if name == b"content-type" and value.decode("latin-1").startswith(STREAMING_MEDIA_TYPES):
+                return False
+        return True
@@ -0,0 +1,889 @@
+"""
+Ejecución del motor de cálculo fuera del event loop
+Los cálculos de SymPy son CPU-bound: se ejecutan en un pool de procesos
+para que uvicorn siga atendiendo otras peticiones (incluido /health)
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, Tuple, AsyncIterator, Callable
+from app.memory import MemoryGuard, get_rss_mb, sympy_cache_info
+from app.fast_arithmetic import parse_arithmetic
+from app.timing import StageTimer, activate, current_timer
+import multiprocessing
+import threading
+import asyncio
+import logging
+import signal
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Límite de tiempo por modo (segundos), configurable con ENGINE_TIMEOUT_<MODO>
+DEFAULT_TIMEOUTS = {
+    "arithmetic": 3.0,
+    "algebra": 10.0,
+    "solve": 10.0,
+    "derivative": 10.0,
+    "integral": 10.0,
+}
+
+# Margen extra antes de considerar que un proceso está bloqueado y reciclar el pool;
+# cuenta desde que un worker empieza la tarea, no desde que se envía
+HARD_TIMEOUT_GRACE = 2.0
+
+# Cada cuánto se comprueba si un worker ya tomó una tarea que aún no ha empezado
+START_POLL_INTERVAL = 0.25
+
+# Tamaño máximo (en bits) del resultado de la aritmética que se resuelve en el proceso
+INLINE_MAX_BITS = 1024
+
+# Espera máxima (s) a los últimos pasos de un stream cuando el worker ya terminó:
+# viajan por el Manager y el hilo de reparto, no junto con el resultado
+STREAM_DRAIN_TIMEOUT = 1.0
+
+# Motor propio de cada proceso del pool (se crea en el initializer)
+_worker_engine = None
+_worker_memory: Optional[MemoryGuard] = None
+_worker_max_tasks = 0
+_worker_warm = False
+# (tokens, instantes) en memoria compartida: qué tarea empezó en cada hueco y cuándo
+_worker_task_marks = None
+
+
+class CalculationTimeout(Exception):
+    """
+    El cálculo superó el tiempo máximo permitido para su modo
+    """
+
+    def __init__(self, mode: str, timeout: float):
+        super().__init__(mode, timeout)
+        self.mode = mode
+        self.timeout = timeout
+
+    def __str__(self):
+        return f"El cálculo en modo '{self.mode}' superó el límite de {self.timeout:g} segundos"
+
+
+class _DeadlineExceeded(BaseException):
+    """
+    Señal interna del worker; hereda de BaseException para que los
+    `except Exception` del motor no la conviertan en ValueError
+    """
+
+
+def _on_deadline(signum, frame):
+    # Re-armar el temporizador: si algún `except:` del motor se traga la
+    # excepción, la señal vuelve a dispararse hasta que el cálculo termine
+    signal.setitimer(signal.ITIMER_REAL, 0.05)
+    raise _DeadlineExceeded()
+
+
+def _init_worker(max_rss_mb: float = 0, max_tasks: int = 0, task_marks=None):
+    """
+    Inicializa un proceso del pool: importa SymPy y crea el motor
+    para que la primera petición no pague el costo de importación
+    """
+    global _worker_engine, _worker_memory, _worker_max_tasks, _worker_task_marks
+    _worker_memory = MemoryGuard(max_rss_mb)
+    _worker_max_tasks = max_tasks
+    if task_marks is not None:
+        _worker_task_marks = task_marks
+    import sympy  # noqa: F401
+    from app.calculator_engine import CalculatorEngine
+    _worker_engine = CalculatorEngine()
+    if hasattr(signal, "SIGALRM"):
+        signal.signal(signal.SIGALRM, _on_deadline)
+
+
+def _worker_ping(hold: float = 0.0) -> int:
+    """
+    Tarea vacía: obliga a arrancar (e inicializar) los procesos del pool;
+    `hold` la mantiene ocupada para que las demás vayan a otros workers
+    """
+    if _worker_engine is None:
+        _init_worker()
+    time.sleep(hold)
+    return os.getpid()
+
+
+def _warm_up_engine(engine, corpus, run) -> Dict[str, float]:
+    """
+    Resuelve el corpus de calentamiento con `run(expresión, modo)`
+
+    Returns:
+        Milisegundos por modo (suma de sus expresiones)
+    """
+    timings: Dict[str, float] = {}
+    for expression, mode in corpus:
+        started = time.perf_counter()
+        try:
+            run(expression, mode)
+        except Exception as e:
+            # Un ejemplo que falla no debe impedir el arranque
+            logger.warning(f"Calentamiento: '{expression}' ({mode}) falló: {str(e)}")
+        timings[mode] = timings.get(mode, 0.0) + (time.perf_counter() - started) * 1000
+    return {mode: round(ms, 1) for mode, ms in timings.items()}
+
+
+def _worker_warm_up(corpus, timeouts: Dict[str, float], hold: float = 0.05) -> Dict[str, Any]:
+    """
+    Calienta el worker que la recibe: SymPy construye sus tablas internas
+    (solve, integrate, latex...) con el primer uso, no al importarse.
+    Si el worker ya estaba caliente solo espera `hold` para que las demás
+    tareas de la ronda vayan a otros workers
+    """
+    global _worker_warm
+    if _worker_engine is None:
+        _init_worker()
+    if _worker_warm:
+        time.sleep(hold)
+        return {"pid": os.getpid(), "timings": None}
+    timings = _warm_up_engine(
+        _worker_engine, corpus,
+        lambda expression, mode: _run_with_deadline(expression, mode, None, timeouts)
+    )
+    _worker_warm = True
+    return {"pid": os.getpid(), "timings": timings}
+
+
+def _worker_calculate(expression: str, mode: str, variables: Optional[Dict],
+                      timeouts: Dict[str, float], step_queue=None, steps: str = "full",
+                      task: Optional[Tuple[int, int]] = None,
+                      stream_id: Optional[int] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Tarea ejecutada dentro de un proceso del pool
+
+    Con `step_queue` (cola de un Manager) cada paso se publica como
+    (stream_id, paso) en cuanto el motor lo produce, para las respuestas
+    en streaming; al terminar se publica (stream_id, None)
+
+    `task` es (hueco, token): al empezar se anota en memoria compartida
+    para que el límite duro del proceso principal cuente desde aquí
+
+    Returns:
+        (resultado, estado del worker: memoria y duración de cada etapa)
+    """
+    if task is not None and _worker_task_marks is not None:
+        index, token = task
+        tokens, started_at = _worker_task_marks
+        # Primero el instante y luego el token: quien lee el token ve ya su instante
+        started_at[index] = time.monotonic()
+        tokens[index] = token
+
+    if _worker_engine is None:
+        _init_worker()
+
+    timer = StageTimer()
+    try:
+        with activate(timer):
+            on_step = (lambda step: step_queue.put((stream_id, step))) if step_queue is not None else None
+            result = _run_with_deadline(expression, mode, variables, timeouts, on_step, steps)
+        timer.add("worker", timer.total())
+    finally:
+        if step_queue is not None:
+            step_queue.put((stream_id, None))
+        recycle = _worker_memory.after_task()
+        if _worker_max_tasks and _worker_memory.tasks >= _worker_max_tasks:
+            recycle = True
+
+    return result, {
+        "pid": os.getpid(),
+        "rss_mb": get_rss_mb(),
+        "tasks": _worker_memory.tasks,
+        "cache_clears": _worker_memory.cache_clears,
+        "recycle": recycle,
+        "timings": timer.stages
+    }
+
+
+def _run_engine(engine, expression: str, mode: str, variables: Optional[Dict], parsed=None,
+                on_step: Optional[Callable[[Dict[str, Any]], None]] = None, steps: str = "full") -> Dict[str, Any]:
+    """
+    Ejecuta el motor; con `on_step` usa la variante incremental y entrega cada paso
+    """
+    if on_step is None:
+        return engine.calculate(expression=expression, mode=mode, variables=variables, parsed=parsed, steps=steps)
+
+    produced = engine.iter_calculate(expression=expression, mode=mode, variables=variables, parsed=parsed,
+                                     steps=steps)
+    try:
+        while True:
+            on_step(next(produced))
+    except StopIteration as done:
+        return done.value
+
+
+def _run_with_deadline(expression: str, mode: str, variables: Optional[Dict],
+                       timeouts: Dict[str, float],
+                       on_step: Optional[Callable[[Dict[str, Any]], None]] = None,
+                       steps: str = "full") -> Dict[str, Any]:
+    """
+    El límite de tiempo se aplica con SIGALRM dentro del propio proceso,
+    así el cálculo se interrumpe sin matar el worker
+    """
+
+    if not hasattr(signal, "SIGALRM"):
+        return _run_engine(_worker_engine, expression, mode, variables, on_step=on_step, steps=steps)
+
+    # El parseo también cuenta: SymPy evalúa potencias como 9**9**9 al construirlas
+    started = time.monotonic()
+    timeout = timeouts.get(mode, max(timeouts.values()))
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        # Parsear una sola vez: la detección de modo y el cálculo comparten el resultado
+        parsed = _worker_engine.parse(expression)
+        if mode == "auto":
+            mode = _worker_engine._detect_mode(expression, parsed)
+            timeout = timeouts.get(mode, timeout)
+            remaining = timeout - (time.monotonic() - started)
+            if remaining <= 0:
+                raise _DeadlineExceeded()
+            signal.setitimer(signal.ITIMER_REAL, remaining)
+        return _run_engine(_worker_engine, expression, mode, variables, parsed, on_step, steps)
+    except _DeadlineExceeded:
+        raise CalculationTimeout(mode, timeout)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+class EngineExecutor:
+    """
+    Pool de procesos gestionado para el CalculatorEngine
+
+    Con ENGINE_WORKERS=0 el cálculo se ejecuta en un hilo del proceso
+    actual (útil para depurar); en ese caso el límite de tiempo solo
+    abandona el cálculo, no lo detiene
+    """
+
+    def __init__(self):
+        default_workers = min(os.cpu_count() or 1, 4)
+        self.max_workers = int(os.getenv("ENGINE_WORKERS", str(default_workers)))
+        self.timeouts = {
+            mode: float(os.getenv(f"ENGINE_TIMEOUT_{mode.upper()}", str(default)))
+            for mode, default in DEFAULT_TIMEOUTS.items()
+        }
+        # Presupuesto de memoria: reciclar workers tras N tareas o si superan X MB
+        self.max_tasks_per_worker = int(os.getenv("ENGINE_MAX_TASKS_PER_WORKER", "500"))
+        self.worker_max_rss_mb = float(os.getenv("ENGINE_WORKER_MAX_RSS_MB", "350"))
+        # Espera máxima a que un worker tome una tarea (arranque en frío de un pool nuevo)
+        self.start_timeout = float(os.getenv("ENGINE_START_TIMEOUT", "30"))
+        self.recycled_pools = 0
+        self.retired_pools = 0
+        self.worker_stats: Dict[int, Dict[str, Any]] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Un hueco por worker: el pool nunca tiene tareas esperando en su cola interna
+        self._free_slots: Optional[asyncio.Queue] = None
+        self._task_marks = None
+        self._task_counter = 0
+        # Pool de reemplazo que se está arrancando y calentando (ver _retire)
+        self._replacing: Optional[asyncio.Task] = None
+        # Corpus del calentamiento de arranque, que se reutiliza en los pools de reemplazo
+        self._warmup_corpus = None
+        self._manager = None
+        # Cola de pasos compartida por todos los streams y, por stream abierto,
+        # el event loop y la cola asyncio a la que el hilo de reparto entrega
+        self._step_queue_proxy = None
+        self._streams: Dict[int, Tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = {}
+        self._stream_counter = 0
+        self._local_engine = None
+        self._engine_lock = threading.Lock()
+        self._local_memory = MemoryGuard(self.worker_max_rss_mb, check_every=10)
+        # Aritmética pura en el propio proceso: ~0,1 ms frente al viaje de ida y vuelta al pool
+        self.inline_arithmetic = os.getenv("ENGINE_INLINE_ARITHMETIC", "true").lower() == "true"
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_workers > 0
+
+    def timeout_for(self, mode: str) -> float:
+        """
+        Límite de tiempo para un modo ('auto' usa el mayor de todos)
+        """
+        return self.timeouts.get(mode, max(self.timeouts.values()))
+
+    def start(self):
+        """
+        Crea el pool de procesos (se llama en el startup de la app)
+        """
+        if not self.enabled or self._pool is not None:
+            return
+        self._pool = self._new_pool()
+        logger.info(f"Pool de cálculo iniciado con {self.max_workers} procesos")
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        context = multiprocessing.get_context("spawn")
+        if self._task_marks is None:
+            # Se comparten con todos los pools sucesivos: los huecos no cambian
+            self._task_marks = (
+                context.Array("q", self.max_workers, lock=False),
+                context.Array("d", self.max_workers, lock=False)
+            )
+        # "spawn" evita heredar el estado del event loop y los hilos del proceso padre
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=context,
+            initializer=_init_worker,
+            # No se usa max_tasks_per_child: combinado con shutdown(wait=False)
+            # deja tareas pendientes sin worker; el propio worker pide el reciclado
+            initargs=(self.worker_max_rss_mb, self.max_tasks_per_worker, self._task_marks)
+        )
+
+    def shutdown(self):
+        """
+        Cierra el pool de procesos (se llama en el shutdown de la app)
+        """
+        if self._replacing is not None:
+            self._replacing.cancel()
+            self._replacing = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        if self._manager is not None:
+            try:
+                # Despierta al hilo de reparto para que termine
+                self._step_queue_proxy.put(None)
+            except (EOFError, OSError):
+                pass
+            self._manager.shutdown()
+            self._manager = None
+            self._step_queue_proxy = None
+
+    def _recycle(self, pool: ProcessPoolExecutor):
+        """
+        Termina los procesos de un pool bloqueado y crea uno nuevo
+        """
+        if pool is not self._pool:
+            # Otro request ya recicló este pool
+            return
+        logger.warning("Proceso de cálculo bloqueado más allá del límite, reciclando pool")
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+        self.worker_stats.clear()
+        self.recycled_pools += 1
+        self.start()
+
+    def _retire(self, pool: ProcessPoolExecutor):
+        """
+        Reemplaza un pool cuyo worker superó el presupuesto de memoria o de
+        tareas. El reemplazo se arranca y se calienta en segundo plano
+        mientras el pool viejo sigue atendiendo; solo entonces se cambia,
+        así ninguna petición paga el arranque de los procesos ni la carga
+        de SymPy
+        """
+        if pool is not self._pool or self._replacing is not None:
+            return
+        logger.info("Worker de cálculo por encima de su presupuesto, preparando un pool de reemplazo")
+        self._replacing = asyncio.get_running_loop().create_task(self._replace(pool))
+
+    async def _replace(self, pool: ProcessPoolExecutor):
+        replacement = self._new_pool()
+        try:
+            await self._spawn_workers(replacement)
+            if self._warmup_corpus:
+                await self._warm_workers(replacement, self._warmup_corpus)
+        except asyncio.CancelledError:
+            replacement.shutdown(wait=False, cancel_futures=True)
+            raise
+        except Exception as e:
+            # Se reintentará cuando otro worker vuelva a pedir el reciclado
+            logger.error(f"No se pudo preparar el pool de reemplazo: {str(e)}")
+            replacement.shutdown(wait=False, cancel_futures=True)
+            return
+        finally:
+            self._replacing = None
+
+        if pool is not self._pool:
+            # Mientras tanto el pool se recicló por un cálculo bloqueado
+            replacement.shutdown(wait=False)
+            return
+        # El pool viejo termina lo que tiene pendiente y luego cierra sus procesos
+        self._pool = replacement
+        pool.shutdown(wait=False)
+        self.worker_stats.clear()
+        self.retired_pools += 1
+        logger.info("Pool de cálculo reemplazado")
+
+    def engine(self):
+        """
+        Motor compartido del proceso actual (validación, ENGINE_WORKERS=0)
+
+        Se crea con el primer uso: importar SymPy cuesta segundos en un
+        arranque en frío, así que no se hace al importar los módulos
+        """
+        if self._local_engine is None:
+            with self._engine_lock:
+                if self._local_engine is None:
+                    from app.calculator_engine import CalculatorEngine
+                    self._local_engine = CalculatorEngine()
+        return self._local_engine
+
+    @property
+    def engine_loaded(self) -> bool:
+        return self._local_engine is not None
+
+    async def get_engine(self):
+        """
+        Como engine(), pero si hay que cargarlo lo hace en un hilo para no
+        bloquear el event loop
+        """
+        if self._local_engine is None:
+            await asyncio.get_running_loop().run_in_executor(None, self.engine)
+        return self._local_engine
+
+    async def prestart(self, hold: float = 0.05, rounds: int = 3) -> set:
+        """
+        Arranca los procesos del pool e importa SymPy en cada uno antes de
+        la primera petición
+
+        Returns:
+            PIDs de los workers que respondieron
+        """
+        if not self.enabled:
+            return set()
+        if self._pool is None:
+            self.start()
+        return await self._spawn_workers(self._pool, hold, rounds)
+
+    async def _spawn_workers(self, pool: ProcessPoolExecutor, hold: float = 0.05, rounds: int = 3) -> set:
+        loop = asyncio.get_running_loop()
+        pids = set()
+        for _ in range(rounds):
+            pids.update(await asyncio.gather(*(
+                loop.run_in_executor(pool, _worker_ping, hold) for _ in range(self.max_workers)
+            )))
+            if len(pids) >= self.max_workers:
+                break
+        return pids
+
+    async def warm_up(self, corpus, rounds: int = 3) -> Dict[int, Dict[str, float]]:
+        """
+        Resuelve el corpus en cada worker del pool (o en el motor del
+        proceso con ENGINE_WORKERS=0) antes de recibir tráfico
+
+        Returns:
+            {pid: milisegundos por modo} de cada proceso calentado
+        """
+        loop = asyncio.get_running_loop()
+        if not self.enabled:
+            engine = await self.get_engine()
+            timings = await loop.run_in_executor(
+                None, _warm_up_engine, engine, corpus,
+                lambda expression, mode: engine.calculate(expression=expression, mode=mode)
+            )
+            return {os.getpid(): timings}
+
+        if self._pool is None:
+            self.start()
+        self._warmup_corpus = corpus
+        return await self._warm_workers(self._pool, corpus, rounds)
+
+    async def _warm_workers(self, pool: ProcessPoolExecutor, corpus, rounds: int = 3) -> Dict[int, Dict[str, float]]:
+        loop = asyncio.get_running_loop()
+        warmed: Dict[int, Dict[str, float]] = {}
+        seen = set()
+        for _ in range(rounds):
+            outcomes = await asyncio.gather(*(
+                loop.run_in_executor(pool, _worker_warm_up, corpus, self.timeouts)
+                for _ in range(self.max_workers)
+            ))
+            for outcome in outcomes:
+                seen.add(outcome["pid"])
+                if outcome["timings"] is not None:
+                    warmed[outcome["pid"]] = outcome["timings"]
+            if len(seen) >= self.max_workers:
+                break
+        return warmed
+
+    def _calculate_local(self, expression: str, mode: str, variables: Optional[Dict],
+                         on_step=None, steps: str = "full") -> Tuple[Dict[str, Any], Dict[str, float]]:
+        engine = self.engine()
+        # run_in_executor no propaga el contexto: el hilo usa su propio timer
+        timer = StageTimer()
+        try:
+            with activate(timer):
+                result = _run_engine(engine, expression, mode, variables, on_step=on_step, steps=steps)
+            timer.add("worker", timer.total())
+            return result, timer.stages
+        finally:
+            # En el proceso actual solo se puede vaciar la caché de SymPy, no reciclar
+            self._local_memory.after_task()
+
+    def inline_eligible(self, expression: str, mode: str, variables: Optional[Dict] = None) -> bool:
+        """
+        Si el cálculo es aritmética pura y acotada que se puede resolver en el
+        event loop sin pasar por el pool (ni por su cola)
+
+        Requiere el motor del proceso ya cargado: importar SymPy aquí
+        bloquearía el event loop durante segundos
+        """
+        if not self.inline_arithmetic or not self.engine_loaded:
+            return False
+        if mode not in ("auto", "arithmetic") or variables:
+            return False
+        arithmetic = parse_arithmetic(expression)
+        if arithmetic is None:
+            return False
+        value = arithmetic.value
+        return max(value.numerator.bit_length(), value.denominator.bit_length()) <= INLINE_MAX_BITS
+
+    def calculate_inline(self, expression: str, mode: str = "auto", variables: Optional[Dict] = None,
+                         steps: str = "full") -> Dict[str, Any]:
+        """
+        Ejecuta en el event loop un cálculo para el que inline_eligible() es True
+        """
+        result, timings = self._calculate_local(expression, mode, variables, None, steps)
+        timer = current_timer()
+        if timer is not None:
+            timer.merge(timings)
+        return result
+
+    def memory_stats(self) -> Dict[str, Any]:
+        """
+        Memoria del proceso actual y último estado reportado por cada worker
+        """
+        return {
+            "process": {
+                "pid": os.getpid(),
+                "rss_mb": get_rss_mb(),
+                "sympy_cache": sympy_cache_info()
+            },
+            "workers": list(self.worker_stats.values()),
+            "worker_max_rss_mb": self.worker_max_rss_mb,
+            "max_tasks_per_worker": self.max_tasks_per_worker,
+            "retired_pools": self.retired_pools
+        }
+
+    @asynccontextmanager
+    async def _task_slot(self):
+        """
+        Reserva uno de los max_workers huecos del pool: como nunca hay más
+        tareas que workers, una tarea enviada empieza enseguida en vez de
+        esperar en la cola interna del pool (la espera ocurre aquí, fuera
+        del límite duro)
+
+        Yields:
+            (hueco, token) que el worker anota al empezar la tarea
+        """
+        if self._free_slots is None:
+            self._free_slots = asyncio.Queue()
+            for index in range(self.max_workers):
+                self._free_slots.put_nowait(index)
+        index = await self._free_slots.get()
+        self._task_counter += 1
+        try:
+            yield index, self._task_counter
+        finally:
+            self._free_slots.put_nowait(index)
+
+    def _task_started(self, task: Tuple[int, int]) -> Optional[float]:
+        """
+        Instante (time.monotonic) en que un worker empezó la tarea, o None si aún no empezó
+        """
+        index, token = task
+        tokens, started_at = self._task_marks
+        if tokens[index] != token:
+            return None
+        return started_at[index]
+
+    def _next_deadline(self, future, task: Tuple[int, int], pool: ProcessPoolExecutor,
+                       submitted: float, mode: str, timeout: float) -> float:
+        """
+        Se llama al vencer el plazo de una tarea del pool. El límite duro
+        cuenta desde que un worker la empezó: una tarea que aún no ha
+        empezado (workers arrancando) sigue esperando
+
+        Returns:
+            Nuevo plazo (time.monotonic) si la tarea todavía tiene tiempo
+
+        Raises:
+            CalculationTimeout: la tarea superó el límite; el pool se recicla
+                solo si la tarea se estaba ejecutando
+        """
+        now = time.monotonic()
+        started_at = self._task_started(task)
+        if started_at is None:
+            if now - submitted < self.start_timeout:
+                return now + START_POLL_INTERVAL
+            # Ningún worker la tomó: no hay un proceso bloqueado que reciclar
+            logger.warning(f"Ningún worker empezó el cálculo en {self.start_timeout:g} s")
+            future.cancel()
+            raise CalculationTimeout(mode, timeout)
+        deadline = started_at + timeout + HARD_TIMEOUT_GRACE
+        if now < deadline:
+            return deadline
+        # El worker no respondió a SIGALRM (p. ej. atrapado en código C)
+        future.cancel()
+        self._recycle(pool)
+        raise CalculationTimeout(mode, timeout)
+
+    async def _await_task(self, future, task: Tuple[int, int], pool: ProcessPoolExecutor,
+                          mode: str, timeout: float):
+        """
+        Espera el resultado de una tarea del pool aplicando el límite duro
+        """
+        submitted = time.monotonic()
+        deadline = submitted + timeout + HARD_TIMEOUT_GRACE
+        try:
+            while True:
+                done, _ = await asyncio.wait({future}, timeout=max(deadline - time.monotonic(), 0))
+                if done:
+                    return future.result()
+                deadline = self._next_deadline(future, task, pool, submitted, mode, timeout)
+        except asyncio.CancelledError:
+            # La petición se abandonó: si la tarea no empezó, que no ocupe un worker
+            future.cancel()
+            raise
+
+    async def calculate(self, expression: str, mode: str = "auto", variables: Optional[Dict] = None,
+                        steps: str = "full") -> Dict[str, Any]:
+        """
+        Ejecuta CalculatorEngine.calculate sin bloquear el event loop
+
+        Raises:
+            CalculationTimeout: si el cálculo supera el límite de su modo
+        """
+        loop = asyncio.get_running_loop()
+        timeout = self.timeout_for(mode)
+        started = time.perf_counter()
+
+        if not self.enabled:
+            try:
+                result, timings = await asyncio.wait_for(
+                    loop.run_in_executor(None, self._calculate_local, expression, mode, variables, None, steps),
+                    timeout=timeout
+                )
+            except asyncio.TimeoutError:
+                raise CalculationTimeout(mode, timeout)
+            self._record_timings(timings, started)
+            return result
+
+        for attempt in range(2):
+            try:
+                async with self._task_slot() as task:
+                    if self._pool is None:
+                        self.start()
+                    pool = self._pool
+                    future = loop.run_in_executor(
+                        pool, _worker_calculate, expression, mode, variables, self.timeouts, None, steps, task
+                    )
+                    result, worker = await self._await_task(future, task, pool, mode, timeout)
+            except BrokenProcessPool:
+                # El pool fue reciclado por otra petición: reintentar una vez
+                if attempt == 1:
+                    raise
+                if pool is self._pool:
+                    self._recycle(pool)
+            else:
+                timings = worker.pop("timings")
+                self.worker_stats[worker["pid"]] = worker
+                if worker["recycle"]:
+                    self._retire(pool)
+                self._record_timings(timings, started)
+                return result
+
+    def _step_queue(self):
+        """
+        Cola compartida con los workers para recibir pasos en streaming;
+        el Manager y el hilo que reparte los pasos se inician con el
+        primer cálculo en streaming
+        """
+        if self._manager is None:
+            self._manager = multiprocessing.get_context("spawn").Manager()
+            self._step_queue_proxy = self._manager.Queue()
+            threading.Thread(
+                target=self._drain_steps, args=(self._step_queue_proxy,),
+                name="engine-stream-steps", daemon=True
+            ).start()
+        return self._step_queue_proxy
+
+    def _drain_steps(self, step_queue):
+        """
+        Hilo dedicado: entrega cada (stream_id, paso) a la cola asyncio de
+        su stream. Es el único hilo que espera en la cola del Manager, así
+        que los streams abiertos no ocupan hilos del executor por defecto;
+        los pasos de streams ya cerrados se descartan
+        """
+        while True:
+            try:
+                item = step_queue.get()
+            except (EOFError, OSError):
+                # El Manager se cerró
+                return
+            if item is None:
+                return
+            stream_id, step = item
+            target = self._streams.get(stream_id)
+            if target is None:
+                continue
+            loop, events = target
+            try:
+                loop.call_soon_threadsafe(events.put_nowait, step)
+            except RuntimeError:
+                # El event loop del stream ya se cerró
+                pass
+
+    async def _await_steps(self, future, task: Tuple[int, int], pool: ProcessPoolExecutor,
+                           events: asyncio.Queue, mode: str, timeout: float) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Pasos de una tarea del pool a medida que llegan, con el mismo límite
+        duro que _await_task; termina con el final que publica el worker
+
+        Raises:
+            BrokenProcessPool: el proceso murió a mitad del cálculo
+            CalculationTimeout: si el cálculo supera el límite de su modo
+        """
+        submitted = time.monotonic()
+        deadline = submitted + timeout + HARD_TIMEOUT_GRACE
+        getter = None
+        try:
+            while True:
+                if getter is None:
+                    getter = asyncio.ensure_future(events.get())
+                pending = {getter} if future.done() else {getter, future}
+                done, _ = await asyncio.wait(
+                    pending, timeout=max(deadline - time.monotonic(), 0), return_when=asyncio.FIRST_COMPLETED
+                )
+                if getter in done:
+                    step = getter.result()
+                    getter = None
+                    if step is None:
+                        return
+                    yield step
+                elif future in done:
+                    if isinstance(future.exception(), BrokenProcessPool):
+                        # El worker murió sin publicar el final
+                        future.result()
+                    deadline = time.monotonic() + STREAM_DRAIN_TIMEOUT
+                elif future.done():
+                    # El final no llegó a tiempo: el resultado ya está
+                    logger.warning("Pasos de un stream sin final tras terminar el worker")
+                    return
+                else:
+                    deadline = self._next_deadline(future, task, pool, submitted, mode, timeout)
+        finally:
+            if getter is not None:
+                getter.cancel()
+
+    async def stream(self, expression: str, mode: str = "auto",
+                     variables: Optional[Dict] = None, steps: str = "full") -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Igual que calculate, pero entrega ("step", paso) a medida que el
+        motor produce cada paso y termina con ("result", resultado)
+
+        Raises:
+            CalculationTimeout: si el cálculo supera el límite de su modo
+        """
+        loop = asyncio.get_running_loop()
+        timeout = self.timeout_for(mode)
+        started = time.perf_counter()
+
+        if not self.enabled:
+            async for event in self._stream_local(expression, mode, variables, steps, timeout, started):
+                yield event
+            return
+
+        step_queue = self._step_queue_proxy
+        if step_queue is None:
+            step_queue = await loop.run_in_executor(None, self._step_queue)
+
+        # Pasos ya entregados: un reintento tras un pool roto no los repite
+        sent = 0
+        for attempt in range(2):
+            # Un id por intento: los pasos rezagados del intento fallido se descartan
+            self._stream_counter += 1
+            stream_id = self._stream_counter
+            events: asyncio.Queue = asyncio.Queue()
+            self._streams[stream_id] = (loop, events)
+            try:
+                async with self._task_slot() as task:
+                    if self._pool is None:
+                        self.start()
+                    pool = self._pool
+                    future = loop.run_in_executor(
+                        pool, _worker_calculate, expression, mode, variables, self.timeouts,
+                        step_queue, steps, task, stream_id
+                    )
+                    try:
+                        received = 0
+                        async for step in self._await_steps(future, task, pool, events, mode, timeout):
+                            received += 1
+                            if received > sent:
+                                sent = received
+                                yield "step", step
+                        # El final se publica justo antes de que el worker devuelva el resultado
+                        result, worker = await future
+                    except (asyncio.CancelledError, GeneratorExit):
+                        future.cancel()
+                        raise
+            except BrokenProcessPool:
+                # El pool fue reciclado por otra petición: reintentar una vez
+                if attempt == 1:
+                    raise
+                if pool is self._pool:
+                    self._recycle(pool)
+            else:
+                break
+            finally:
+                self._streams.pop(stream_id, None)
+
+        timings = worker.pop("timings")
+        self.worker_stats[worker["pid"]] = worker
+        if worker["recycle"]:
+            self._retire(pool)
+        self._record_timings(timings, started)
+        yield "result", result
+
+    async def _stream_local(self, expression: str, mode: str, variables: Optional[Dict], steps: str,
+                            timeout: float, started: float) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Streaming con ENGINE_WORKERS=0: el hilo entrega los pasos al event loop
+        """
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+
+        def on_step(step):
+            loop.call_soon_threadsafe(events.put_nowait, step)
+
+        future = loop.run_in_executor(None, self._calculate_local, expression, mode, variables, on_step, steps)
+        deadline = loop.time() + timeout
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise CalculationTimeout(mode, timeout)
+            getter = asyncio.ensure_future(events.get())
+            done, _ = await asyncio.wait({getter, future}, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                yield "step", getter.result()
+                continue
+            getter.cancel()
+            if future in done:
+                break
+
+        # call_soon_threadsafe encola los pasos antes de que el futuro se resuelva
+        await asyncio.sleep(0)
+        while not events.empty():
+            yield "step", events.get_nowait()
+
+        result, timings = future.result()
+        self._record_timings(timings, started)
+        yield "result", result
+
+    @staticmethod
+    def _record_timings(timings: Dict[str, float], started: float):
+        """
+        Suma las etapas medidas en el worker al timer de la petición;
+        'pool' es la espera en cola más el envío de ida y vuelta
+        """
+        timer = current_timer()
+        if timer is None:
+            return
+        timer.merge(timings)
+        timer.add("pool", max(0.0, time.perf_counter() - started - timings.get("worker", 0.0)))
+
+
+# Instancia global
+engine_executor = EngineExecutor()
@@ -0,0 +1,506 @@
+"""
+Evaluador rápido de aritmética pura
+La mayoría del tráfico son operaciones numéricas (2 + 3 * 4, 144 / 12);
+para ellas no hace falta pasar por sympify/evalf. Este módulo tokeniza,
+construye un árbol pequeño y calcula el resultado exacto con Fraction.
+
+Solo acepta números y + - * / ** ( ) (también ^ ÷ ×). Si aparece cualquier otra cosa
+(variables, funciones, '=') devuelve None y el motor usa SymPy.
+
+También incluye el reductor paso a paso (PEMDAS) que recorre el mismo
+árbol y resuelve una operación a la vez.
+"""
+from fractions import Fraction
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import heapq
+import re
+
+# Tamaño máximo (en bits) de una potencia calculada aquí; por encima se deja a SymPy
+MAX_POWER_BITS = 100_000
+
+_TOKEN_RE = re.compile(r"\s*(?:(\d+\.\d*|\.\d+|\d+)|(\*\*|[-+*/()^÷×·−]))")
+
+# Variantes de los operadores que se aceptan al escribir (la interfaz usa ÷ y ×)
+OPERATOR_ALIASES = {"^": "**", "÷": "/", "×": "*", "·": "*", "−": "-"}
+
+
+class Num:
+    """Número literal"""
+    __slots__ = ("value", "text", "parenthesized")
+
+    def __init__(self, value: Fraction, text: str):
+        self.value = value
+        self.text = text
+        self.parenthesized = False
+
+
+class UnaryOp:
+    """Signo unario (- o +)"""
+    __slots__ = ("op", "operand", "parenthesized")
+
+    def __init__(self, op: str, operand):
+        self.op = op
+        self.operand = operand
+        self.parenthesized = False
+
+
+class BinOp:
+    """Operación binaria: + - * / **"""
+    __slots__ = ("op", "left", "right", "parenthesized")
+
+    def __init__(self, op: str, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+        self.parenthesized = False
+
+
+class ArithmeticExpression:
+    """
+    Expresión aritmética ya evaluada
+
+    - tree: árbol de la expresión
+    - value: resultado exacto (Fraction)
+    - exact: False si la expresión contiene decimales escritos por el usuario
+    """
+    __slots__ = ("tree", "value", "exact")
+
+    def __init__(self, tree, value: Fraction, exact: bool):
+        self.tree = tree
+        self.value = value
+        self.exact = exact
+
+
+def _tokenize(expression: str) -> Optional[List[Tuple[str, str]]]:
+    tokens = []
+    pos = 0
+    length = len(expression)
+    while pos < length:
+        match = _TOKEN_RE.match(expression, pos)
+        if match is None:
+            if expression[pos:].strip() == "":
+                break
+            return None
+        number, op = match.groups()
+        if number is not None:
+            tokens.append(("num", number))
+        else:
+            tokens.append(("op", OPERATOR_ALIASES.get(op, op)))
+        pos = match.end()
+    return tokens
+
+
+# Precedencia y asociatividad (igual que Python/SymPy): ** > signo unario > * / > + -
+_BINARY_PRECEDENCE = {"+": 1, "-": 1, "*": 2, "/": 2, "**": 4}
+_UNARY_PRECEDENCE = 3
+
+
+def _parse_tokens(tokens: List[Tuple[str, str]]) -> Tuple[object, bool]:
+    """
+    Construye el árbol con shunting-yard (iterativo: los paréntesis
+    muy anidados no dependen del límite de recursión)
+
+    Returns:
+        (árbol, si hay decimales escritos por el usuario)
+    """
+    output: List[object] = []
+    operators: List[Tuple[str, str]] = []  # (tipo, operador): tipo es "bin", "un" o "("
+    has_decimals = False
+    expect_operand = True
+
+    def reduce_top():
+        kind, op = operators.pop()
+        if kind == "un":
+            if not output:
+                raise SyntaxError("falta operando")
+            output.append(UnaryOp(op, output.pop()))
+        else:
+            if len(output) < 2:
+                raise SyntaxError("falta operando")
+            right = output.pop()
+            left = output.pop()
+            output.append(BinOp(op, left, right))
+
+    def precedence(entry) -> int:
+        kind, op = entry
+        return _UNARY_PRECEDENCE if kind == "un" else _BINARY_PRECEDENCE[op]
+
+    for kind, text in tokens:
+        if kind == "num":
+            if not expect_operand:
+                raise SyntaxError("número inesperado")
+            if "." in text:
+                has_decimals = True
+            output.append(Num(Fraction(text), text))
+            expect_operand = False
+        elif text == "(":
+            if not expect_operand:
+                raise SyntaxError("'(' inesperado")
+            operators.append(("(", text))
+        elif text == ")":
+            if expect_operand:
+                raise SyntaxError("')' inesperado")
+            while operators and operators[-1][0] != "(":
+                reduce_top()
+            if not operators:
+                raise SyntaxError("falta '('")
+            operators.pop()
+            output[-1].parenthesized = True
+        elif expect_operand:
+            if text not in ("-", "+"):
+                raise SyntaxError(f"operador inesperado: {text}")
+            operators.append(("un", text))
+        else:
+            prec = _BINARY_PRECEDENCE[text]
+            right_assoc = text == "**"
+            while operators and operators[-1][0] != "(":
+                top = precedence(operators[-1])
+                if top > prec or (top == prec and not right_assoc):
+                    reduce_top()
+                else:
+                    break
+            operators.append(("bin", text))
+            expect_operand = True
+
+    if expect_operand:
+        raise SyntaxError("fin inesperado")
+    while operators:
+        if operators[-1][0] == "(":
+            raise SyntaxError("falta ')'")
+        reduce_top()
+    if len(output) != 1:
+        raise SyntaxError("expresión incompleta")
+    return output[0], has_decimals
+
+
+def power(base: Fraction, exponent: Fraction) -> Optional[Fraction]:
+    """
+    Potencia exacta; None si el exponente no es entero o el resultado es demasiado grande
+    """
+    if exponent.denominator != 1:
+        return None
+    exp = exponent.numerator
+    bits = max(base.numerator.bit_length(), base.denominator.bit_length())
+    if bits * abs(exp) > MAX_POWER_BITS:
+        return None
+    if exp < 0 and base == 0:
+        return None
+    return base ** exp
+
+
+def apply_operation(op: str, left: Fraction, right: Fraction) -> Optional[Fraction]:
+    """
+    Aplica una operación binaria; None si no se puede calcular de forma exacta
+    (división por cero, potencias no enteras o demasiado grandes)
+    """
+    if op == "+":
+        return left + right
+    if op == "-":
+        return left - right
+    if op == "*":
+        return left * right
+    if op == "/":
+        if right == 0:
+            return None
+        return left / right
+    return power(left, right)
+
+
+def evaluate(node) -> Optional[Fraction]:
+    """
+    Evalúa el árbol (recorrido iterativo); None si algún paso no se puede
+    calcular de forma exacta
+    """
+    values: List[Fraction] = []
+    stack = [(node, False)]
+    while stack:
+        current, visited = stack.pop()
+        if isinstance(current, Num):
+            values.append(current.value)
+        elif not visited:
+            stack.append((current, True))
+            if isinstance(current, UnaryOp):
+                stack.append((current.operand, False))
+            else:
+                stack.append((current.right, False))
+                stack.append((current.left, False))
+        elif isinstance(current, UnaryOp):
+            if current.op == "-":
+                values[-1] = -values[-1]
+        else:
+            right = values.pop()
+            left = values.pop()
+            result = apply_operation(current.op, left, right)
+            if result is None:
+                return None
+            values.append(result)
+    return values[0]
+
+
+def _literal(node) -> Optional[Fraction]:
+    if isinstance(node, Num) and not node.parenthesized:
+        return node.value
+    if isinstance(node, UnaryOp) and isinstance(node.operand, Num) and not node.parenthesized \
+            and not node.operand.parenthesized:
+        return -node.operand.value if node.op == "-" else node.operand.value
+    return None
+
+
+def simple_operation(tree) -> Optional[Tuple[str, Fraction, Fraction]]:
+    """
+    Si el árbol es una operación simple (dos números y un operador)
+    devuelve (operador, izquierda, derecha); si no, None
+    """
+    if not isinstance(tree, BinOp) or tree.parenthesized:
+        return None
+    left = _literal(tree.left)
+    right = _literal(tree.right)
+    if left is None or right is None:
+        return None
+    return tree.op, left, right
+
+
+def parse_arithmetic(expression: str) -> Optional[ArithmeticExpression]:
+    """
+    Parsea y evalúa una expresión numérica pura
+
+    Returns:
+        ArithmeticExpression, o None si la expresión no es aritmética pura
+        o no se puede calcular de forma exacta (el motor usará SymPy)
+    """
+    tokens = _tokenize(expression)
+    if not tokens:
+        return None
+
+    try:
+        tree, has_decimals = _parse_tokens(tokens)
+    except SyntaxError:
+        return None
+
+    value = evaluate(tree)
+    if value is None:
+        return None
+    return ArithmeticExpression(tree, value, exact=not has_decimals)
+
+
+def fraction_latex(value: Fraction) -> str:
+    """
+    LaTeX de un racional con el mismo formato que sympy.latex
+    """
+    if value.denominator == 1:
+        return str(value.numerator)
+    sign = "- " if value < 0 else ""
+    return f"{sign}\\frac{{{abs(value.numerator)}}}{{{value.denominator}}}"
+
+
+# Prioridad PEMDAS de cada operador (mayor se resuelve antes)
+_OP_RANK = {"**": 3, "*": 2, "/": 2, "+": 1, "-": 1}
+
+_LATEX_OPS = {"+": "+", "-": "-", "*": "\\cdot"}
+
+
+class Reduction:
+    """
+    Una operación resuelta por el reductor
+
+    - op, left, right, result: la operación y su resultado
+    - in_parentheses: si la operación estaba dentro de paréntesis
+    - expression / expression_latex: la expresión completa después de resolverla
+    """
+    __slots__ = ("op", "left", "right", "result", "in_parentheses", "expression", "expression_latex")
+
+    def __init__(self, op, left, right, result, in_parentheses, expression, expression_latex):
+        self.op = op
+        self.left = left
+        self.right = right
+        self.result = result
+        self.in_parentheses = in_parentheses
+        self.expression = expression
+        self.expression_latex = expression_latex
+
+
+class _Reducer:
+    """
+    Reduce el árbol una operación a la vez siguiendo PEMDAS
+
+    - Las operaciones "listas" (ambos operandos ya son números) esperan en
+      un heap ordenado por (profundidad de paréntesis, prioridad, posición)
+    - Al resolver una, su padre puede quedar listo y entra al heap
+    - El texto y el LaTeX de cada nodo se guardan en caché; tras una
+      reducción solo se re-renderiza el camino hasta la raíz
+    """
+
+    def __init__(self, tree, formatter: Callable[[Fraction], str],
+                 latex_formatter: Optional[Callable[[Fraction], str]] = None):
+        self.tree = tree
+        self.formatter = formatter
+        self.latex_formatter = latex_formatter or formatter
+        self.parent: Dict[int, object] = {}
+        self.depth: Dict[int, int] = {}
+        self.position: Dict[int, int] = {}
+        self.reduced: Dict[int, Fraction] = {}
+        self.text_cache: Dict[int, str] = {}
+        self.latex_cache: Dict[int, str] = {}
+        self.heap: List[Tuple[int, int, int, int]] = []
+        self.nodes: Dict[int, object] = {}
+        self._index(tree)
+
+    def _index(self, root):
+        # Recorrido iterativo en orden (izquierda → derecha) para no depender de la recursión
+        counter = 0
+        stack = [(root, 0, False)]
+        while stack:
+            node, depth, visited = stack.pop()
+            key = id(node)
+            if visited:
+                self.position[key] = counter
+                counter += 1
+                continue
+            self.nodes[key] = node
+            depth = depth + (1 if node.parenthesized else 0)
+            self.depth[key] = depth
+            if isinstance(node, BinOp):
+                self.parent[id(node.left)] = node
+                self.parent[id(node.right)] = node
+                stack.append((node.right, depth, False))
+                stack.append((node, depth, True))
+                stack.append((node.left, depth, False))
+            elif isinstance(node, UnaryOp):
+                self.parent[id(node.operand)] = node
+                stack.append((node, depth, True))
+                stack.append((node.operand, depth, False))
+            else:
+                stack.append((node, depth, True))
+
+        for key, node in self.nodes.items():
+            if isinstance(node, BinOp):
+                self._push_if_ready(node)
+
+    def _value(self, node) -> Optional[Fraction]:
+        """
+        Valor de un nodo si ya es un número (literal, reducido o con signo)
+        """
+        key = id(node)
+        if key in self.reduced:
+            return self.reduced[key]
+        if isinstance(node, Num):
+            return node.value
+        if isinstance(node, UnaryOp):
+            value = self._value(node.operand)
+            if value is None:
+                return None
+            return -value if node.op == "-" else value
+        return None
+
+    def _push_if_ready(self, node):
+        if id(node) in self.reduced:
+            return
+        if self._value(node.left) is None or self._value(node.right) is None:
+            return
+        key = id(node)
+        heapq.heappush(self.heap, (-self.depth[key], -_OP_RANK[node.op], self.position[key], key))
+
+    def _invalidate(self, node):
+        while node is not None:
+            key = id(node)
+            self.text_cache.pop(key, None)
+            self.latex_cache.pop(key, None)
+            node = self.parent.get(key)
+
+    def _number_text(self, node, value: Fraction, latex: bool) -> str:
+        text = self.latex_formatter(value) if latex else self.formatter(value)
+        if value < 0 and node.parenthesized:
+            return f"\\left({text}\\right)" if latex else f"({text})"
+        return text
+
+    def _render_node(self, node, cache: Dict[int, str], latex: bool) -> str:
+        # Los hijos ya están en la caché (ver render)
+        key = id(node)
+        if key in self.reduced:
+            return self._number_text(node, self.reduced[key], latex)
+
+        if isinstance(node, Num):
+            result = node.text
+        elif isinstance(node, UnaryOp):
+            result = f"{node.op}{cache[id(node.operand)]}"
+        else:
+            left = cache[id(node.left)]
+            right = cache[id(node.right)]
+            if not latex:
+                result = f"{left} {node.op} {right}"
+            elif node.op == "/":
+                result = f"\\frac{{{left}}}{{{right}}}"
+            elif node.op == "**":
+                result = f"{left}^{{{right}}}"
+            else:
+                result = f"{left} {_LATEX_OPS[node.op]} {right}"
+
+        if node.parenthesized:
+            result = f"\\left({result}\\right)" if latex else f"({result})"
+        return result
+
+    def render(self, node, latex: bool = False) -> str:
+        """
+        Texto (o LaTeX) del nodo en su estado actual; solo se renderizan
+        los nodos que no están en la caché
+        """
+        cache = self.latex_cache if latex else self.text_cache
+        stack = [(node, False)]
+        while stack:
+            current, visited = stack.pop()
+            key = id(current)
+            if key in cache:
+                continue
+            if not visited and key not in self.reduced and not isinstance(current, Num):
+                stack.append((current, True))
+                if isinstance(current, UnaryOp):
+                    stack.append((current.operand, False))
+                else:
+                    stack.append((current.right, False))
+                    stack.append((current.left, False))
+                continue
+            cache[key] = self._render_node(current, cache, latex)
+        return cache[id(node)]
+
+    def run(self) -> Iterator[Reduction]:
+        while self.heap:
+            _, _, _, key = heapq.heappop(self.heap)
+            node = self.nodes[key]
+            left = self._value(node.left)
+            right = self._value(node.right)
+            result = apply_operation(node.op, left, right)
+            if result is None:
+                # No debería ocurrir: el árbol completo ya se evaluó antes
+                return
+
+            self.reduced[key] = result
+            self._invalidate(node)
+
+            parent = self.parent.get(key)
+            # Subir por los signos unarios hasta la siguiente operación binaria
+            while isinstance(parent, UnaryOp):
+                parent = self.parent.get(id(parent))
+            if parent is not None:
+                self._push_if_ready(parent)
+
+            yield Reduction(
+                op=node.op,
+                left=left,
+                right=right,
+                result=result,
+                in_parentheses=self.depth[key] > 0,
+                expression=self.render(self.tree),
+                expression_latex=self.render(self.tree, latex=True)
+            )
+
+
+def reduce_steps(tree, formatter: Callable[[Fraction], str],
+                 latex_formatter: Optional[Callable[[Fraction], str]] = None) -> Iterator[Reduction]:
+    """
+    Resuelve el árbol una operación a la vez en orden PEMDAS:
+    primero lo más interno de los paréntesis, luego potencias,
+    multiplicación/división y suma/resta, cada grupo de izquierda a derecha
+
+    Cada reducción es O(log n) más el re-renderizado del camino a la raíz.
+    """
+    return _Reducer(tree, formatter, latex_formatter).run()
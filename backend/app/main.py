@@ -2,13 +2,24 @@
 EduCalc Backend - FastAPI Application
 Calculadora educativa con explicaciones paso a paso
 """
+import time
+
+_import_started = time.perf_counter()
+
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 import os
 
 from app.routes import calculate, validate, info
 from app.utils import setup_logging
+from app.executor import engine_executor
+from app.metrics import render_prometheus
+from app.service import calculation_service
+from app.compression import CompressionMiddleware, COMPRESSION_ENABLED
+from app.startup import startup_state
+from app.complexity import complexity_estimator
 
 # Cargar variables de entorno
 load_dotenv()
@@ -16,6 +27,9 @@ load_dotenv()
 # Configurar logging
 setup_logging(level=os.getenv("LOG_LEVEL", "INFO"))
 
+# Tiempo de importación de la app (sin SymPy, que se carga después)
+startup_state.record("import", time.perf_counter() - _import_started)
+
 # Crear aplicación FastAPI
 app = FastAPI(
     title="EduCalc Backend API",
@@ -43,12 +57,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Comprimir respuestas grandes (pasos explicativos) para clientes móviles
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
 # Registrar routers
 app.include_router(info.router, prefix="", tags=["info"])
 app.include_router(calculate.router, prefix="", tags=["calculate"])
 app.include_router(validate.router, prefix="", tags=["validate"])
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Métricas en formato de texto de Prometheus
+    """
+    return PlainTextResponse(
+        render_prometheus({**calculation_service.stats(), "complexity": complexity_estimator.stats()}),
+        media_type="text/plain; version=0.0.4"
+    )
+
+
+@app.get("/ready", include_in_schema=False)
+async def ready():
+    """
+    Readiness: 200 cuando el motor y los workers están cargados, 503 mientras
+    tanto (/health responde desde el primer momento)
+    """
+    stats = startup_state.stats()
+    if startup_state.ready:
+        return JSONResponse(stats)
+    return JSONResponse(stats, status_code=503, headers={"Retry-After": "1"})
+
+
 # Event handlers
 @app.on_event("startup")
 async def startup_event():
@@ -60,7 +101,11 @@ async def startup_event():
     print(f"📝 Entorno: {os.getenv('ENVIRONMENT', 'development')}")
     print(f"🔐 Auth habilitado: {os.getenv('AUTH_ENABLED', 'false')}")
     print(f"📚 Documentación: http://localhost:{os.getenv('API_PORT', '8000')}/docs")
+    print(f"⚙️  Procesos de cálculo: {engine_executor.max_workers}")
+    print(f"⏱️  Precarga del motor: {startup_state.preload}")
     print("=" * 60)
+    engine_executor.start()
+    await startup_state.start()
 
 
 @app.on_event("shutdown")
@@ -69,6 +114,8 @@ async def shutdown_event():
     Ejecutar al cerrar la aplicación
     """
     print("🛑 EduCalc Backend cerrando...")
+    await startup_state.stop()
+    engine_executor.shutdown()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,121 @@
+"""
+Presupuesto de memoria de los procesos
+Los caches internos de SymPy (cacheit) crecen con cada expresión distinta
+y los workers de larga vida suben de RSS hasta que Cloud Run los mata.
+Aquí se mide la memoria, se limpian los caches y se decide cuándo reciclar.
+"""
+from typing import Dict, Any
+import logging
+import sys
+import gc
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def get_rss_mb() -> float:
+    """
+    Memoria residente (RSS) actual del proceso en MB
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except (OSError, ValueError, IndexError):
+        # Sin /proc (macOS, Windows): usar el máximo histórico
+        try:
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # Linux reporta KB, macOS bytes
+            divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+            return round(peak / divisor, 1)
+        except ImportError:
+            return 0.0
+
+
+def sympy_cache_info() -> Dict[str, Any]:
+    """
+    Tamaño de los caches de SymPy (sin importar SymPy si aún no se cargó)
+    """
+    if "sympy" not in sys.modules:
+        return {"loaded": False, "functions": 0, "entries": 0}
+
+    from sympy.core.cache import CACHE
+
+    entries = 0
+    for item in CACHE:
+        info = getattr(item, "cache_info", None)
+        if info is not None:
+            entries += info().currsize
+    return {
+        "loaded": True,
+        "functions": len(CACHE),
+        "entries": entries,
+        "max_size_per_function": os.getenv("SYMPY_CACHE_SIZE", "1000")
+    }
+
+
+def clear_sympy_cache():
+    """
+    Vacía los caches de SymPy y fuerza una recolección de basura
+    """
+    if "sympy" in sys.modules:
+        from sympy.core.cache import clear_cache
+        clear_cache()
+    gc.collect()
+
+
+class MemoryGuard:
+    """
+    Aplica el presupuesto de memoria de un proceso
+
+    Cada `check_every` tareas compara el RSS con `max_rss_mb`:
+    primero vacía los caches de SymPy y, si sigue por encima,
+    indica que el proceso debe reciclarse.
+    """
+
+    def __init__(self, max_rss_mb: float, check_every: int = 1):
+        self.max_rss_mb = max_rss_mb
+        self.check_every = max(1, check_every)
+        self.tasks = 0
+        self.cache_clears = 0
+        self.last_rss_mb = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_rss_mb > 0
+
+    def after_task(self) -> bool:
+        """
+        Registra una tarea terminada
+
+        Returns:
+            True si el proceso sigue por encima del presupuesto y debe reciclarse
+        """
+        self.tasks += 1
+        if not self.enabled or self.tasks % self.check_every:
+            return False
+
+        self.last_rss_mb = get_rss_mb()
+        if self.last_rss_mb <= self.max_rss_mb:
+            return False
+
+        clear_sympy_cache()
+        self.cache_clears += 1
+        rss_after = get_rss_mb()
+        logger.info(
+            f"Caché de SymPy vaciada por memoria: {self.last_rss_mb} MB → {rss_after} MB "
+            f"(límite {self.max_rss_mb} MB)"
+        )
+        self.last_rss_mb = rss_after
+        return rss_after > self.max_rss_mb
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "rss_mb": get_rss_mb(),
+            "max_rss_mb": self.max_rss_mb,
+            "tasks": self.tasks,
+            "cache_clears": self.cache_clears,
+            "sympy_cache": sympy_cache_info()
+        }
@@ -0,0 +1,249 @@
+"""
+Métricas del servicio
+- Histogramas de latencia de buckets fijos por (etapa, modo)
+- Contadores de peticiones y errores, peticiones en curso
+- Exportación en formato de texto de Prometheus para GET /metrics
+
+Solo se actualizan desde el event loop, por lo que no necesitan locks:
+registrar una observación es una suma sobre un dict o una lista.
+"""
+from typing import Dict, Any, Tuple, List, Optional
+from app.executor import DEFAULT_TIMEOUTS
+import bisect
+
+# Límites superiores de los buckets en milisegundos
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Valores posibles de la etiqueta mode: el modo lo envía el cliente, así que
+# cualquier otro valor se agrupa en "invalid" (si no, cada modo inventado
+# crearía series nuevas sin límite)
+KNOWN_MODES = frozenset(("auto",) + tuple(DEFAULT_TIMEOUTS))
+
+
+def mode_label(mode: Optional[str]) -> str:
+    return mode if mode in KNOWN_MODES else "invalid"
+
+
+class Histogram:
+    """
+    Histograma acumulativo al estilo Prometheus (buckets + suma + conteo)
+    """
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        # Un contador por bucket más el de +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        Pares (límite, observaciones <= límite), terminando en +Inf
+        """
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield bound, total
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum_ms": round(self.sum, 3),
+            "avg_ms": round(self.sum / self.count, 3) if self.count else 0.0,
+            "buckets": {("+Inf" if bound == float("inf") else f"{bound:g}"): n for bound, n in self.cumulative()}
+        }
+
+
+class LatencyMetrics:
+    """
+    Histogramas de duración por etapa y modo de cálculo
+    """
+
+    def __init__(self):
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+
+    def observe(self, mode: str, timings_ms: Dict[str, float]):
+        """
+        Registra las etapas de una petición (salida de StageTimer.as_ms)
+        """
+        mode = mode_label(mode)
+        for stage_name, ms in timings_ms.items():
+            histogram = self.histograms.get((stage_name, mode))
+            if histogram is None:
+                histogram = self.histograms[(stage_name, mode)] = Histogram()
+            histogram.observe(ms)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Resumen {modo: {etapa: histograma}}
+        """
+        data: Dict[str, Dict[str, Any]] = {}
+        for (stage_name, mode), histogram in sorted(self.histograms.items()):
+            data.setdefault(mode, {})[stage_name] = histogram.to_dict()
+        return data
+
+
+class RequestMetrics:
+    """
+    Contadores de peticiones de cálculo
+
+    - requests: por (endpoint, modo, estado HTTP)
+    - errors: por tipo ('value_error', 'timeout', 'rejected', 'unexpected')
+    - in_flight: peticiones en curso
+    """
+
+    def __init__(self):
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self.errors: Dict[str, int] = {}
+        self.in_flight = 0
+
+    def record(self, endpoint: str, mode: str, status_code: int, error_kind: Optional[str] = None):
+        key = (endpoint, mode_label(mode), status_code)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        if error_kind is not None:
+            self.errors[error_kind] = self.errors.get(error_kind, 0) + 1
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class PrometheusWriter:
+    """
+    Construye la exposición en formato de texto de Prometheus (v0.0.4)
+    """
+
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def metric(self, name: str, kind: str, help_text: str):
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, value: float, **labels):
+        self.lines.append(f"{name}{_labels(**labels)} {value:g}" if isinstance(value, float)
+                          else f"{name}{_labels(**labels)} {value}")
+
+    def histogram(self, name: str, histogram: Histogram, scale: float = 1.0, **labels):
+        """
+        Escribe buckets, suma y conteo; `scale` convierte la unidad (ms → s)
+        """
+        for bound, count in histogram.cumulative():
+            le = "+Inf" if bound == float("inf") else f"{bound * scale:g}"
+            self.sample(f"{name}_bucket", count, **labels, le=le)
+        self.sample(f"{name}_sum", histogram.sum * scale, **labels)
+        self.sample(f"{name}_count", histogram.count, **labels)
+
+    def render(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+def render_prometheus(service_stats: Dict[str, Any]) -> str:
+    """
+    Exposición completa de métricas
+
+    Args:
+        service_stats: salida de CalculationService.stats() (caché y memoria),
+            más "complexity" con ComplexityEstimator.stats()
+    """
+    out = PrometheusWriter()
+
+    out.metric("educalc_requests_total", "counter", "Peticiones de cálculo por endpoint, modo y estado HTTP")
+    for (endpoint, mode, status_code), count in sorted(request_metrics.requests.items()):
+        out.sample("educalc_requests_total", count, endpoint=endpoint, mode=mode, status=status_code)
+
+    out.metric("educalc_errors_total", "counter", "Errores de cálculo por tipo")
+    for kind in ("value_error", "timeout", "rejected", "unexpected"):
+        out.sample("educalc_errors_total", request_metrics.errors.get(kind, 0), kind=kind)
+
+    out.metric("educalc_requests_in_flight", "gauge", "Peticiones de cálculo en curso")
+    out.sample("educalc_requests_in_flight", request_metrics.in_flight)
+
+    out.metric("educalc_stage_duration_seconds", "histogram", "Duración de cada etapa del cálculo por modo")
+    for (stage_name, mode), histogram in sorted(latency_metrics.histograms.items()):
+        out.histogram("educalc_stage_duration_seconds", histogram, scale=0.001, mode=mode, stage=stage_name)
+
+    for cache_name in ("cache", "shared_cache"):
+        cache = service_stats.get(cache_name, {})
+        prefix = f"educalc_{cache_name}"
+        out.metric(f"{prefix}_hits_total", "counter", f"Aciertos de {cache_name}")
+        out.sample(f"{prefix}_hits_total", cache.get("hits", 0))
+        out.metric(f"{prefix}_misses_total", "counter", f"Fallos de {cache_name}")
+        out.sample(f"{prefix}_misses_total", cache.get("misses", 0))
+        lookups = cache.get("hits", 0) + cache.get("misses", 0)
+        out.metric(f"{prefix}_hit_ratio", "gauge", f"Proporción de aciertos de {cache_name}")
+        out.sample(f"{prefix}_hit_ratio", round(cache.get("hits", 0) / lookups, 4) if lookups else 0.0)
+
+    coalescing = service_stats.get("coalescing", {})
+    out.metric("educalc_coalesced_total", "counter", "Peticiones que esperaron un cálculo idéntico en curso")
+    out.sample("educalc_coalesced_total", coalescing.get("coalesced", 0))
+
+    admission = service_stats.get("admission", {})
+    out.metric("educalc_admission_queue_depth", "gauge", "Cálculos esperando un hueco en el motor, por modo")
+    for mode, waiting in admission.get("waiting", {}).items():
+        out.sample("educalc_admission_queue_depth", waiting, mode=mode)
+    out.metric("educalc_admission_running", "gauge", "Cálculos admitidos en curso, por modo")
+    for mode, running in admission.get("running", {}).items():
+        out.sample("educalc_admission_running", running, mode=mode)
+    out.metric("educalc_admission_limit", "gauge", "Cálculos simultáneos permitidos, por modo")
+    for mode, limit in admission.get("limits", {}).items():
+        out.sample("educalc_admission_limit", limit, mode=mode)
+    out.metric("educalc_admission_rejected_total", "counter", "Peticiones rechazadas con 503 por saturación, por modo")
+    for mode, rejected in admission.get("rejected", {}).items():
+        out.sample("educalc_admission_rejected_total", rejected, mode=mode)
+    lanes = admission.get("lanes", {})
+    out.metric("educalc_lane_running", "gauge", "Cálculos en curso por carril (fast, heavy)")
+    for lane, lane_stats in lanes.items():
+        out.sample("educalc_lane_running", lane_stats.get("running", 0), lane=lane)
+    out.metric("educalc_lane_queue_depth", "gauge", "Cálculos esperando por carril (fast, heavy)")
+    for lane, lane_stats in lanes.items():
+        out.sample("educalc_lane_queue_depth", lane_stats.get("waiting", 0), lane=lane)
+    out.metric("educalc_lane_inline_total", "counter", "Cálculos del carril rápido resueltos sin pasar por el pool")
+    out.sample("educalc_lane_inline_total", lanes.get("fast", {}).get("inline", 0))
+    out.metric("educalc_admission_degraded_total", "counter", "Peticiones resueltas sin pasos completos por saturación")
+    out.sample("educalc_admission_degraded_total", admission.get("degraded", 0))
+
+    complexity = service_stats.get("complexity", {})
+    out.metric("educalc_complexity_rejected_total", "counter",
+               "Expresiones rechazadas antes de ejecutarse por superar el presupuesto, por métrica")
+    for metric, count in sorted(complexity.get("rejected", {}).items()):
+        out.sample("educalc_complexity_rejected_total", count, metric=metric)
+    out.metric("educalc_complexity_downgraded_total", "counter",
+               "Expresiones resueltas sin pasos completos por su tamaño")
+    out.sample("educalc_complexity_downgraded_total", complexity.get("downgraded", 0))
+
+    memory = service_stats.get("memory", {})
+    process = memory.get("process", {})
+    out.metric("educalc_process_resident_memory_bytes", "gauge", "Memoria residente del proceso")
+    out.sample("educalc_process_resident_memory_bytes", int(process.get("rss_mb", 0) * 1024 * 1024))
+    out.metric("educalc_sympy_cache_entries", "gauge", "Entradas en los caches de SymPy del proceso")
+    out.sample("educalc_sympy_cache_entries", process.get("sympy_cache", {}).get("entries", 0))
+    out.metric("educalc_worker_resident_memory_bytes", "gauge", "Memoria residente de cada worker del pool")
+    for worker in memory.get("workers", []):
+        out.sample("educalc_worker_resident_memory_bytes", int(worker["rss_mb"] * 1024 * 1024), pid=worker["pid"])
+
+    engine = service_stats.get("engine", {})
+    out.metric("educalc_engine_recycled_pools_total", "counter", "Pools reciclados por cálculos bloqueados")
+    out.sample("educalc_engine_recycled_pools_total", engine.get("recycled_pools", 0))
+    out.metric("educalc_engine_retired_pools_total", "counter", "Pools reemplazados por presupuesto de memoria")
+    out.sample("educalc_engine_retired_pools_total", memory.get("retired_pools", 0))
+
+    return out.render()
+
+
+# Instancias globales
+latency_metrics = LatencyMetrics()
+request_metrics = RequestMetrics()
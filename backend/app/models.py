@@ -9,6 +9,11 @@ class Step(BaseModel):
     expression: Optional[str] = Field(None, description="Expresión matemática en este paso")
     expression_latex: Optional[str] = Field(None, description="Expresión en formato LaTeX")
     detail: Optional[str] = Field(None, description="Explicación detallada del paso")
+    template: Optional[str] = Field(
+        None,
+        description="Id de la plantilla del texto en GET /templates (solo con format='compact')"
+    )
+    params: Optional[Dict[str, str]] = Field(None, description="Parámetros de la plantilla")
 
     class Config:
         json_schema_extra = {
@@ -32,13 +37,25 @@ class CalculationRequest(BaseModel):
         None,
         description="Variables y sus valores para sustituir"
     )
+    steps: Optional[str] = Field(
+        "full",
+        description="Detalle de los pasos: 'full' (explicación completa), 'summary' (solo el resultado final) "
+                    "o 'none' (sin pasos, para clientes que solo usan el resultado)"
+    )
+    format: Optional[str] = Field(
+        "text",
+        description="Formato de los pasos: 'text' (texto completo) o 'compact' (id de plantilla + "
+                    "parámetros; el texto se reconstruye con el catálogo de GET /templates)"
+    )
 
     class Config:
         json_schema_extra = {
             "example": {
                 "expression": "2*(x+3) - 4",
                 "mode": "algebra",
-                "variables": None
+                "variables": None,
+                "steps": "full",
+                "format": "text"
             }
         }
 
@@ -50,6 +67,14 @@ class CalculationResponse(BaseModel):
     steps: List[Step] = Field(..., description="Pasos de la solución")
     mode: str = Field(..., description="Modo de cálculo utilizado")
     error: Optional[str] = Field(None, description="Mensaje de error si aplica")
+    templates_version: Optional[str] = Field(
+        None,
+        description="Versión del catálogo de plantillas (solo con format='compact')"
+    )
+    degraded: Optional[bool] = Field(
+        None,
+        description="True si el servicio estaba saturado y solo se calculó el resultado (sin pasos completos)"
+    )
 
     class Config:
         json_schema_extra = {
@@ -76,6 +101,38 @@ class CalculationResponse(BaseModel):
         }
 
 
+class BatchCalculationRequest(BaseModel):
+    """Modelo de solicitud para calcular varias expresiones a la vez"""
+    items: List[CalculationRequest] = Field(..., description="Cálculos a resolver")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "items": [
+                    {"expression": "2 + 3 * 4", "mode": "arithmetic"},
+                    {"expression": "2*x + 5 = 15", "mode": "solve"}
+                ]
+            }
+        }
+
+
+class BatchItemResult(BaseModel):
+    """Resultado de un elemento del lote (en el mismo orden de la solicitud)"""
+    index: int = Field(..., description="Posición del elemento en la solicitud")
+    status: int = Field(..., description="Código HTTP equivalente del elemento")
+    response: Optional[CalculationResponse] = Field(None, description="Resultado si el cálculo tuvo éxito")
+    error: Optional[Dict[str, Any]] = Field(None, description="Detalle del error si falló")
+
+
+class BatchCalculationResponse(BaseModel):
+    """Respuesta del cálculo por lotes"""
+    results: List[BatchItemResult] = Field(..., description="Resultados en el orden de entrada")
+    total: int = Field(..., description="Número de elementos recibidos")
+    succeeded: int = Field(..., description="Elementos calculados correctamente")
+    failed: int = Field(..., description="Elementos con error")
+    unique: int = Field(..., description="Cálculos distintos tras eliminar duplicados")
+
+
 class ValidationRequest(BaseModel):
     """Modelo para validar expresiones"""
     expression: str = Field(..., description="Expresión a validar")
@@ -88,6 +145,10 @@ class ValidationResponse(BaseModel):
     expression: str = Field(..., description="Expresión validada")
     mode: str = Field(..., description="Modo detectado/validado")
     error: Optional[str] = Field(None, description="Mensaje de error si no es válida")
+    diagnostics: Optional[List[Dict[str, Any]]] = Field(
+        None,
+        description="Problemas encontrados, con su posición (code, message, position) para señalarlos en la interfaz"
+    )
 
 
 class OperationInfo(BaseModel):
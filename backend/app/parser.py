@@ -0,0 +1,280 @@
+"""
+Parser de la gramática matemática de la calculadora
+sympify pasa el texto por parse_expr, que genera código Python y lo
+ejecuta con eval: es lento y obliga a filtrar palabras peligrosas. Este
+parser solo reconoce nuestra gramática y construye los objetos SymPy
+directamente, sin evaluar código:
+
+- números (2, 2.5, .5, 1e-3), variables (x, y2) y constantes (pi, E, I, oo)
+- + - * / ** % (módulo, como en Python) y las variantes ^ ÷ × · −
+- multiplicación implícita: 2x, 2(x + 1), (x + 1)(x - 1), x(x + 1), 2 x
+- factorial postfijo (5!) y funciones de una lista blanca: sin(x), sqrt(x),
+  log(x, 2), floor(x), Mod(10, 3)...
+
+Un nombre de varias letras seguido de '(' que no está en la lista blanca es
+un error (ParseError, un ValueError), igual que cualquier carácter fuera de
+la gramática. Las operaciones se construyen con los operadores de SymPy,
+así que el resultado es el mismo árbol (ya evaluado) que daría sympify.
+"""
+from sympy import (
+    Integer, Float, Symbol, pi, E, I, oo,
+    sin, cos, tan, cot, sec, csc, asin, acos, atan, acot,
+    sinh, cosh, tanh, asinh, acosh, atanh, sqrt, exp, log, Abs, sign,
+    factorial, floor, ceiling, Mod
+)
+from typing import List, Tuple
+from app.fast_arithmetic import OPERATOR_ALIASES
+import re
+
+_TOKEN_RE = re.compile(
+    r"\s*(?:"
+    r"(\d+\.?\d*(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?)"
+    r"|([^\W\d]\w*)"
+    r"|(\*\*|[-+*/%^()!,÷×·−])"
+    r")"
+)
+
+# Funciones permitidas (el único modo de llamar a algo desde una expresión)
+FUNCTIONS = {
+    "sin": sin, "cos": cos, "tan": tan, "cot": cot, "sec": sec, "csc": csc,
+    "asin": asin, "acos": acos, "atan": atan, "acot": acot,
+    "sinh": sinh, "cosh": cosh, "tanh": tanh, "asinh": asinh, "acosh": acosh, "atanh": atanh,
+    "sqrt": sqrt, "exp": exp, "log": log, "ln": log,
+    "abs": Abs, "Abs": Abs, "sign": sign, "factorial": factorial,
+    "floor": floor, "ceiling": ceiling, "Mod": Mod,
+}
+
+# Constantes con el mismo nombre que en SymPy (e minúscula es una variable, como en sympify)
+CONSTANTS = {"pi": pi, "E": E, "I": I, "oo": oo}
+
+# Precedencias (como Python/SymPy): + - < * / % y producto implícito < signo unario < ** (por la derecha)
+_BINARY = {"+": 1, "-": 1, "*": 2, "/": 2, "%": 2, "**": 4}
+_UNARY = 3
+
+# Límite de anidamiento: paréntesis más potencias encadenadas (cada '**' de
+# a ** b ** c anida un nivel en el árbol). Protege la recursión del parser y
+# la de SymPy, que recorre el árbol de forma recursiva
+MAX_DEPTH = 100
+
+
+class ParseError(ValueError):
+    """
+    La expresión no pertenece a la gramática; position es el índice del
+    carácter donde se detectó el error
+    """
+
+    def __init__(self, message: str, position: int):
+        super().__init__(f"{message} (posición {position + 1})")
+        self.position = position
+
+
+def tokenize(expression: str, offset: int = 0) -> List[Tuple[str, str, int]]:
+    """
+    Tokens ('num' | 'name' | 'op', texto, posición); los operadores
+    alternativos se normalizan (^ → **, ÷ → /, × → *)
+
+    offset se suma a las posiciones (lado derecho de una ecuación)
+    """
+    tokens = []
+    pos = 0
+    length = len(expression)
+    while pos < length:
+        match = _TOKEN_RE.match(expression, pos)
+        if match is None:
+            if expression[pos:].strip() == "":
+                break
+            start = length - len(expression[pos:].lstrip())
+            raise ParseError(f"Carácter no válido '{expression[start]}'", offset + start)
+        number, name, op = match.groups()
+        start = offset + match.start(match.lastindex)
+        if number is not None:
+            tokens.append(("num", number, start))
+        elif name is not None:
+            tokens.append(("name", name, start))
+        else:
+            tokens.append(("op", OPERATOR_ALIASES.get(op, op), start))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    """
+    Analizador descendente con precedencia de operadores que construye
+    la expresión SymPy mientras lee
+    """
+
+    def __init__(self, tokens: List[Tuple[str, str, int]], end: int):
+        self.tokens = tokens
+        self.end = end
+        self.pos = 0
+        self.depth = 0
+
+    def peek(self) -> Tuple[str, str, int]:
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return ("end", "", self.end)
+
+    def take(self) -> Tuple[str, str, int]:
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def expect(self, op: str):
+        kind, text, position = self.take()
+        if kind != "op" or text != op:
+            if kind == "end":
+                raise ParseError(f"Falta '{op}' al final de la expresión", position)
+            raise ParseError(f"Se esperaba '{op}' y se encontró '{text}'", position)
+
+    def parse(self):
+        if not self.tokens:
+            raise ParseError("La expresión está vacía", self.end)
+        expr = self.expression(0)
+        kind, text, position = self.peek()
+        if kind != "end":
+            if text == ")":
+                raise ParseError("Paréntesis ')' sin abrir", position)
+            raise ParseError(f"Símbolo inesperado '{text}'", position)
+        return expr
+
+    def expression(self, min_precedence: int):
+        left = self.unary()
+        while True:
+            kind, op, _ = self.peek()
+            if kind == "name" or (kind == "op" and op == "("):
+                # Multiplicación implícita (2x, 2(x + 1)): misma precedencia que '*'
+                if min_precedence > _BINARY["*"]:
+                    return left
+                left = left * self.expression(_BINARY["*"] + 1)
+                continue
+            if kind != "op":
+                return left
+            if op == "!":
+                self.pos += 1
+                left = factorial(left)
+                continue
+            precedence = _BINARY.get(op)
+            if precedence is None or precedence < min_precedence:
+                return left
+            if op == "**":
+                left = left ** self.exponent()
+                continue
+            self.pos += 1
+            right = self.expression(precedence + 1)
+            if op == "+":
+                left = left + right
+            elif op == "-":
+                left = left - right
+            elif op == "*":
+                left = left * right
+            elif op == "/":
+                left = left / right
+            else:
+                left = Mod(left, right)
+
+    def exponent(self):
+        """
+        Exponente de una cadena de potencias a ** b ** c..., asociativa por la
+        derecha: se lee en un bucle, sin un nivel de recursión por cada '**'.
+        Un signo se aplica a todo lo que queda a su derecha: 2**-3**2 = 2**(-(3**2))
+        """
+        operands = []
+        while self.peek()[:2] == ("op", "**"):
+            position = self.take()[2]
+            self.depth += 1
+            if self.depth > MAX_DEPTH:
+                raise ParseError(f"Demasiadas potencias encadenadas o paréntesis anidados (máximo {MAX_DEPTH})",
+                                 position)
+            negative = False
+            while self.peek()[0] == "op" and self.peek()[1] in ("-", "+"):
+                negative ^= self.take()[1] == "-"
+            operand = self.atom()
+            while self.peek()[:2] == ("op", "!"):
+                self.pos += 1
+                operand = factorial(operand)
+            operands.append((operand, negative))
+        self.depth -= len(operands)
+        operand, negative = operands.pop()
+        value = -operand if negative else operand
+        while operands:
+            operand, negative = operands.pop()
+            value = operand ** value
+            if negative:
+                value = -value
+        return value
+
+    def unary(self):
+        # Los signos seguidos (--x) se acumulan sin recursión
+        negative = False
+        signs = 0
+        while self.peek()[0] == "op" and self.peek()[1] in ("-", "+"):
+            negative ^= self.take()[1] == "-"
+            signs += 1
+        if not signs:
+            return self.atom()
+        operand = self.expression(_UNARY)
+        return -operand if negative else operand
+
+    def atom(self):
+        kind, text, position = self.take()
+        if kind == "num":
+            if "." in text or "e" in text or "E" in text:
+                return Float(text)
+            return Integer(text)
+        if kind == "name":
+            return self.name(text, position)
+        if kind == "op" and text == "(":
+            value = self.group(position)
+            self.expect(")")
+            return value
+        if kind == "end":
+            raise ParseError("La expresión termina de forma inesperada", position)
+        if text == ")":
+            raise ParseError("Paréntesis ')' sin abrir o vacío", position)
+        raise ParseError(f"Falta un operando antes de '{text}'", position)
+
+    def group(self, position: int):
+        self.depth += 1
+        if self.depth > MAX_DEPTH:
+            raise ParseError(f"Demasiados paréntesis anidados (máximo {MAX_DEPTH})", position)
+        value = self.expression(0)
+        self.depth -= 1
+        return value
+
+    def name(self, text: str, position: int):
+        kind, op, _ = self.peek()
+        if kind == "op" and op == "(":
+            function = FUNCTIONS.get(text)
+            if function is not None:
+                self.pos += 1
+                return self.call(text, function, position)
+            # x(x + 1) es un producto; diff(...), open(...) no son funciones conocidas
+            if len(text) > 1:
+                raise ParseError(f"Función no soportada: '{text}'", position)
+        elif text in FUNCTIONS:
+            raise ParseError(f"Falta '(' después de '{text}'", position)
+        constant = CONSTANTS.get(text)
+        if constant is not None:
+            return constant
+        return Symbol(text)
+
+    def call(self, text: str, function, position: int):
+        arguments = [self.group(position)]
+        while self.peek()[:2] == ("op", ","):
+            self.pos += 1
+            arguments.append(self.group(position))
+        self.expect(")")
+        try:
+            return function(*arguments)
+        except TypeError:
+            raise ParseError(f"Número de argumentos incorrecto para '{text}'", position)
+
+
+def parse_math(expression: str, offset: int = 0):
+    """
+    Convierte el texto en una expresión SymPy
+
+    Raises:
+        ParseError: la expresión no pertenece a la gramática
+    """
+    return _Parser(tokenize(expression, offset), offset + len(expression.rstrip())).parse()
@@ -1,17 +1,91 @@
 """
 Endpoint principal de cálculo
 """
-from fastapi import APIRouter, HTTPException, status, Depends
-from app.models import CalculationRequest, CalculationResponse
-from app.calculator_engine import CalculatorEngine
-from app.utils import sanitize_expression, log_calculation
+from fastapi import APIRouter, HTTPException, status, Depends, Response, Request
+from fastapi.responses import StreamingResponse
+from app.models import CalculationRequest, CalculationResponse, BatchCalculationRequest, BatchCalculationResponse
+from app.executor import CalculationTimeout
+from app.admission import AdmissionRejected, admission_controller
+from app.service import calculation_service
+from app.cache import make_cache_key
+from app.serialization import dumps
+from app.step_templates import step_templates, check_step_format
+from app.complexity import check_complexity
+from app.utils import sanitize_expression, log_calculation, SanitizeError
+from app.timing import StageTimer, activate, stage
+from app.metrics import latency_metrics, request_metrics
 from app.auth import auth_service
+from typing import Dict, Any, List, AsyncIterator
+import asyncio
 import logging
+import os
 
 router = APIRouter()
-calculator = CalculatorEngine()
 logger = logging.getLogger(__name__)
 
+# Exponer la duración de cada etapa en la cabecera Server-Timing (DevTools del navegador)
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "false").lower() == "true"
+
+# Límites del cálculo por lotes
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "200"))
+BATCH_DEADLINE_SECONDS = float(os.getenv("BATCH_DEADLINE_SECONDS", "30"))
+# Cálculos simultáneos de un mismo lote: por defecto la capacidad del carril
+# pesado, así un lote nunca llena la cola de admisión compartida ni deja sin
+# hueco a las peticiones interactivas; el resto de elementos espera su turno
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "0")) or admission_controller.heavy_capacity
+
+
+def _response_body(original: str, result_data: Dict[str, Any], step_format: str = "text") -> Dict[str, Any]:
+    """
+    Cuerpo de CalculationResponse como dict: los pasos ya vienen validados
+    del motor, así que no se reconstruyen los modelos Pydantic
+    """
+    body = {
+        "original": original,
+        "result": result_data["result"],
+        "steps": step_templates.format_steps(result_data["steps"], step_format),
+        "mode": result_data["mode"],
+        "error": None
+    }
+    if step_format == "compact":
+        body["templates_version"] = step_templates.version
+    if result_data.get("degraded"):
+        body["degraded"] = True
+    return body
+
+
+def _rejected_detail(e: AdmissionRejected, expression: str) -> Dict[str, Any]:
+    return {
+        "error": "Servicio saturado",
+        "message": str(e),
+        "expression": expression,
+        "mode": e.mode,
+        "retry_after": e.retry_after
+    }
+
+
+def _value_error_detail(e: ValueError, expression: str) -> Dict[str, Any]:
+    detail = {
+        "error": "Error en la expresión o cálculo",
+        "message": str(e),
+        "expression": expression
+    }
+    # Los problemas de saneamiento llevan su posición para señalarlos en la interfaz
+    if isinstance(e, SanitizeError):
+        detail["diagnostics"] = e.to_list()
+    return detail
+
+
+def _finish_timing(timer: StageTimer, mode: str, status_code: int, error_kind: str = None,
+                   endpoint: str = "calculate"):
+    """
+    Cierra la medición de la petición y la registra en las métricas por modo
+    """
+    timings = timer.as_ms()
+    latency_metrics.observe(mode, timings)
+    request_metrics.record(endpoint, mode, status_code, error_kind)
+    return timings
+
 
 @router.post(
     "/calculate",
@@ -35,6 +109,9 @@ async def calculate(request: CalculationRequest):
     - `expression`: La expresión matemática a resolver
     - `mode`: El modo de cálculo (opcional, por defecto 'auto')
     - `variables`: Diccionario de variables para sustituir (opcional)
+    - `steps`: Detalle de los pasos: `full` (por defecto), `summary` o `none`
+    - `format`: `text` (por defecto) o `compact`: cada paso lleva el id de su
+      plantilla y sus parámetros en lugar del texto (ver GET /templates)
     
     **Retorna:**
     - `original`: Expresión original
@@ -42,79 +119,503 @@ async def calculate(request: CalculationRequest):
     - `steps`: Lista de pasos explicativos
     - `mode`: Modo utilizado
     - `error`: Mensaje de error si aplica
+    - `degraded`: `true` si, por saturación o por ser demasiado larga para
+      explicarla paso a paso, solo se calculó el resultado
+    
+    Las expresiones que superan el presupuesto de coste de su modo (número de
+    elementos, paréntesis anidados, tamaño de potencias y factoriales...) se
+    rechazan con 400 antes de ejecutarse. Si el motor está saturado responde
+    503 con la cabecera `Retry-After`.
     """
+    timer = StageTimer()
+    request_metrics.in_flight += 1
+    with activate(timer):
+        try:
+            # Sanitizar expresión
+            with stage("sanitize"):
+                clean_expression = sanitize_expression(request.expression)
+                check_step_format(request.format)
+            
+            # Presupuesto de coste del modo, antes de que SymPy toque la expresión
+            with stage("complexity"):
+                steps = check_complexity(clean_expression, request.mode, request.steps)
+            
+            # Calcular con el engine (caché + pool de procesos, sin bloquear el event loop)
+            result_data = await calculation_service.calculate(
+                expression=clean_expression,
+                mode=request.mode,
+                variables=request.variables,
+                steps=steps
+            )
+            if steps != request.steps:
+                result_data = {**result_data, "degraded": True}
+            
+            # Serializar la respuesta directamente a bytes (una sola pasada)
+            with stage("response"):
+                body = dumps(_response_body(request.expression, result_data, request.format))
+            
+            # Log de la operación
+            timings = _finish_timing(timer, result_data["mode"], status.HTTP_200_OK)
+            log_calculation(
+                expression=clean_expression,
+                mode=result_data["mode"],
+                success=True,
+                timings=timings
+            )
+            
+            headers = {"Server-Timing": timer.server_timing()} if SERVER_TIMING_ENABLED else None
+            return Response(content=body, media_type="application/json", headers=headers)
+        
+        except CalculationTimeout as e:
+            # El cálculo superó el límite de tiempo de su modo
+            logger.warning(f"Cálculo cancelado por tiempo: {str(e)}")
+            log_calculation(
+                expression=request.expression,
+                mode=e.mode,
+                success=False,
+                error=str(e),
+                timings=_finish_timing(timer, e.mode, status.HTTP_408_REQUEST_TIMEOUT, "timeout")
+            )
+            
+            raise HTTPException(
+                status_code=status.HTTP_408_REQUEST_TIMEOUT,
+                detail={
+                    "error": "Tiempo de cálculo excedido",
+                    "message": str(e),
+                    "expression": request.expression,
+                    "mode": e.mode,
+                    "timeout": e.timeout
+                }
+            )
+        
+        except AdmissionRejected as e:
+            # Cola llena: rechazar enseguida para que el cliente reintente (o escale el autoscaler)
+            logger.warning(f"Petición rechazada por saturación: {str(e)}")
+            log_calculation(
+                expression=request.expression,
+                mode=e.mode,
+                success=False,
+                error=str(e),
+                timings=_finish_timing(timer, e.mode, status.HTTP_503_SERVICE_UNAVAILABLE, "rejected")
+            )
+            
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=_rejected_detail(e, request.expression),
+                headers={"Retry-After": str(e.retry_after)}
+            )
+        
+        except ValueError as e:
+            # Error de validación o cálculo conocido
+            logger.warning(f"Error en cálculo: {str(e)}")
+            log_calculation(
+                expression=request.expression,
+                mode=request.mode,
+                success=False,
+                error=str(e),
+                timings=_finish_timing(timer, request.mode, status.HTTP_400_BAD_REQUEST, "value_error")
+            )
+            
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=_value_error_detail(e, request.expression)
+            )
+        
+        except Exception as e:
+            # Error inesperado
+            logger.error(f"Error interno en cálculo: {str(e)}", exc_info=True)
+            log_calculation(
+                expression=request.expression,
+                mode=request.mode,
+                success=False,
+                error=str(e),
+                timings=_finish_timing(timer, request.mode, status.HTTP_500_INTERNAL_SERVER_ERROR, "unexpected")
+            )
+            
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail={
+                    "error": "Error interno del servidor",
+                    "message": "Ocurrió un error inesperado al procesar la solicitud"
+                }
+            )
+        
+        finally:
+            request_metrics.in_flight -= 1
+
+
+async def _calculate_batch_item(item: CalculationRequest, clean_expression: str, steps: str,
+                                turn: asyncio.Semaphore, started: set) -> Dict[str, Any]:
+    """
+    Calcula un elemento del lote cuando le llega el turno (`turn`); los
+    errores se devuelven, no se lanzan, para que un elemento inválido no
+    haga fallar todo el lote
+    """
+    async with turn:
+        started.add(asyncio.current_task())
+        return await _run_batch_item(item, clean_expression, steps)
+
+
+async def _run_batch_item(item: CalculationRequest, clean_expression: str, steps: str) -> Dict[str, Any]:
+    timer = StageTimer()
+    with activate(timer):
+        try:
+            result_data = await calculation_service.calculate(
+                expression=clean_expression,
+                mode=item.mode,
+                variables=item.variables,
+                steps=steps
+            )
+            if steps != item.steps:
+                result_data = {**result_data, "degraded": True}
+            log_calculation(
+                expression=clean_expression,
+                mode=result_data["mode"],
+                success=True,
+                timings=_finish_timing(timer, result_data["mode"], status.HTTP_200_OK, endpoint="batch")
+            )
+            return {"status": status.HTTP_200_OK, "data": result_data}
+        
+        except CalculationTimeout as e:
+            log_calculation(
+                expression=clean_expression,
+                mode=e.mode,
+                success=False,
+                error=str(e),
+                timings=_finish_timing(timer, e.mode, status.HTTP_408_REQUEST_TIMEOUT, "timeout", endpoint="batch")
+            )
+            return {
+                "status": status.HTTP_408_REQUEST_TIMEOUT,
+                "error": {
+                    "error": "Tiempo de cálculo excedido",
+                    "message": str(e),
+                    "mode": e.mode,
+                    "timeout": e.timeout
+                }
+            }
+        
+        except AdmissionRejected as e:
+            log_calculation(
+                expression=clean_expression,
+                mode=e.mode,
+                success=False,
+                error=str(e),
+                timings=_finish_timing(
+                    timer, e.mode, status.HTTP_503_SERVICE_UNAVAILABLE, "rejected", endpoint="batch"
+                )
+            )
+            return {
+                "status": status.HTTP_503_SERVICE_UNAVAILABLE,
+                "error": {
+                    "error": "Servicio saturado",
+                    "message": str(e),
+                    "mode": e.mode,
+                    "retry_after": e.retry_after
+                }
+            }
+        
+        except ValueError as e:
+            log_calculation(
+                expression=clean_expression,
+                mode=item.mode,
+                success=False,
+                error=str(e),
+                timings=_finish_timing(timer, item.mode, status.HTTP_400_BAD_REQUEST, "value_error", endpoint="batch")
+            )
+            return {
+                "status": status.HTTP_400_BAD_REQUEST,
+                "error": {"error": "Error en la expresión o cálculo", "message": str(e)}
+            }
+        
+        except Exception as e:
+            logger.error(f"Error interno en cálculo por lotes: {str(e)}", exc_info=True)
+            log_calculation(
+                expression=clean_expression,
+                mode=item.mode,
+                success=False,
+                error=str(e),
+                timings=_finish_timing(
+                    timer, item.mode, status.HTTP_500_INTERNAL_SERVER_ERROR, "unexpected", endpoint="batch"
+                )
+            )
+            return {
+                "status": status.HTTP_500_INTERNAL_SERVER_ERROR,
+                "error": {
+                    "error": "Error interno del servidor",
+                    "message": "Ocurrió un error inesperado al procesar la solicitud"
+                }
+            }
+
+
+def _discard_result(task: asyncio.Task):
+    # Los cálculos que superan el plazo del lote siguen y llenan la caché;
+    # recuperar su resultado evita el aviso "exception was never retrieved"
+    if not task.cancelled():
+        task.exception()
+
+
+@router.post(
+    "/calculate/batch",
+    response_model=BatchCalculationResponse,
+    tags=["calculate"],
+)
+async def calculate_batch(request: BatchCalculationRequest):
+    """
+    Resuelve varias expresiones en una sola petición
+    
+    Los cálculos se reparten en paralelo entre los procesos del motor (como
+    mucho `BATCH_CONCURRENCY` a la vez; el resto espera su turno) y las
+    expresiones repetidas dentro del lote se calculan una sola vez.
+    
+    **Límites:**
+    - Máximo `BATCH_MAX_ITEMS` elementos por lote (413 si se supera)
+    - Plazo total `BATCH_DEADLINE_SECONDS`: los elementos sin terminar se
+      devuelven con estado 408
+    
+    **Retorna:** un resultado por elemento, en el mismo orden de la solicitud,
+    con `response` si tuvo éxito o `error` si falló
+    """
+    items = request.items
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail={
+                "error": "Lote demasiado grande",
+                "message": f"El lote tiene {len(items)} elementos; el máximo es {BATCH_MAX_ITEMS}",
+                "max_items": BATCH_MAX_ITEMS
+            }
+        )
+    
+    outcomes: List[Dict[str, Any]] = [None] * len(items)
+    tasks: Dict[str, asyncio.Task] = {}
+    task_indices: Dict[str, List[int]] = {}
+    turn = asyncio.Semaphore(BATCH_CONCURRENCY)
+    started = set()
+    
+    for index, item in enumerate(items):
+        try:
+            clean_expression = sanitize_expression(item.expression)
+            check_step_format(item.format)
+            steps = check_complexity(clean_expression, item.mode, item.steps)
+        except ValueError as e:
+            request_metrics.record("batch", item.mode, status.HTTP_400_BAD_REQUEST, "value_error")
+            outcomes[index] = {
+                "status": status.HTTP_400_BAD_REQUEST,
+                "error": {"error": "Error en la expresión o cálculo", "message": str(e)}
+            }
+            continue
+        
+        # Un solo cálculo por expresión distinta dentro del lote
+        key = make_cache_key(clean_expression, item.mode, item.variables, item.steps)
+        if key not in tasks:
+            tasks[key] = asyncio.create_task(_calculate_batch_item(item, clean_expression, steps, turn, started))
+            task_indices[key] = []
+        task_indices[key].append(index)
+    
+    request_metrics.in_flight += 1
     try:
-        # Sanitizar expresión
-        clean_expression = sanitize_expression(request.expression)
+        if tasks:
+            await asyncio.wait(tasks.values(), timeout=BATCH_DEADLINE_SECONDS)
+    finally:
+        request_metrics.in_flight -= 1
+    
+    for key, task in tasks.items():
+        if task.done():
+            outcome = task.result()
+        else:
+            if task in started:
+                task.add_done_callback(_discard_result)
+            else:
+                # Aún esperaba su turno: no se empieza un cálculo que nadie recogerá
+                task.cancel()
+            outcome = {
+                "status": status.HTTP_408_REQUEST_TIMEOUT,
+                "error": {
+                    "error": "Tiempo de cálculo excedido",
+                    "message": f"El lote superó el plazo de {BATCH_DEADLINE_SECONDS:g} segundos",
+                    "timeout": BATCH_DEADLINE_SECONDS
+                }
+            }
+        for index in task_indices[key]:
+            outcomes[index] = outcome
+    
+    # Misma forma que BatchCalculationResponse, serializada sin reconstruir modelos
+    results = []
+    succeeded = 0
+    for index, (item, outcome) in enumerate(zip(items, outcomes)):
+        data = outcome.get("data")
+        response = None
+        if data is not None:
+            response = _response_body(item.expression, data, item.format)
+            succeeded += 1
+        error = outcome.get("error")
+        if error is not None:
+            error = {**error, "expression": item.expression}
+        results.append({"index": index, "status": outcome["status"], "response": response, "error": error})
+    
+    return Response(content=dumps({
+        "results": results,
+        "total": len(items),
+        "succeeded": succeeded,
+        "failed": len(items) - succeeded,
+        "unique": len(tasks)
+    }), media_type="application/json")
+
+
+def _stream_event(event: str, data: Dict[str, Any], sse: bool) -> bytes:
+    """
+    Serializa un evento como línea NDJSON o como evento SSE
+    """
+    if sse:
+        return b"event: " + event.encode("utf-8") + b"\ndata: " + dumps(data) + b"\n\n"
+    return dumps({"event": event, **data}) + b"\n"
+
+
+async def _stream_calculation(request: CalculationRequest, clean_expression: str, steps: str,
+                              sse: bool) -> AsyncIterator[bytes]:
+    """
+    Genera los eventos de un cálculo en streaming: start, step..., result o error
+    """
+    timer = StageTimer()
+    mode = request.mode
+    request_metrics.in_flight += 1
+    try:
+        start = {"original": request.expression, "mode": request.mode}
+        if request.format == "compact":
+            start["templates_version"] = step_templates.version
+        if steps != request.steps:
+            start["degraded"] = True
+        yield _stream_event("start", start, sse)
         
-        # Calcular con el engine
-        result_data = calculator.calculate(
+        async for event, data in calculation_service.stream(
             expression=clean_expression,
             mode=request.mode,
-            variables=request.variables
-        )
+            variables=request.variables,
+            steps=steps
+        ):
+            if event == "step":
+                yield _stream_event("step", {"step": step_templates.format_step(data, request.format)}, sse)
+            else:
+                mode = data["mode"]
+                yield _stream_event("result", {
+                    "original": request.expression,
+                    "result": data["result"],
+                    "mode": data["mode"],
+                    "steps_count": len(data["steps"])
+                }, sse)
         
-        # Log de la operación
         log_calculation(
             expression=clean_expression,
-            mode=result_data["mode"],
-            success=True
+            mode=mode,
+            success=True,
+            timings=_finish_timing(timer, mode, status.HTTP_200_OK, endpoint="stream")
         )
-        
-        # Construir respuesta
-        response = CalculationResponse(
-            original=request.expression,
-            result=result_data["result"],
-            steps=result_data["steps"],
-            mode=result_data["mode"],
-            error=None
+    
+    except CalculationTimeout as e:
+        logger.warning(f"Cálculo cancelado por tiempo: {str(e)}")
+        log_calculation(
+            expression=clean_expression,
+            mode=e.mode,
+            success=False,
+            error=str(e),
+            timings=_finish_timing(timer, e.mode, status.HTTP_408_REQUEST_TIMEOUT, "timeout", endpoint="stream")
         )
-        
-        return response
+        yield _stream_event("error", {
+            "status": status.HTTP_408_REQUEST_TIMEOUT,
+            "detail": {
+                "error": "Tiempo de cálculo excedido",
+                "message": str(e),
+                "expression": request.expression,
+                "mode": e.mode,
+                "timeout": e.timeout
+            }
+        }, sse)
+    
+    except AdmissionRejected as e:
+        logger.warning(f"Petición rechazada por saturación: {str(e)}")
+        log_calculation(
+            expression=clean_expression,
+            mode=e.mode,
+            success=False,
+            error=str(e),
+            timings=_finish_timing(timer, e.mode, status.HTTP_503_SERVICE_UNAVAILABLE, "rejected", endpoint="stream")
+        )
+        yield _stream_event("error", {
+            "status": status.HTTP_503_SERVICE_UNAVAILABLE,
+            "detail": _rejected_detail(e, request.expression)
+        }, sse)
     
     except ValueError as e:
-        # Error de validación o cálculo conocido
         logger.warning(f"Error en cálculo: {str(e)}")
         log_calculation(
-            expression=request.expression,
-            mode=request.mode,
+            expression=clean_expression,
+            mode=mode,
             success=False,
-            error=str(e)
+            error=str(e),
+            timings=_finish_timing(timer, mode, status.HTTP_400_BAD_REQUEST, "value_error", endpoint="stream")
         )
-        
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail={
+        yield _stream_event("error", {
+            "status": status.HTTP_400_BAD_REQUEST,
+            "detail": {
                 "error": "Error en la expresión o cálculo",
                 "message": str(e),
                 "expression": request.expression
             }
-        )
+        }, sse)
     
     except Exception as e:
-        # Error inesperado
         logger.error(f"Error interno en cálculo: {str(e)}", exc_info=True)
         log_calculation(
-            expression=request.expression,
-            mode=request.mode,
+            expression=clean_expression,
+            mode=mode,
             success=False,
-            error=str(e)
+            error=str(e),
+            timings=_finish_timing(
+                timer, mode, status.HTTP_500_INTERNAL_SERVER_ERROR, "unexpected", endpoint="stream"
+            )
         )
-        
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail={
+        yield _stream_event("error", {
+            "status": status.HTTP_500_INTERNAL_SERVER_ERROR,
+            "detail": {
                 "error": "Error interno del servidor",
                 "message": "Ocurrió un error inesperado al procesar la solicitud"
             }
-        )
-
-
-
-
-
-
-
-
+        }, sse)
+    
+    finally:
+        request_metrics.in_flight -= 1
 
 
+@router.post("/calculate/stream", tags=["calculate"])
+async def calculate_stream(request: CalculationRequest, http_request: Request):
+    """
+    Variante de `/calculate` que envía cada paso en cuanto se produce
+    
+    En los modos lentos (ecuaciones, derivadas, integrales) los primeros
+    pasos llegan en milisegundos aunque SymPy tarde segundos en terminar.
+    
+    **Formato** (según la cabecera `Accept`):
+    - `text/event-stream`: Server-Sent Events (`event: step`, `data: {...}`)
+    - cualquier otro: NDJSON, un objeto JSON por línea con el campo `event`
+    
+    **Eventos:** `start`, un `step` por paso, y al final `result` o `error`
+    (con `status` y el mismo `detail` que devolvería `/calculate`)
+    """
+    try:
+        clean_expression = sanitize_expression(request.expression)
+        check_step_format(request.format)
+        steps = check_complexity(clean_expression, request.mode, request.steps)
+    except ValueError as e:
+        request_metrics.record("stream", request.mode, status.HTTP_400_BAD_REQUEST, "value_error")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=_value_error_detail(e, request.expression)
+        )
+    
+    sse = "text/event-stream" in http_request.headers.get("accept", "")
+    return StreamingResponse(
+        _stream_calculation(request, clean_expression, steps, sse),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        # Evitar que proxies (nginx, Cloud Run) acumulen la respuesta
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,80 +1,147 @@
 """
-Endpoints de información: health, operations
+Endpoints de información: health, operations, stats, templates
 """
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from app.models import HealthResponse, OperationInfo
+from app.service import calculation_service
+from app.serialization import dumps
+from app.step_templates import step_templates
+from app.compression import PrecompressedBody
+from app.startup import startup_state
+from app.complexity import complexity_estimator
 from typing import List
 import os
 
 router = APIRouter()
 
+# Las respuestas de estos endpoints no cambian mientras el proceso vive:
+# se serializan (y comprimen) una sola vez al importar el módulo
+STATIC_MAX_AGE = os.getenv("STATIC_MAX_AGE", "3600")
+_PUBLIC_CACHE = f"public, max-age={STATIC_MAX_AGE}"
+
+# /health se revalida siempre (no-cache): cada sondeo es un 304 sin cuerpo,
+# pero nunca se sirve una copia guardada por un proxy
+_HEALTH_BODY = PrecompressedBody(
+    dumps(HealthResponse(
+        status="ok",
+        version="1.0.0",
+        environment=os.getenv("ENVIRONMENT", "development")
+    ).model_dump()),
+    cache_control="no-cache"
+)
+
 
 @router.get("/health", response_model=HealthResponse, tags=["info"])
-async def health_check():
+async def health_check(request: Request):
     """
     Health check endpoint - verifica que el servicio esté funcionando
     """
-    return HealthResponse(
-        status="ok",
-        version="1.0.0",
-        environment=os.getenv("ENVIRONMENT", "development")
+    return _HEALTH_BODY.response(request)
+
+
+# Operaciones soportadas
+OPERATIONS = [
+    OperationInfo(
+        type="arithmetic",
+        name="Aritmética Básica",
+        description="Operaciones numéricas: suma, resta, multiplicación, división, potencias",
+        examples=["2 + 3 * 4", "(10 - 5) / 2", "2**8"]
+    ),
+    OperationInfo(
+        type="algebra",
+        name="Álgebra",
+        description="Simplificación y expansión de expresiones algebraicas",
+        examples=["2*(x + 3) - 4", "(x + 2)**2", "x**2 - 4"]
+    ),
+    OperationInfo(
+        type="solve",
+        name="Resolver Ecuaciones",
+        description="Resolución de ecuaciones lineales y cuadráticas",
+        examples=["2*x + 5 = 15", "x**2 - 4 = 0", "3*x - 7 = 2*x + 3"]
+    ),
+    OperationInfo(
+        type="derivative",
+        name="Derivadas",
+        description="Cálculo de derivadas de funciones",
+        examples=["x**2 + 3*x", "sin(x)", "x**3 - 2*x + 1"]
+    ),
+    OperationInfo(
+        type="integral",
+        name="Integrales",
+        description="Cálculo de integrales indefinidas",
+        examples=["x**2", "2*x + 1", "sin(x)"]
     )
+]
+
+_OPERATIONS_BODY = PrecompressedBody(
+    dumps([operation.model_dump() for operation in OPERATIONS]),
+    cache_control=_PUBLIC_CACHE
+)
 
 
 @router.get("/operations", response_model=List[OperationInfo], tags=["info"])
-async def get_operations():
+async def get_operations(request: Request):
     """
     Lista todas las operaciones matemáticas soportadas
     """
-    operations = [
-        OperationInfo(
-            type="arithmetic",
-            name="Aritmética Básica",
-            description="Operaciones numéricas: suma, resta, multiplicación, división, potencias",
-            examples=["2 + 3 * 4", "(10 - 5) / 2", "2**8"]
-        ),
-        OperationInfo(
-            type="algebra",
-            name="Álgebra",
-            description="Simplificación y expansión de expresiones algebraicas",
-            examples=["2*(x + 3) - 4", "(x + 2)**2", "x**2 - 4"]
-        ),
-        OperationInfo(
-            type="solve",
-            name="Resolver Ecuaciones",
-            description="Resolución de ecuaciones lineales y cuadráticas",
-            examples=["2*x + 5 = 15", "x**2 - 4 = 0", "3*x - 7 = 2*x + 3"]
-        ),
-        OperationInfo(
-            type="derivative",
-            name="Derivadas",
-            description="Cálculo de derivadas de funciones",
-            examples=["x**2 + 3*x", "sin(x)", "x**3 - 2*x + 1"]
-        ),
-        OperationInfo(
-            type="integral",
-            name="Integrales",
-            description="Cálculo de integrales indefinidas",
-            examples=["x**2", "2*x + 1", "sin(x)"]
-        )
-    ]
-    
-    return operations
+    return _OPERATIONS_BODY.response(request)
 
 
-@router.get("/", tags=["info"])
-async def root():
+@router.get("/stats", tags=["info"])
+async def get_stats():
     """
-    Endpoint raíz - información básica de la API
+    Estadísticas internas del servicio de cálculo (caché, pool de procesos,
+    presupuestos de coste, arranque)
     """
     return {
+        **calculation_service.stats(),
+        "complexity": complexity_estimator.stats(),
+        "startup": startup_state.stats()
+    }
+
+
+# El ETag del catálogo es su versión, la misma que llevan las respuestas compactas
+_TEMPLATES_BODY = PrecompressedBody(
+    dumps(step_templates.to_dict()),
+    cache_control=f"public, max-age={os.getenv('TEMPLATES_MAX_AGE', '86400')}",
+    etag=f'"{step_templates.version}"'
+)
+
+
+@router.get("/templates", tags=["info"])
+async def get_templates(request: Request):
+    """
+    Catálogo de plantillas de pasos para el formato `compact`
+    
+    Cada plantilla tiene `description` y `detail` con parámetros `{nombre}`
+    que se sustituyen con los `params` del paso. El campo `version` coincide
+    con `templates_version` de las respuestas compactas; si cambia, el
+    cliente debe volver a descargar el catálogo. Responde 304 si la cabecera
+    `If-None-Match` trae la versión vigente.
+    """
+    return _TEMPLATES_BODY.response(request)
+
+
+_ROOT_BODY = PrecompressedBody(
+    dumps({
         "app": "EduCalc Backend API",
         "version": "1.0.0",
         "description": "Backend para calculadora educativa con explicaciones paso a paso",
         "docs": "/docs",
         "health": "/health",
-        "operations": "/operations"
-    }
+        "operations": "/operations",
+        "templates": "/templates"
+    }),
+    cache_control=_PUBLIC_CACHE
+)
+
+
+@router.get("/", tags=["info"])
+async def root(request: Request):
+    """
+    Endpoint raíz - información básica de la API
+    """
+    return _ROOT_BODY.response(request)
 
 
 
@@ -3,12 +3,12 @@ Endpoint de validación de expresiones
 """
 from fastapi import APIRouter, HTTPException, status
 from app.models import ValidationRequest, ValidationResponse
-from app.calculator_engine import CalculatorEngine
-from app.utils import sanitize_expression
+from app.executor import engine_executor
+from app.utils import sanitize_expression, SanitizeError
+from app.complexity import check_complexity
 import logging
 
 router = APIRouter()
-calculator = CalculatorEngine()
 logger = logging.getLogger(__name__)
 
 
@@ -18,20 +18,31 @@ async def validate_expression(request: ValidationRequest):
     Valida una expresión matemática sin resolverla
     
     - Verifica que la expresión sea parseable
-    - Comprueba que no contenga código malicioso
+    - Comprueba que no contenga código malicioso ni caracteres fuera de la gramática
+    - Devuelve los problemas con su posición (`diagnostics`)
+    - Comprueba el presupuesto de coste de su modo
     - Detecta el modo apropiado si no se especifica
     """
     try:
         # Sanitizar expresión
         clean_expression = sanitize_expression(request.expression)
         
+        # Presupuesto de coste: SymPy evaluaría 9**9**9**9 al parsear
+        check_complexity(clean_expression, request.mode)
+        
+        # Motor compartido del proceso (SymPy se importa con el primer uso)
+        calculator = await engine_executor.get_engine()
+        
+        # Parsear una sola vez y compartir el resultado
+        parsed = calculator.parse(clean_expression)
+        
         # Detectar modo si es auto
         mode = request.mode
         if mode == "auto":
-            mode = calculator._detect_mode(clean_expression)
+            mode = calculator._detect_mode(clean_expression, parsed)
         
         # Validar con el engine
-        is_valid = calculator.validate_expression(clean_expression, mode)
+        is_valid = calculator.validate_expression(clean_expression, mode, parsed=parsed)
         
         if is_valid:
             return ValidationResponse(
@@ -41,13 +52,29 @@ async def validate_expression(request: ValidationRequest):
                 error=None
             )
         else:
+            # Los errores del parser traen la posición donde se detectaron
+            position = getattr(parsed.error, "position", None)
+            diagnostics = None
+            if position is not None:
+                diagnostics = [{"code": "syntax", "message": str(parsed.error), "position": position}]
             return ValidationResponse(
                 valid=False,
                 expression=request.expression,
                 mode=mode,
-                error="La expresión no es válida o no se puede parsear"
+                error="La expresión no es válida o no se puede parsear",
+                diagnostics=diagnostics
             )
     
+    except SanitizeError as e:
+        # Saneamiento: todos los problemas con su posición
+        return ValidationResponse(
+            valid=False,
+            expression=request.expression,
+            mode=request.mode,
+            error=str(e),
+            diagnostics=e.to_list()
+        )
+    
     except ValueError as e:
         # Error de validación conocido
         logger.warning(f"Validación fallida: {str(e)}")
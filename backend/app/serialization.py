@@ -0,0 +1,33 @@
+"""
+Serialización JSON de las respuestas
+Los pasos se validan una sola vez (al construir cada Step en el motor) y
+viajan como dicts; aquí se convierten directamente a bytes, sin volver a
+pasar por los modelos Pydantic ni por el response_model de FastAPI.
+
+Usa orjson si está instalado y, si no, el módulo json estándar.
+"""
+from typing import Any
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson es opcional
+    orjson = None
+
+
+def dumps(data: Any) -> bytes:
+    """
+    Serializa a JSON en UTF-8 (sin escapar acentos ni emojis)
+    """
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data) -> Any:
+    """
+    Deserializa JSON desde str o bytes
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
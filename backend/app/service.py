@@ -0,0 +1,202 @@
+"""
+Servicio de cálculo: une la caché de resultados con el pool del motor
+Las rutas llaman aquí en lugar de usar el CalculatorEngine directamente
+"""
+from typing import Dict, Any, Optional, AsyncIterator, Tuple
+from app.cache import result_cache, shared_result_cache, make_cache_key
+from app.executor import engine_executor
+from app.admission import admission_controller
+from app.metrics import latency_metrics
+from app.timing import stage
+import asyncio
+
+
+class CalculationService:
+    """
+    Orquesta una petición de cálculo:
+    caché en memoria → caché compartida → control de admisión → pool de procesos
+
+    La aritmética pura se resuelve en el propio proceso (carril rápido) sin
+    esperar en la cola ni en el pool detrás de cálculos simbólicos
+    """
+
+    def __init__(self, cache=result_cache, shared_cache=shared_result_cache, executor=engine_executor,
+                 admission=admission_controller):
+        self.cache = cache
+        self.shared_cache = shared_cache
+        self.executor = executor
+        self.admission = admission
+        # Cálculos en curso por clave: peticiones idénticas esperan el mismo futuro
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def calculate(self, expression: str, mode: str = "auto", variables: Optional[Dict] = None,
+                        steps: str = "full") -> Dict[str, Any]:
+        """
+        Calcula una expresión ya sanitizada, reutilizando resultados previos
+        """
+        with stage("cache"):
+            key = make_cache_key(expression, mode, variables, steps)
+            cached = self.cache.get(key)
+            if cached is None:
+                cached = self.shared_cache.get(key)
+                if cached is not None:
+                    self.cache.set(key, cached)
+        if cached is not None:
+            return cached
+
+        # Single-flight: si ya hay un cálculo idéntico en curso, esperar su resultado
+        if key in self._in_flight:
+            with stage("coalesced"):
+                cached = await self._await_in_flight(key)
+            if cached is not None:
+                return cached
+
+        # Carril rápido: la aritmética pura no espera en la cola ni en el pool
+        lane = self.admission.classify(expression, mode)
+        if lane == "fast" and self.executor.inline_eligible(expression, mode, variables):
+            result = self.executor.calculate_inline(expression=expression, mode=mode, variables=variables,
+                                                    steps=steps)
+            self.admission.inline += 1
+            self._store(key, expression, mode, variables, steps, result)
+            return result
+
+        # Bajo presión, las peticiones con pasos completos se resuelven solo con el resultado
+        if steps == "full" and self.admission.should_degrade():
+            result = await self.calculate(expression=expression, mode=mode, variables=variables, steps="summary")
+            self.admission.degraded += 1
+            return {**result, "degraded": True}
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            async with self.admission.slot(mode, lane):
+                result = await self.executor.calculate(expression=expression, mode=mode, variables=variables,
+                                                       steps=steps)
+        except BaseException as e:
+            if isinstance(e, Exception):
+                future.set_exception(e)
+                # Evitar el aviso "exception was never retrieved" si nadie esperaba
+                future.exception()
+            else:
+                future.cancel()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+        self._store(key, expression, mode, variables, steps, result)
+        return result
+
+    async def stream(self, expression: str, mode: str = "auto",
+                     variables: Optional[Dict] = None, steps: str = "full") -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Variante en streaming de calculate: entrega ("step", paso) a medida
+        que se producen y termina con ("result", resultado)
+
+        Un resultado en caché o un cálculo idéntico en curso se entregan
+        completos; un cálculo nuevo queda registrado como en curso para que
+        las peticiones normales idénticas lo esperen
+        """
+        with stage("cache"):
+            key = make_cache_key(expression, mode, variables, steps)
+            cached = self.cache.get(key)
+            if cached is None:
+                cached = self.shared_cache.get(key)
+                if cached is not None:
+                    self.cache.set(key, cached)
+
+        if cached is None:
+            cached = await self._await_in_flight(key)
+
+        if cached is not None:
+            for step in cached["steps"]:
+                yield "step", step
+            yield "result", cached
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            async with self.admission.slot(mode, self.admission.classify(expression, mode)):
+                async for event, data in self.executor.stream(expression=expression, mode=mode,
+                                                              variables=variables, steps=steps):
+                    if event == "result":
+                        result = data
+                    else:
+                        yield event, data
+        except BaseException as e:
+            # Incluye GeneratorExit: el cliente cerró la conexión antes de terminar
+            if isinstance(e, Exception):
+                future.set_exception(e)
+                future.exception()
+            else:
+                future.cancel()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+        self._store(key, expression, mode, variables, steps, result)
+        yield "result", result
+
+    async def _await_in_flight(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Espera un cálculo idéntico en curso; None si no hay ninguno o si
+        quien lo inició lo abandonó (p. ej. un stream cuyo cliente se desconectó)
+        """
+        in_flight = self._in_flight.get(key)
+        if in_flight is None:
+            return None
+        self.coalesced += 1
+        try:
+            return await asyncio.shield(in_flight)
+        except asyncio.CancelledError:
+            if not in_flight.cancelled():
+                # La cancelada es esta petición, no el cálculo compartido
+                raise
+            return None
+
+    def _store(self, key: str, expression: str, mode: str, variables: Optional[Dict], steps: str,
+               result: Dict[str, Any]):
+        keys = [key]
+        if mode == "auto":
+            # Guardar también con el modo resuelto: "auto" y el modo explícito comparten entrada
+            keys.append(make_cache_key(expression, result["mode"], variables, steps))
+        for k in keys:
+            self.cache.set(k, result)
+        if self.shared_cache.enabled:
+            asyncio.get_running_loop().run_in_executor(None, self._store_shared, keys, result)
+
+    def _store_shared(self, keys, result: Dict[str, Any]):
+        for k in keys:
+            self.shared_cache.set(k, result)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Estadísticas del servicio para introspección
+        """
+        return {
+            "cache": self.cache.stats(),
+            "shared_cache": self.shared_cache.stats(),
+            "coalescing": {
+                "coalesced": self.coalesced,
+                "in_flight": len(self._in_flight)
+            },
+            "engine": {
+                "workers": self.executor.max_workers,
+                "timeouts": self.executor.timeouts,
+                "recycled_pools": self.executor.recycled_pools
+            },
+            "admission": self.admission.stats(),
+            "memory": self.executor.memory_stats(),
+            "latency_ms": latency_metrics.stats()
+        }
+
+
+# Instancia global
+calculation_service = CalculationService()
@@ -0,0 +1,130 @@
+"""
+Arranque del servicio y señal de readiness
+El proceso responde /health y /operations en cuanto importa los módulos;
+SymPy (motor del proceso y workers del pool) se carga después, según
+ENGINE_PRELOAD:
+
+- background (por defecto): se carga en segundo plano tras el arranque;
+  GET /ready responde 503 hasta que termina
+- eager: el arranque espera a que todo esté cargado (comportamiento clásico)
+- lazy: no se precarga nada; cada parte se carga con su primer uso
+
+Con ENGINE_WARMUP=true (por defecto) la precarga además resuelve los
+ejemplos de /operations en cada worker del pool y parsea los mismos
+ejemplos en el motor del proceso, para que la primera petición real no
+pague la construcción de las tablas internas de SymPy.
+"""
+from typing import Dict, Any, Optional, List, Tuple
+from app.executor import engine_executor
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+ENGINE_PRELOAD_MODES = ("background", "eager", "lazy")
+
+
+class StartupState:
+    """
+    Fases del arranque con su duración y estado de readiness
+    """
+
+    def __init__(self):
+        self.preload = os.getenv("ENGINE_PRELOAD", "background").lower()
+        if self.preload not in ENGINE_PRELOAD_MODES:
+            logger.warning(f"ENGINE_PRELOAD desconocido: {self.preload}, se usa 'background'")
+            self.preload = "background"
+        self.warmup = os.getenv("ENGINE_WARMUP", "true").lower() == "true"
+        self.warmup_timeout = float(os.getenv("ENGINE_WARMUP_TIMEOUT", "60"))
+        self.ready = False
+        self.error: Optional[str] = None
+        self.warmup_ms: Dict[int, Dict[str, float]] = {}
+        self.phases: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, phase: str, seconds: float):
+        self.phases[phase] = seconds
+        logger.info(f"Arranque: {phase} en {seconds * 1000:.0f} ms")
+
+    async def _phase(self, phase: str, coroutine):
+        started = time.perf_counter()
+        result = await coroutine
+        self.record(phase, time.perf_counter() - started)
+        return result
+
+    @staticmethod
+    def warmup_corpus() -> List[Tuple[str, str]]:
+        """
+        Pares (expresión, modo): los ejemplos de /operations, que son además
+        los que la interfaz ofrece para probar
+        """
+        from app.routes.info import OPERATIONS
+        return [(example, operation.type) for operation in OPERATIONS for example in operation.examples]
+
+    async def _warm_up(self):
+        corpus = self.warmup_corpus()
+        try:
+            self.warmup_ms = await asyncio.wait_for(engine_executor.warm_up(corpus), timeout=self.warmup_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Calentamiento incompleto tras {self.warmup_timeout:g} s; se continúa sin esperar")
+            return
+        for pid, timings in self.warmup_ms.items():
+            detail = ", ".join(f"{mode} {ms:.0f} ms" for mode, ms in timings.items())
+            logger.info(f"Calentamiento del proceso {pid}: {detail}")
+
+        # Validación: parseo y detección de modo en el motor del proceso
+        engine = await engine_executor.get_engine()
+
+        def parse_corpus():
+            for expression, _ in corpus:
+                engine._detect_mode(expression, engine.parse(expression))
+
+        await asyncio.get_running_loop().run_in_executor(None, parse_corpus)
+
+    async def load(self):
+        """
+        Carga el motor del proceso, arranca los workers del pool y los calienta
+        """
+        started = time.perf_counter()
+        try:
+            await self._phase("engine", engine_executor.get_engine())
+            await self._phase("pool", engine_executor.prestart())
+            if self.warmup:
+                await self._phase("warmup", self._warm_up())
+        except Exception as e:
+            # El servicio sigue funcionando: cada parte se cargará con su primer uso
+            logger.error(f"Error en la precarga del motor: {str(e)}", exc_info=True)
+            self.error = str(e)
+        self.record("ready", time.perf_counter() - started)
+        self.ready = True
+
+    async def start(self):
+        """
+        Se llama en el startup de la app, según ENGINE_PRELOAD
+        """
+        if self.preload == "eager":
+            await self.load()
+        elif self.preload == "background":
+            self._task = asyncio.create_task(self.load())
+        else:
+            self.ready = True
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "preload": self.preload,
+            "engine_loaded": engine_executor.engine_loaded,
+            "phases_ms": {phase: round(seconds * 1000, 1) for phase, seconds in self.phases.items()},
+            "warmup_ms": {str(pid): timings for pid, timings in self.warmup_ms.items()},
+            "error": self.error
+        }
+
+
+# Instancia global
+startup_state = StartupState()
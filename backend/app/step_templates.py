@@ -0,0 +1,287 @@
+"""
+Plantillas de pasos para el formato compacto de respuesta
+La mayor parte de cada respuesta es texto explicativo que se repite igual
+en todos los cálculos de un modo (PEMDAS, "¿Qué es una derivada?", "+ C"...).
+Con `format: "compact"` cada paso viaja como id de plantilla + parámetros y
+el cliente reconstruye el texto con el catálogo de GET /templates, que
+descarga una sola vez.
+
+El motor construye cada paso con `step_templates.step(...)`, que escribe
+la descripción y el detalle a partir de la plantilla y guarda su id y sus
+parámetros en el paso; los pasos sin plantilla (división larga, resumen)
+viajan siempre con el texto completo.
+"""
+from typing import Dict, Any, List, Optional, Tuple
+import hashlib
+import json
+import re
+
+from app.models import Step
+
+# Formatos de los pasos en la respuesta
+STEP_FORMATS = ("text", "compact")
+
+# (id, descripción, detalle). Los parámetros se escriben como {nombre};
+# un mismo parámetro puede aparecer varias veces con el mismo valor.
+_TEMPLATES: Tuple[Tuple[str, str, str], ...] = (
+    # Aritmética compuesta
+    ("arithmetic.intro", "💡 Expresión original",
+     "Vamos a resolver esta expresión matemática paso a paso, siguiendo el orden correcto de operaciones."),
+    ("arithmetic.pemdas", "📋 Orden de operaciones (PEMDAS)",
+     "Seguimos el orden PEMDAS:\n\n1️⃣ Paréntesis\n2️⃣ Exponentes\n3️⃣ Multiplicación/División (izquierda a derecha)\n4️⃣ Suma/Resta (izquierda a derecha)"),
+    ("arithmetic.step_by_step", "✏️ Resolver paso a paso",
+     "Aplicamos el orden PEMDAS para resolver la expresión."),
+    ("arithmetic.remaining", "⏩ Resolver el resto de operaciones",
+     "Seguimos aplicando el mismo orden (PEMDAS) con las operaciones restantes."),
+    ("arithmetic.parentheses", "🔧 Resolver paréntesis",
+     "Resolvemos primero lo que está dentro de los paréntesis:\n{operation}"),
+    ("arithmetic.power", "⬆️ Resolver potencia",
+     "Después de los paréntesis van los exponentes:\n{operation}"),
+    ("arithmetic.multiplication_division", "✖️ Resolver multiplicación/división",
+     "Resolvemos multiplicaciones y divisiones de izquierda a derecha:\n{operation}"),
+    ("arithmetic.addition_subtraction", "➕ Resolver suma/resta",
+     "Resolvemos sumas y restas de izquierda a derecha:\n{operation}"),
+    ("arithmetic.result", "✅ Resultado final",
+     "🎉 La respuesta es {result}"),
+    ("arithmetic.fallback", "Expresión",
+     "Calculando resultado..."),
+    ("arithmetic.fallback_result", "Resultado",
+     "El resultado es: {result}"),
+
+    # Operaciones simples
+    ("division.meaning", "💡 ¿Qué significa dividir?",
+     "Dividir es repartir en partes iguales.\n\nPor ejemplo:\nSi tienes {dividend} {items} y los quieres repartir entre {divisor} {people}, la división te dice cuánto le toca a cada uno."),
+    ("division.question", "✏️ ¿Qué es {dividend} ÷ {divisor}?",
+     "Eso quiere decir:\n¿Cuántas veces cabe el {divisor} en el {dividend}?\nO: ¿Cuánto le toca a cada uno si repartimos {dividend} entre {divisor} {people}?"),
+    ("division.solve", "🔢 Resolver la división",
+     "Para resolver esta división, pensamos:\n¿Cuántas veces cabe el {divisor} en {dividend}?\n👉 Cabe {result} veces{reason}"),
+    ("division.verify", "✓ Verificar el resultado",
+     "Podemos verificar multiplicando: {divisor} × {result} = {dividend}. ¡Correcto! ✓"),
+    ("division.result", "✅ Resultado final",
+     "🎉 Entonces, {dividend} ÷ {divisor} = {result}\n\n{context}"),
+    ("division.long", "✅ Paso a paso con división larga",
+     "Vamos a dividir usando una técnica fácil llamada división larga."),
+    ("multiplication.meaning", "💡 ¿Qué significa multiplicar?",
+     "Multiplicar es sumar un número varias veces.\n\nPor ejemplo:\n{a} × {b} significa sumar {b} veces el número {a}."),
+    ("multiplication.as_sum", "✏️ Representar como suma",
+     "Podemos pensar en esto como:\n{sum} = {result}"),
+    ("multiplication.product", "🔢 Calcular el producto",
+     "Multiplicamos: {a} × {b} = {result}"),
+    ("multiplication.result", "✅ Resultado final",
+     "🎉 Entonces, {a} × {b} = {result}\n\nSi tienes {b} grupos de {a} elementos, en total tienes {result} elementos."),
+    ("addition.meaning", "💡 ¿Qué significa sumar?",
+     "Sumar es juntar o combinar cantidades.\n\nPor ejemplo:\nSi tienes {a} manzanas y consigues {b} más, ¿cuántas manzanas tienes en total?"),
+    ("addition.sum", "✏️ Sumar los números",
+     "Juntamos las dos cantidades:\n{a} + {b} = {result}"),
+    ("addition.result", "✅ Resultado final",
+     "🎉 Entonces, {a} + {b} = {result}\n\nEn total tienes {result} elementos."),
+    ("subtraction.meaning", "💡 ¿Qué significa restar?",
+     "Restar es quitar o encontrar la diferencia entre dos cantidades.\n\nPor ejemplo:\nSi tienes {a} galletas y comes {b}, ¿cuántas galletas te quedan?"),
+    ("subtraction.difference", "✏️ Restar los números",
+     "Quitamos la segunda cantidad de la primera:\n{a} - {b} = {result}"),
+    ("subtraction.result", "✅ Resultado final",
+     "🎉 Entonces, {a} - {b} = {result}\n\n{context}"),
+    ("power.meaning", "💡 ¿Qué significa una potencia?",
+     "Una potencia significa multiplicar un número por sí mismo varias veces.\n\n{base}^{exponent} significa multiplicar {base} por sí mismo {exponent} veces."),
+    ("power.as_product", "✏️ Representar como multiplicación",
+     "Podemos escribir esto como:\n{base}^{exponent} = {product}"),
+    ("power.compute", "🔢 Calcular la potencia",
+     "Calculamos: {base}^{exponent} = {result}"),
+    ("power.result", "✅ Resultado final",
+     "🎉 Entonces, {base}^{exponent} = {result}"),
+
+    # Álgebra
+    ("algebra.intro", "💡 ¿Qué es una expresión algebraica?",
+     "Una expresión algebraica usa letras (variables) para representar números desconocidos.\n\nPor ejemplo: En '2x + 3', la 'x' puede valer cualquier número.\n\nVamos a simplificar esta expresión paso a paso."),
+    ("algebra.variables", "📝 Identificar variables",
+     "Las variables en esta expresión son: {variables}\n\nEstas letras representan números que aún no conocemos."),
+    ("algebra.expand", "✏️ Expandir expresión",
+     "Aplicamos la propiedad distributiva:\na(b + c) = ab + ac\n\nMultiplicamos cada término dentro de los paréntesis."),
+    ("algebra.simplify", "🔢 Simplificar y combinar términos",
+     "Combinamos los términos semejantes (términos con las mismas variables y exponentes).\n\nPor ejemplo: 2x + 3x = 5x"),
+    ("algebra.already_simple", "✅ Expresión simplificada",
+     "Esta expresión ya está en su forma más simple. No necesita más simplificación."),
+    ("algebra.result", "✅ Resultado final",
+     "🎉 La expresión simplificada es: {result}\n\nEsta es la forma más sencilla de escribir la expresión original."),
+
+    # Ecuaciones
+    ("solve.intro", "💡 ¿Qué es una ecuación?",
+     "Una ecuación es como una balanza en equilibrio.\n\nEl signo '=' dice que ambos lados valen lo mismo.\n\nNuestra meta es encontrar el valor de la incógnita (variable) que hace que la ecuación sea verdadera."),
+    ("solve.sides", "📋 Los dos lados de la ecuación",
+     "Lado izquierdo: {left}\nLado derecho: {right}\n\nAmbos lados deben ser iguales."),
+    ("solve.unknown", "🔍 Identificar la incógnita",
+     "La variable que debemos encontrar es '{var}'.\n\nVamos a despejar '{var}' para encontrar su valor."),
+    ("solve.method", "✏️ Resolver la ecuación",
+     "Para resolver, aplicamos operaciones a ambos lados de la ecuación:\n\n• Si sumamos/restamos algo, lo hacemos en ambos lados\n• Si multiplicamos/dividimos, lo hacemos en ambos lados\n• Así mantenemos el equilibrio de la balanza"),
+    ("solve.verify", "✓ Verificar la solución",
+     "Vamos a comprobar que la solución es correcta.\n\nSustituimos {var} = {solution} en la ecuación original:\n{check} = {right}\n\n¡Es correcto! ✓"),
+    ("solve.single", "✅ Resultado final",
+     "🎉 La solución es {var} = {solution}"),
+    ("solve.no_solution", "✅ Resultado final",
+     "🎉 ❌ Esta ecuación no tiene soluciones reales.\n\nEsto significa que no existe ningún valor de {var} que haga verdadera la ecuación."),
+    ("solve.multiple", "✅ Resultado final",
+     "🎉 Esta ecuación tiene múltiples soluciones:\n{var} = {solutions}\n\nCualquiera de estos valores hace verdadera la ecuación."),
+
+    # Derivadas
+    ("derivative.intro", "💡 ¿Qué es una derivada?",
+     "La derivada nos dice qué tan rápido cambia algo.\n\nPor ejemplo:\n• La velocidad es la derivada de la posición (qué tan rápido cambia tu ubicación)\n• La aceleración es la derivada de la velocidad\n\nVamos a calcular la derivada de esta función."),
+    ("derivative.variable", "📝 Variable de derivación",
+     "Vamos a derivar con respecto a '{var}'.\n\nEsto significa que veremos cómo cambia la función cuando {var} cambia."),
+    ("derivative.rule_power", "✏️ Aplicar reglas de derivación",
+     "Aplicamos la regla de la potencia:\n\nd/dx[x^n] = n × x^(n-1)\n\nBajamos el exponente y restamos 1 al exponente.\n\nPor ejemplo: d/dx[x³] = 3x²"),
+    ("derivative.rule_trig", "✏️ Aplicar reglas de derivación",
+     "Reglas trigonométricas:\n• d/dx[sin(x)] = cos(x)\n• d/dx[cos(x)] = -sin(x)\n• d/dx[tan(x)] = sec²(x)"),
+    ("derivative.rule_exp", "✏️ Aplicar reglas de derivación",
+     "Regla de la exponencial:\nd/dx[e^x] = e^x\n\nLa exponencial es especial: ¡su derivada es ella misma!"),
+    ("derivative.rule_log", "✏️ Aplicar reglas de derivación",
+     "Regla del logaritmo:\nd/dx[ln(x)] = 1/x"),
+    ("derivative.rule_general", "✏️ Aplicar reglas de derivación",
+     "Aplicamos las reglas de derivación correspondientes, como:\n• Regla del producto\n• Regla de la cadena\n• Regla del cociente"),
+    ("derivative.simplify", "🔢 Simplificar",
+     "Simplificamos la expresión para obtener la forma más clara."),
+    ("derivative.result", "✅ Resultado final",
+     "🎉 La derivada es: {result}\n\nEsta función nos dice la tasa de cambio instantánea."),
+
+    # Integrales
+    ("integral.intro", "💡 ¿Qué es una integral?",
+     "La integral es lo opuesto de la derivada.\n\nPodemos pensar en ella como:\n• Encontrar el área bajo una curva\n• Sumar infinitos pedacitos pequeños\n• Revertir el proceso de derivación\n\nVamos a calcular la integral de esta función."),
+    ("integral.variable", "📝 Variable de integración",
+     "Vamos a integrar con respecto a '{var}'.\n\nEsto significa que estamos 'sumando' o 'acumulando' valores a medida que {var} cambia."),
+    ("integral.rule_power", "✏️ Aplicar reglas de integración",
+     "Aplicamos la regla de la potencia para integración:\n\n∫x^n dx = x^(n+1)/(n+1) + C\n\nSumamos 1 al exponente y dividimos por el nuevo exponente.\n\nPor ejemplo: ∫x² dx = x³/3 + C"),
+    ("integral.rule_trig", "✏️ Aplicar reglas de integración",
+     "Reglas trigonométricas de integración:\n• ∫sin(x) dx = -cos(x) + C\n• ∫cos(x) dx = sin(x) + C"),
+    ("integral.rule_exp", "✏️ Aplicar reglas de integración",
+     "Regla de la exponencial:\n∫e^x dx = e^x + C\n\nLa integral de e^x es e^x."),
+    ("integral.rule_log", "✏️ Aplicar reglas de integración",
+     "Regla especial:\n∫(1/x) dx = ln|x| + C"),
+    ("integral.rule_general", "✏️ Aplicar reglas de integración",
+     "Aplicamos las reglas de integración correspondientes."),
+    ("integral.constant", "➕ Añadir constante",
+     "Añadimos '+ C' (constante de integración).\n\n¿Por qué?\nCuando derivamos una constante, se vuelve 0. Por eso, al integrar, no sabemos si había una constante originalmente.\n\nLa 'C' puede ser cualquier número."),
+    ("integral.result", "✅ Resultado final",
+     "🎉 La integral es: {result}\n\nEsta función representa la 'antiderivada' o la acumulación de la función original."),
+
+    # Tipo de función (derivadas e integrales)
+    ("function.linear", "🔍 Identificar tipo de función",
+     "Esta es una función lineal (una línea recta)."),
+    ("function.quadratic", "🔍 Identificar tipo de función",
+     "Esta es una función cuadrática (una parábola)."),
+    ("function.polynomial", "🔍 Identificar tipo de función",
+     "Esta es una función polinomial de grado {degree}."),
+    ("function.trigonometric", "🔍 Identificar tipo de función",
+     "Esta es una función trigonométrica (relacionada con ángulos y círculos)."),
+    ("function.exponential", "🔍 Identificar tipo de función",
+     "Esta es una función exponencial (crece muy rápidamente)."),
+    ("function.logarithmic", "🔍 Identificar tipo de función",
+     "Esta es una función logarítmica (lo opuesto de la exponencial)."),
+    ("function.general", "🔍 Identificar tipo de función",
+     "Vamos a trabajar con esta función matemática."),
+)
+
+_PARAM = re.compile(r"\{(\w+)\}")
+
+# Campos internos del paso: solo se envían con format="compact"
+_TEMPLATE_FIELDS = ("template", "params")
+
+
+class StepTemplateCatalog:
+    """
+    Catálogo versionado de plantillas de pasos
+
+    La versión es un hash del contenido: cambia sola cuando cambia algún
+    texto, y los clientes la usan para invalidar su copia del catálogo.
+    """
+
+    def __init__(self, templates=_TEMPLATES):
+        self.templates: Dict[str, Dict[str, str]] = {
+            template_id: {"description": description, "detail": detail}
+            for template_id, description, detail in templates
+        }
+        payload = json.dumps(self.templates, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        self.version = hashlib.sha256(payload).hexdigest()[:12]
+        self._params: Dict[str, frozenset] = {
+            template_id: frozenset(_PARAM.findall(description + detail))
+            for template_id, description, detail in templates
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Cuerpo de GET /templates
+        """
+        return {"version": self.version, "templates": self.templates}
+
+    def render(self, template_id: str, params: Dict[str, str]) -> Tuple[str, str]:
+        """
+        (descripción, detalle) de una plantilla con sus parámetros
+        """
+        template = self.templates[template_id]
+        if params.keys() != self._params[template_id]:
+            raise ValueError(
+                f"Parámetros de la plantilla {template_id}: {sorted(self._params[template_id])}, "
+                f"recibidos: {sorted(params)}"
+            )
+        return template["description"].format_map(params), template["detail"].format_map(params)
+
+    def step(self, number: int, template_id: str, expression: Optional[str] = None,
+             expression_latex: Optional[str] = None, **params) -> Step:
+        """
+        Paso con el texto de la plantilla (los parámetros se pasan a texto)
+        """
+        params = {name: str(value) for name, value in params.items()}
+        description, detail = self.render(template_id, params)
+        return Step(
+            step=number,
+            description=description,
+            expression=expression,
+            expression_latex=expression_latex,
+            detail=detail,
+            template=template_id,
+            params=params or None
+        )
+
+    def text_step(self, step: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Paso en formato texto: sin el id de plantilla ni sus parámetros
+        """
+        if "template" not in step:
+            return step
+        return {name: value for name, value in step.items() if name not in _TEMPLATE_FIELDS}
+
+    def compact_step(self, step: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Paso en formato compacto: `template` + `params` en lugar de
+        `description` + `detail`, sin los campos nulos
+        """
+        template_id = step.get("template")
+        if template_id is None:
+            return {name: value for name, value in step.items() if value is not None}
+        compact = {"step": step["step"], "template": template_id}
+        if step.get("params"):
+            compact["params"] = step["params"]
+        for name in ("expression", "expression_latex"):
+            if step.get(name) is not None:
+                compact[name] = step[name]
+        return compact
+
+    def format_step(self, step: Dict[str, Any], step_format: str) -> Dict[str, Any]:
+        if step_format == "compact":
+            return self.compact_step(step)
+        return self.text_step(step)
+
+    def format_steps(self, steps: List[Dict[str, Any]], step_format: str) -> List[Dict[str, Any]]:
+        return [self.format_step(step, step_format) for step in steps]
+
+
+def check_step_format(step_format: str):
+    """
+    Valida el formato de pasos pedido por el cliente
+    """
+    if step_format not in STEP_FORMATS:
+        raise ValueError(
+            f"Formato de pasos no soportado: {step_format}. Usa uno de: {', '.join(STEP_FORMATS)}"
+        )
+
+
+# Instancia global
+step_templates = StepTemplateCatalog()
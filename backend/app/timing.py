@@ -0,0 +1,112 @@
+"""
+Medición de latencia por etapas del cálculo
+Cada petición activa un StageTimer en un ContextVar; el código del
+pipeline registra sus etapas con `stage(...)` sin recibir el timer
+como parámetro. Si no hay timer activo, medir no cuesta nada.
+
+Las etapas pueden anidarse (p. ej. `latex` ocurre dentro de `handler`),
+por eso la suma de etapas puede superar el total.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, Optional
+import time
+
+_current_timer: ContextVar[Optional["StageTimer"]] = ContextVar("stage_timer", default=None)
+
+
+class StageTimer:
+    """
+    Acumula la duración (en segundos) de cada etapa de una petición
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def merge(self, stages: Dict[str, float]):
+        """
+        Suma las etapas medidas en otro proceso (worker del pool)
+        """
+        for name, seconds in stages.items():
+            self.add(name, seconds)
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def as_ms(self) -> Dict[str, float]:
+        """
+        Duraciones en milisegundos, incluido el total de la petición
+        """
+        data = {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()}
+        data["total"] = round(self.total() * 1000, 3)
+        return data
+
+    def server_timing(self) -> str:
+        """
+        Valor de la cabecera Server-Timing (duraciones en ms)
+        """
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.as_ms().items())
+
+
+def current_timer() -> Optional[StageTimer]:
+    return _current_timer.get()
+
+
+@contextmanager
+def activate(timer: StageTimer):
+    """
+    Hace de `timer` el destino de las etapas registradas en este contexto
+    """
+    token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Mide una etapa en el timer activo (no hace nada si no hay ninguno)
+    """
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - start)
+
+
+def timed(name: str):
+    """
+    Decorador: mide cada llamada a la función como la etapa `name`
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            timer = _current_timer.get()
+            if timer is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timer.add(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
@@ -2,8 +2,11 @@
 Utilidades y helpers para el backend
 """
 import logging
+import os
+import re
+import string
 import sys
-from typing import Any
+from typing import Any, Dict, List, Optional
 import json
 
 
@@ -20,9 +23,12 @@ def setup_logging(level: str = "INFO"):
     )
 
 
-def log_calculation(expression: str, mode: str, success: bool, error: str = None):
+def log_calculation(expression: str, mode: str, success: bool, error: str = None,
+                    timings: Optional[Dict[str, float]] = None):
     """
     Log estructurado de cálculos (preparado para métricas futuras)
+
+    timings: duración en ms de cada etapa (ver app.timing.StageTimer)
     """
     logger = logging.getLogger("educalc.calculations")
     log_data = {
@@ -31,52 +37,206 @@ def log_calculation(expression: str, mode: str, success: bool, error: str = None
         "success": success,
         "error": error
     }
+    if timings is not None:
+        log_data["timings_ms"] = timings
     logger.info(json.dumps(log_data))
 
 
+# Longitud máxima de una expresión (el presupuesto de coste limita además los tokens)
+SANITIZE_MAX_LENGTH = int(os.getenv("SANITIZE_MAX_LENGTH", "10000"))
+
+# Máximo de diagnósticos por expresión
+MAX_DIAGNOSTICS = 20
+
+# Términos prohibidos: se buscan como subcadena sin distinguir mayúsculas,
+# también dentro de otros identificadores ('2open' y 'profile' se rechazan)
+FORBIDDEN_WORDS = (
+    "__", "import", "exec", "eval", "compile", "open", "file",
+    "input", "raw_input", "execfile", "reload", "globals", "locals"
+)
+
+# Operadores de la gramática (la coma se trata aparte)
+_OPERATORS = "+-*/%^().!=÷×·−"
+
+# Términos prohibidos como alternativa, sin distinguir mayúsculas (los más largos primero)
+_FORBIDDEN = "(?i:" + "|".join(re.escape(word) for word in sorted(FORBIDDEN_WORDS, key=len, reverse=True)) + ")"
+
+# Caracteres válidos (ASCII explícito: \w aceptaría 'x²', '٣' o 'ℵ'); los que pueden
+# empezar un término prohibido solo se aceptan si no lo empiezan
+_STARTS = {word[0] for word in FORBIDDEN_WORDS}
+_VALID = string.ascii_letters + string.digits + "_" + _OPERATORS
+_SAFE = re.escape("".join(c for c in _VALID if c.lower() not in _STARTS))
+_GUARDED = re.escape("".join(c for c in _VALID if c.lower() in _STARTS))
+
+# Un solo patrón para todo el escaneo: tramos de caracteres válidos con espacios
+# sueltos (se cortan justo antes de un término prohibido: '2open' da '2' y 'open'),
+# espacios que hay que normalizar, una coma, un término prohibido o cualquier
+# otro carácter (no válido)
+_SCAN_RE = re.compile(
+    r"(?P<run>(?:[" + _SAFE + r"]+|(?!" + _FORBIDDEN + r")[" + _GUARDED + r"]| (?=\S))+)"
+    r"|(?P<space>\s+)"
+    r"|(?P<comma>,)"
+    r"|(?P<forbidden>" + _FORBIDDEN + r")"
+    r"|(?P<other>.)",
+    re.DOTALL
+)
+
+# Orden en que se informa el error principal de una expresión
+_DIAGNOSTIC_PRIORITY = ("empty", "too_long", "multiple_expressions", "forbidden", "invalid_character")
+
+
+class SanitizeDiagnostic:
+    """
+    Problema encontrado al sanear una expresión
+
+    - code: empty | too_long | multiple_expressions | forbidden | invalid_character
+    - position: índice (desde 0) en la expresión original
+    - suggestions: expresiones por separado (solo multiple_expressions)
+    """
+    __slots__ = ("code", "message", "position", "suggestions")
+
+    def __init__(self, code: str, message: str, position: int, suggestions: Optional[List[str]] = None):
+        self.code = code
+        self.message = message
+        self.position = position
+        self.suggestions = suggestions
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {"code": self.code, "message": self.message, "position": self.position}
+        if self.suggestions is not None:
+            data["suggestions"] = self.suggestions
+        return data
+
+
+class SanitizeError(ValueError):
+    """
+    La expresión no pasa el saneamiento; el mensaje es el del diagnóstico principal
+    """
+
+    def __init__(self, diagnostics: List[SanitizeDiagnostic]):
+        self.diagnostics = diagnostics
+        primary = min(diagnostics, key=lambda d: (_DIAGNOSTIC_PRIORITY.index(d.code), d.position))
+        super().__init__(primary.message)
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        return [diagnostic.to_dict() for diagnostic in self.diagnostics]
+
+
+class SanitizeResult:
+    """
+    Expresión normalizada y diagnósticos (vacíos si es válida)
+    """
+    __slots__ = ("expression", "diagnostics")
+
+    def __init__(self, expression: str, diagnostics: List[SanitizeDiagnostic]):
+        self.expression = expression
+        self.diagnostics = diagnostics
+
+    @property
+    def valid(self) -> bool:
+        return not self.diagnostics
+
+
+def _comma_diagnostic(text: str, commas: List[int], offset: int) -> Optional[SanitizeDiagnostic]:
+    """
+    Comas fuera de paréntesis: varias expresiones en una (dentro son argumentos: log(x, 2))
+    """
+    bounds = [-1] + commas + [len(text)]
+    parts = [" ".join(text[a + 1:b].split()) for a, b in zip(bounds, bounds[1:])]
+    parts = [part for part in parts if part]
+    if len(parts) < 2:
+        return None
+    if len(parts) == 2:
+        message = (
+            f"❌ La coma (,) NO es un operador matemático válido.\n\n"
+            f"📚 Explicación:\n"
+            f"La coma se usa en programación para separar elementos de una lista, pero en matemáticas no es una operación.\n\n"
+            f"✅ Solución: Calcula cada expresión por separado:\n\n"
+            f"   1) {parts[0]}\n"
+            f"   2) {parts[1]}"
+        )
+    else:
+        suggestions = '\n'.join([f"   {i+1}) {part}" for i, part in enumerate(parts)])
+        message = (
+            f"❌ La coma (,) NO es un operador matemático válido.\n\n"
+            f"📚 Explicación:\n"
+            f"La coma se usa en programación para separar elementos, pero en matemáticas no existe como operación.\n\n"
+            f"✅ Solución: Calcula cada expresión por separado:\n\n{suggestions}"
+        )
+    return SanitizeDiagnostic("multiple_expressions", message, offset + commas[0], suggestions=parts)
+
+
+def scan_expression(expression: str, max_length: int = None) -> SanitizeResult:
+    """
+    Normaliza y revisa la expresión sin lanzar excepciones
+
+    - normaliza: quita espacios de los extremos y deja un solo espacio entre elementos
+    - rechaza: expresión vacía o demasiado larga, comas fuera de paréntesis,
+      términos prohibidos y caracteres fuera de la gramática
+    """
+    if max_length is None:
+        max_length = SANITIZE_MAX_LENGTH
+    text = expression.strip()
+    if not text:
+        return SanitizeResult(text, [SanitizeDiagnostic("empty", "La expresión está vacía", 0)])
+    if len(text) > max_length:
+        return SanitizeResult(text, [SanitizeDiagnostic(
+            "too_long", f"La expresión es demasiado larga ({len(text)} caracteres, máximo {max_length})", max_length
+        )])
+    offset = len(expression) - len(expression.lstrip())
+
+    pieces: List[str] = []
+    commas: List[int] = []
+    diagnostics: List[SanitizeDiagnostic] = []
+    depth = 0
+    for match in _SCAN_RE.finditer(text):
+        kind = match.lastgroup
+        if kind == "run":
+            token = match.group()
+            pieces.append(token)
+            depth += token.count("(") - token.count(")")
+            continue
+        if kind == "space":
+            pieces.append(" ")
+            continue
+        token = match.group()
+        pieces.append(token)
+        start = match.start()
+        if kind == "comma":
+            # Dentro de paréntesis separa argumentos (log(x, 2)); fuera, expresiones
+            if depth <= 0:
+                commas.append(start)
+            continue
+        if kind == "forbidden":
+            diagnostics.append(SanitizeDiagnostic(
+                "forbidden", f"Expresión contiene término prohibido: {token.lower()}", offset + start
+            ))
+        else:
+            diagnostics.append(SanitizeDiagnostic(
+                "invalid_character", f"Carácter no válido '{token}' (posición {offset + start + 1})", offset + start
+            ))
+        if len(diagnostics) >= MAX_DIAGNOSTICS:
+            break
+
+    if commas:
+        diagnostic = _comma_diagnostic(text, commas, offset)
+        if diagnostic is not None:
+            diagnostics.insert(0, diagnostic)
+    return SanitizeResult("".join(pieces), diagnostics[:MAX_DIAGNOSTICS])
+
+
 def sanitize_expression(expression: str) -> str:
     """
     Sanitiza la expresión antes de procesarla
-    Elimina caracteres peligrosos y normaliza
+    Normaliza los espacios y rechaza lo que no es una expresión matemática
+
+    Raises:
+        SanitizeError: (ValueError) con los diagnósticos de scan_expression
     """
-    # Eliminar espacios extra
-    expression = expression.strip()
-    
-    # Detectar comas (múltiples expresiones)
-    if ',' in expression:
-        # Sugerir separar las expresiones
-        parts = [p.strip() for p in expression.split(',') if p.strip()]
-        if len(parts) > 1:
-            if len(parts) == 2:
-                raise ValueError(
-                    f"❌ La coma (,) NO es un operador matemático válido.\n\n"
-                    f"📚 Explicación:\n"
-                    f"La coma se usa en programación para separar elementos de una lista, pero en matemáticas no es una operación.\n\n"
-                    f"✅ Solución: Calcula cada expresión por separado:\n\n"
-                    f"   1) {parts[0]}\n"
-                    f"   2) {parts[1]}"
-                )
-            else:
-                suggestions = '\n'.join([f"   {i+1}) {part}" for i, part in enumerate(parts)])
-                raise ValueError(
-                    f"❌ La coma (,) NO es un operador matemático válido.\n\n"
-                    f"📚 Explicación:\n"
-                    f"La coma se usa en programación para separar elementos, pero en matemáticas no existe como operación.\n\n"
-                    f"✅ Solución: Calcula cada expresión por separado:\n\n{suggestions}"
-                )
-    
-    # Lista de caracteres/palabras prohibidas para evitar eval malicioso
-    forbidden = [
-        "__", "import", "exec", "eval", "compile", "open", "file",
-        "input", "raw_input", "execfile", "reload", "globals", "locals"
-    ]
-    
-    expression_lower = expression.lower()
-    for forbidden_word in forbidden:
-        if forbidden_word in expression_lower:
-            raise ValueError(f"Expresión contiene término prohibido: {forbidden_word}")
-    
-    return expression
+    result = scan_expression(expression)
+    if result.diagnostics:
+        raise SanitizeError(result.diagnostics)
+    return result.expression
 
 
 def format_latex(expression: str) -> str:
@@ -84,9 +244,9 @@ def format_latex(expression: str) -> str:
     Convierte una expresión de SymPy a formato LaTeX (preparado para futuro)
     """
     try:
-        from sympy import latex, sympify
-        expr = sympify(expression)
-        return latex(expr)
+        from sympy import latex
+        from app.parser import parse_math
+        return latex(parse_math(expression))
     except Exception:
         return expression
 
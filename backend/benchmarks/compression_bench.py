@@ -0,0 +1,81 @@
+"""
+Benchmark de compresión: CPU por respuesta frente a bytes ahorrados
+
+Genera respuestas típicas de /calculate (formatos text y compact), la
+lista de /operations y el catálogo de /templates, y mide cada codificación
+y nivel. Uso (desde backend/):
+
+    python -m benchmarks.compression_bench
+"""
+from typing import Callable, Dict, List, Tuple
+import gzip
+import time
+
+from app.calculator_engine import CalculatorEngine
+from app.routes.calculate import _response_body
+from app.routes.info import OPERATIONS
+from app.serialization import dumps
+from app.step_templates import step_templates
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli es opcional
+    brotli = None
+
+# Expresiones representativas por modo
+CORPUS = [
+    ("2 + 3 * 4", "arithmetic"),
+    ("(10 - 5) / 2 + 3**2", "arithmetic"),
+    ("144 / 12", "arithmetic"),
+    ("(x + 2)**2", "algebra"),
+    ("2*x + 5 = 15", "solve"),
+    ("x**2 - 4 = 0", "solve"),
+    ("x**3 - 2*x + 1", "derivative"),
+    ("sin(x)", "derivative"),
+    ("x**2", "integral"),
+    ("2*x + 1", "integral"),
+]
+
+REPEAT = 200
+
+
+def _codecs() -> List[Tuple[str, Callable[[bytes], bytes]]]:
+    codecs = [(f"gzip-{level}", lambda body, level=level: gzip.compress(body, compresslevel=level, mtime=0))
+              for level in (1, 6, 9)]
+    if brotli is not None:
+        codecs += [(f"br-{quality}", lambda body, quality=quality: brotli.compress(body, quality=quality))
+                   for quality in (1, 4, 11)]
+    return codecs
+
+
+def _payloads() -> Dict[str, List[bytes]]:
+    engine = CalculatorEngine()
+    payloads: Dict[str, List[bytes]] = {"text": [], "compact": []}
+    for expression, mode in CORPUS:
+        result = engine.calculate(expression, mode)
+        for step_format in payloads:
+            payloads[step_format].append(dumps(_response_body(expression, result, step_format)))
+    payloads["operations"] = [dumps([operation.model_dump() for operation in OPERATIONS])]
+    payloads["templates"] = [dumps(step_templates.to_dict())]
+    return payloads
+
+
+def main():
+    payloads = _payloads()
+    print(f"{'payload':<11} {'codec':<8} {'bytes':>8} {'ratio':>6} {'µs/resp':>8}")
+    for name, bodies in payloads.items():
+        raw = sum(len(body) for body in bodies)
+        print(f"{name:<11} {'none':<8} {raw // len(bodies):>8} {1.0:>6.2f} {0.0:>8.1f}")
+        for codec_name, codec in _codecs():
+            size = sum(len(codec(body)) for body in bodies)
+            start = time.perf_counter()
+            for _ in range(REPEAT):
+                for body in bodies:
+                    codec(body)
+            elapsed = time.perf_counter() - start
+            micros = elapsed / (REPEAT * len(bodies)) * 1e6
+            print(f"{name:<11} {codec_name:<8} {size // len(bodies):>8} {raw / size:>6.2f} {micros:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark del parser: app.parser.parse_math frente a sympify
+
+Usa los ejemplos de /operations y expresiones típicas de la interfaz, y
+comprueba que ambos construyen la misma expresión SymPy. Uso (desde backend/):
+
+    python -m benchmarks.parser_bench [--repeat 200]
+
+Termina con código 1 si algún resultado difiere de sympify.
+"""
+from typing import Callable, List
+import argparse
+import sys
+import time
+
+from sympy import sympify
+
+from app.parser import parse_math
+from app.routes.info import OPERATIONS
+
+# Expresiones que la interfaz envía además de los ejemplos (ya sin ÷ ni ×)
+EXTRA = [
+    "sqrt(16) + 3**2",
+    "sin(x)**2 + cos(x)**2",
+    "x**3 - 6*x**2 + 11*x - 6",
+    "(x + 1)/(x - 1)",
+    "log(x) + exp(2*x)",
+    "2.5*x - 0.75",
+    "(2*x + 3)*(x - 4)",
+    "tan(x)/x",
+]
+
+
+def corpus() -> List[str]:
+    expressions = [example for operation in OPERATIONS for example in operation.examples] + EXTRA
+    # Las ecuaciones se parsean lado por lado, igual que en CalculatorEngine.parse
+    return [side.strip() for expression in expressions for side in expression.split("=")]
+
+
+def _time_per_call(parse: Callable[[str], object], expressions: List[str], repeat: int) -> float:
+    """
+    µs por expresión (la mejor de 5 rondas)
+    """
+    best = float("inf")
+    for _ in range(5):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for expression in expressions:
+                parse(expression)
+        best = min(best, time.perf_counter() - started)
+    return best / (repeat * len(expressions)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    expressions = corpus()
+    mismatches = [expression for expression in expressions if parse_math(expression) != sympify(expression)]
+
+    print(f"{'expresión':<28} {'sympify µs':>11} {'parse_math µs':>14} {'x':>6}")
+    for expression in expressions:
+        baseline = _time_per_call(sympify, [expression], args.repeat)
+        ours = _time_per_call(parse_math, [expression], args.repeat)
+        print(f"{expression:<28} {baseline:>11.1f} {ours:>14.1f} {baseline / ours:>6.1f}")
+
+    baseline = _time_per_call(sympify, expressions, args.repeat)
+    ours = _time_per_call(parse_math, expressions, args.repeat)
+    print(f"\nCorpus ({len(expressions)} expresiones): sympify {baseline:.1f} µs, "
+          f"parse_math {ours:.1f} µs por expresión ({baseline / ours:.1f}x)")
+
+    if mismatches:
+        print(f"\n❌ Resultados distintos de sympify: {', '.join(mismatches)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark de arranque en frío: tiempo de importación por módulo y
+tiempo hasta readiness
+
+Cada medición usa un intérprete nuevo (como un arranque de Cloud Run).
+Uso (desde backend/):
+
+    python -m benchmarks.startup_bench [--runs 3] [--top 15] [--budget-ms 800]
+
+Con --budget-ms termina con código 1 si importar app.main supera el
+presupuesto, para usarlo en CI.
+"""
+from typing import Dict, List, Tuple
+import argparse
+import json
+import subprocess
+import sys
+
+_READY_SCRIPT = """
+import json, os
+os.environ["ENGINE_PRELOAD"] = "eager"
+from fastapi.testclient import TestClient
+from app.main import app
+from app.startup import startup_state
+with TestClient(app):
+    print("STARTUP " + json.dumps(startup_state.stats()))
+"""
+
+
+def _importtime(statement: str) -> Dict[str, Tuple[int, int]]:
+    """
+    {módulo: (propio µs, acumulado µs)} según `python -X importtime`
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True, text=True, check=True
+    )
+    modules = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            modules[name.strip()] = (int(self_us), int(cumulative_us))
+        except ValueError:
+            continue
+    return modules
+
+
+def _best_of(statement: str, runs: int) -> Dict[str, Tuple[int, int]]:
+    """
+    La ejecución más rápida (la menos afectada por ruido del sistema)
+    """
+    samples = [_importtime(statement) for _ in range(runs)]
+    return min(samples, key=lambda modules: sum(own for own, _ in modules.values()))
+
+
+def _by_package(modules: Dict[str, Tuple[int, int]]) -> List[Tuple[str, int]]:
+    """
+    Tiempo propio sumado por paquete raíz (app.* se muestra por módulo)
+    """
+    totals: Dict[str, int] = {}
+    for name, (own, _) in modules.items():
+        key = name if name.startswith("app.") or name == "app" else name.split(".")[0]
+        totals[key] = totals.get(key, 0) + own
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    modules = _best_of("import app.main", args.runs)
+    total_ms = sum(own for own, _ in modules.values()) / 1000
+    print(f"import app.main: {total_ms:.0f} ms ({len(modules)} módulos)")
+    print(f"{'paquete/módulo':<32} {'ms':>8}")
+    for name, own in _by_package(modules)[:args.top]:
+        print(f"{name:<32} {own / 1000:>8.1f}")
+
+    sympy_modules = _best_of("import sympy", args.runs)
+    print(f"\nimport sympy (cargado en segundo plano): {sum(own for own, _ in sympy_modules.values()) / 1000:.0f} ms")
+    if any(name == "sympy" for name in modules):
+        print("⚠️  app.main importa SymPy al cargar: el arranque en frío no es perezoso")
+
+    completed = subprocess.run([sys.executable, "-c", _READY_SCRIPT], capture_output=True, text=True, check=True)
+    line = next(line for line in completed.stdout.splitlines() if line.startswith("STARTUP "))
+    stats = json.loads(line[len("STARTUP "):])
+    print("\nFases hasta readiness (ENGINE_PRELOAD=eager):")
+    for phase, ms in stats["phases_ms"].items():
+        print(f"  {phase:<10} {ms:>8.1f} ms")
+
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"\n❌ import app.main ({total_ms:.0f} ms) supera el presupuesto de {args.budget_ms:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+"""
+Configuración común de los tests
+
+Se ejecutan desde backend/ con `python -m pytest`. El pool del motor se
+reduce a dos workers, sin precarga ni calentamiento, para que la app
+arranque en pocos segundos.
+"""
+import os
+
+os.environ.setdefault("ENGINE_WORKERS", "2")
+os.environ.setdefault("ENGINE_PRELOAD", "lazy")
+os.environ.setdefault("ENGINE_WARMUP", "false")
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture(scope="session")
+def client():
+    from app.main import app
+    with TestClient(app) as test_client:
+        yield test_client
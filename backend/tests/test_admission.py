@@ -0,0 +1,99 @@
+"""
+Tests del control de admisión: cola acotada, carriles y 503 con Retry-After
+"""
+import asyncio
+
+import pytest
+
+from app.admission import AdmissionController, AdmissionRejected, ADMISSION_MODES
+from app.service import calculation_service
+
+
+def controller(**settings) -> AdmissionController:
+    admission = AdmissionController(workers=1)
+    for name, value in settings.items():
+        setattr(admission, name, value)
+    return admission
+
+
+def test_queue_full():
+    admission = controller(max_queue=0)
+
+    async def scenario():
+        async with admission.slot("solve"):
+            async with admission.slot("solve"):
+                pass
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        asyncio.run(scenario())
+    assert rejected.value.reason == "queue_full"
+    assert admission.rejected["solve"] == 1
+    assert admission.running["solve"] == 0
+
+
+def test_queue_timeout():
+    admission = controller(queue_timeout=0.05)
+
+    async def scenario():
+        async with admission.slot("solve"):
+            async with admission.slot("solve"):
+                pass
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        asyncio.run(scenario())
+    assert rejected.value.reason == "queue_timeout"
+    assert admission.queue_depth == 0
+
+
+def test_heavy_lane_leaves_room_for_fast():
+    admission = controller(queue_timeout=0.05)
+
+    async def scenario():
+        async with admission.slot("solve", "heavy"):
+            # Otro modo pesado espera a la capacidad compartida...
+            with pytest.raises(AdmissionRejected):
+                async with admission.slot("derivative", "heavy"):
+                    pass
+            # ...pero la aritmética entra por el carril rápido
+            async with admission.slot("arithmetic", "fast"):
+                return admission.lane_running["fast"]
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_classify():
+    admission = controller()
+    assert admission.classify("2 + 3", "auto") == "fast"
+    assert admission.classify("2 + 3", "arithmetic") == "fast"
+    assert admission.classify("2*x = 4", "auto") == "heavy"
+    assert admission.classify("1+" * 200 + "1", "arithmetic") == "heavy"
+
+
+@pytest.fixture
+def saturated(monkeypatch):
+    """
+    Servicio sin capacidad ni cola: toda petición que pase por el pool se rechaza
+    """
+    admission = controller(max_queue=0, heavy_capacity=0)
+    admission.limits = {mode: 0 for mode in ADMISSION_MODES}
+    monkeypatch.setattr(calculation_service, "admission", admission)
+    return admission
+
+
+def test_calculate_503(client, saturated):
+    response = client.post("/calculate", json={"expression": "3*x + 1 = 10", "mode": "solve"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(saturated.retry_after)
+    assert response.json()["detail"]["error"] == "Servicio saturado"
+
+
+def test_batch_item_503(client, saturated):
+    response = client.post("/calculate/batch", json={"items": [{"expression": "5*x - 2 = 8", "mode": "solve"}]})
+    assert response.status_code == 200
+    assert response.json()["results"][0]["status"] == 503
+
+
+def test_stream_503(client, saturated):
+    response = client.post("/calculate/stream", json={"expression": "7*x = 21", "mode": "solve"})
+    assert response.status_code == 200
+    assert '"status":503' in response.text.splitlines()[-1]
@@ -0,0 +1,73 @@
+"""
+Tests de POST /calculate/batch: orden, duplicados, límites y plazo
+"""
+import asyncio
+
+from app.routes import calculate as calculate_routes
+
+
+def test_order_duplicates_and_errors(client):
+    items = [
+        {"expression": "2 + 3", "mode": "arithmetic"},
+        {"expression": "2*x + 5 = 15", "mode": "solve"},
+        {"expression": "2 + 3", "mode": "arithmetic"},
+        {"expression": "1, 2"},
+    ]
+    body = client.post("/calculate/batch", json={"items": items}).json()
+    assert [result["status"] for result in body["results"]] == [200, 200, 200, 400]
+    assert [result["index"] for result in body["results"]] == [0, 1, 2, 3]
+    assert body["results"][0]["response"]["result"] == "5"
+    assert body["results"][1]["response"]["result"] == "x = 5"
+    assert body["results"][3]["error"]["expression"] == "1, 2"
+    assert (body["total"], body["succeeded"], body["failed"], body["unique"]) == (4, 3, 1, 2)
+
+
+def test_compact_items(client):
+    items = [{"expression": "3 * 4", "format": "compact"}]
+    step = client.post("/calculate/batch", json={"items": items}).json()["results"][0]["response"]["steps"][0]
+    assert step["template"] == "multiplication.meaning"
+    assert "detail" not in step
+
+
+def test_too_many_items(client, monkeypatch):
+    monkeypatch.setattr(calculate_routes, "BATCH_MAX_ITEMS", 2)
+    response = client.post("/calculate/batch", json={"items": [{"expression": "1 + 1"}] * 3})
+    assert response.status_code == 413
+
+
+def test_concurrency_cap(client, monkeypatch):
+    running = 0
+    peak = 0
+
+    async def run_item(item, clean_expression, steps):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        return {"status": 200, "data": {"result": clean_expression, "steps": [], "mode": "arithmetic"}}
+
+    monkeypatch.setattr(calculate_routes, "_run_batch_item", run_item)
+    monkeypatch.setattr(calculate_routes, "BATCH_CONCURRENCY", 2)
+    items = [{"expression": f"{n} + 1"} for n in range(8)]
+    body = client.post("/calculate/batch", json={"items": items}).json()
+    assert body["succeeded"] == 8
+    assert peak == 2
+
+
+def test_deadline(client, monkeypatch):
+    started = []
+
+    async def run_item(item, clean_expression, steps):
+        started.append(clean_expression)
+        await asyncio.sleep(1)
+        return {"status": 200, "data": {"result": clean_expression, "steps": [], "mode": "arithmetic"}}
+
+    monkeypatch.setattr(calculate_routes, "_run_batch_item", run_item)
+    monkeypatch.setattr(calculate_routes, "BATCH_CONCURRENCY", 1)
+    monkeypatch.setattr(calculate_routes, "BATCH_DEADLINE_SECONDS", 0.1)
+    items = [{"expression": f"{n} * 2"} for n in range(4)]
+    body = client.post("/calculate/batch", json={"items": items}).json()
+    assert [result["status"] for result in body["results"]] == [408] * 4
+    # Los que esperaban turno se cancelan sin empezar
+    assert started == ["0 * 2"]
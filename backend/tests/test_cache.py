@@ -0,0 +1,51 @@
+"""
+Tests de la caché compartida: stats() no recorre la tabla en el event loop
+"""
+import asyncio
+import threading
+
+from app.cache import SharedResultCache
+
+
+def shared_cache(tmp_path, monkeypatch) -> SharedResultCache:
+    monkeypatch.setenv("SHARED_CACHE_PATH", str(tmp_path / "cache.db"))
+    return SharedResultCache()
+
+
+def test_counts_outside_event_loop(tmp_path, monkeypatch):
+    cache = shared_cache(tmp_path, monkeypatch)
+    cache.set("a", {"result": "1"})
+    cache.set("b", {"result": "2"})
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["size_bytes"] > 0
+
+
+def test_counts_in_a_thread_from_event_loop(tmp_path, monkeypatch):
+    cache = shared_cache(tmp_path, monkeypatch)
+    cache.set("a", {"result": "1"})
+    counted_in = []
+    count = cache._count
+
+    def record_thread(conn):
+        counted_in.append(threading.current_thread())
+        return count(conn)
+
+    monkeypatch.setattr(cache, "_count", record_thread)
+
+    async def scenario():
+        # El primer stats() lanza el recuento en un hilo sin esperarlo
+        cache.stats()
+        while cache._refreshing:
+            await asyncio.sleep(0.01)
+        return cache.stats()
+
+    assert asyncio.run(scenario())["entries"] == 1
+    assert counted_in and threading.main_thread() not in counted_in
+
+
+def test_clear_resets_totals(tmp_path, monkeypatch):
+    cache = shared_cache(tmp_path, monkeypatch)
+    cache.set("a", {"result": "1"})
+    cache.clear()
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,53 @@
+"""
+Tests de POST /calculate, /calculate/stream y /validate
+"""
+import pytest
+
+
+@pytest.mark.parametrize("expression, mode, result", [
+    ("2 + 3 * 4", "arithmetic", "14"),
+    ("10 % 3", "auto", "1"),
+    ("floor(2.5) + ceiling(2.5)", "auto", "5"),
+    ("2*x + 5 = 15", "solve", "x = 5"),
+    ("2*(x+3) - 4", "algebra", "2*x + 2"),
+])
+def test_calculate(client, expression, mode, result):
+    response = client.post("/calculate", json={"expression": expression, "mode": mode})
+    assert response.status_code == 200
+    assert response.json()["result"] == result
+
+
+def test_rejects_unknown_function(client):
+    # El parser propio solo admite las funciones de su tabla
+    response = client.post("/calculate", json={"expression": "diff(x**2, x)"})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("expression", [
+    "-" * 1500 + "2**2",
+    "1" + "**1" * 1000,
+    "(" * 150 + "1" + ")" * 150,
+])
+def test_edge_cases_are_not_500(client, expression):
+    # Antes: RecursionError y 500
+    response = client.post("/calculate", json={"expression": expression})
+    assert response.status_code in (200, 400)
+
+
+@pytest.mark.parametrize("expression", ["9**9**9", "0.5**-20000", "(1/2)**-20000", "0.1**-5000", "2**0.5**-9999"])
+def test_rejected_by_budget(client, expression):
+    response = client.post("/calculate", json={"expression": expression})
+    assert response.status_code == 400
+    assert "dígitos" in str(response.json()["detail"])
+
+
+@pytest.mark.parametrize("expression", ["2open", "1, 2", "x² + 1"])
+def test_rejected_by_sanitizer(client, expression):
+    response = client.post("/calculate", json={"expression": expression})
+    assert response.status_code == 400
+
+
+def test_validate_diagnostics(client):
+    body = client.post("/validate", json={"expression": "2 $ 3"}).json()
+    assert body["valid"] is False
+    assert body["diagnostics"][0]["code"] == "invalid_character"
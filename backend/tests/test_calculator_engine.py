@@ -0,0 +1,36 @@
+"""
+Tests de la etapa única de parseo del motor (CalculatorEngine.parse)
+"""
+import pytest
+
+from app.calculator_engine import CalculatorEngine
+from app.parser import ParseError
+
+engine = CalculatorEngine()
+
+
+def test_equation_sides():
+    parsed = engine.parse("2*x + 5 = 15")
+    assert parsed.is_equation
+    assert [str(side) for side in parsed.require_sides()] == ["2*x + 5", "15"]
+
+
+def test_arithmetic_skips_sympy():
+    parsed = engine.parse("2 + 3 * 4")
+    assert parsed.valid
+    assert parsed.arithmetic is not None
+
+
+@pytest.mark.parametrize("expression, position", [("x=1=2", 3), ("x = 1 = 2 = 3", 6)])
+def test_single_equals(expression, position):
+    parsed = engine.parse(expression)
+    assert not parsed.valid
+    assert isinstance(parsed.error, ParseError)
+    assert parsed.error.position == position
+    assert "un signo '='" in str(parsed.error)
+
+
+def test_error_position_on_right_side():
+    parsed = engine.parse("x = 2 $ 3")
+    assert isinstance(parsed.error, ParseError)
+    assert parsed.error.position == 6
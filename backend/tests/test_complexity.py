@@ -0,0 +1,61 @@
+"""
+Tests del presupuesto de coste (app.complexity)
+"""
+import pytest
+
+from app.complexity import analyze, check_complexity, ComplexityExceeded
+
+
+@pytest.mark.parametrize("expression", [
+    "-" * 1500 + "2**2",
+    "1" + "**1" * 1000,
+    "(" * 150 + "1" + ")" * 150,
+])
+def test_analyze_without_recursion(expression):
+    # Antes: RecursionError (500) en lugar de un informe
+    report = analyze(expression)
+    assert report.tokens > 0
+
+
+def test_rejects_huge_power():
+    with pytest.raises(ComplexityExceeded) as exceeded:
+        check_complexity("9**9**9", "arithmetic")
+    assert exceeded.value.metric == "result_digits"
+
+
+def test_power_chain_magnitude():
+    # 2**3**2 = 2**9 = 512: se agrupa por la derecha
+    assert analyze("2**3**2").result_digits == pytest.approx(2.709, abs=1e-3)
+
+
+@pytest.mark.parametrize("expression, mode", [
+    ("2 + 3 * 4", "arithmetic"),
+    ("2*x + 5 = 15", "solve"),
+    ("x**3 + 2*x", "derivative"),
+    ("10 % 3", "auto"),
+])
+def test_common_expressions_fit(expression, mode):
+    assert check_complexity(expression, mode) == "full"
+
+
+@pytest.mark.parametrize("expression", ["0.5**-20000", "(1/2)**-20000", "0.1**-5000", "0.5^-14000", "2**-20000"])
+def test_rejects_negative_exponents(expression):
+    # Un número menor que 1 con exponente negativo es tan grande como su inverso
+    with pytest.raises(ComplexityExceeded) as exceeded:
+        check_complexity(expression, "arithmetic")
+    assert exceeded.value.metric == "result_digits"
+
+
+def test_rejects_huge_negative_exponent_chain():
+    # 0.5**-9999 ≈ 10**3010: 2 elevado a eso no cabe en ningún presupuesto
+    assert analyze("2**0.5**-9999").result_digits == float("inf")
+
+
+@pytest.mark.parametrize("expression, digits", [
+    ("0.5**-10", 3.010),
+    ("2**-10", 3.010),
+    ("0.5**10", 3.010),
+    ("(1/2)**-20", 6.021),
+])
+def test_signed_magnitudes(expression, digits):
+    assert analyze(expression).result_digits == pytest.approx(digits, abs=1e-3)
@@ -0,0 +1,71 @@
+"""
+Tests del evaluador rápido y del reductor PEMDAS paso a paso
+"""
+from fractions import Fraction
+
+import pytest
+
+from app.fast_arithmetic import parse_arithmetic, reduce_steps
+
+
+def trace(expression):
+    """
+    (operación, expresión tras resolverla) de cada reducción
+    """
+    tree = parse_arithmetic(expression).tree
+    return [(f"{r.left} {r.op} {r.right} = {r.result}", r.expression) for r in reduce_steps(tree, str)]
+
+
+def test_pemdas_order():
+    assert trace("(2+3)*4-6/2") == [
+        ("2 + 3 = 5", "5 * 4 - 6 / 2"),
+        ("5 * 4 = 20", "20 - 6 / 2"),
+        ("6 / 2 = 3", "20 - 3"),
+        ("20 - 3 = 17", "17"),
+    ]
+
+
+def test_same_rank_left_to_right():
+    assert [operation for operation, _ in trace("8-3-2")] == ["8 - 3 = 5", "5 - 2 = 3"]
+    assert [operation for operation, _ in trace("12/2*3")] == ["12 / 2 = 6", "6 * 3 = 18"]
+
+
+def test_power_right_to_left():
+    assert trace("2**3**2") == [("3 ** 2 = 9", "2 ** 9"), ("2 ** 9 = 512", "512")]
+
+
+def test_innermost_parentheses_first():
+    tree = parse_arithmetic("((1+2)*(3+4))").tree
+    reductions = list(reduce_steps(tree, str))
+    assert [r.op for r in reductions] == ["+", "+", "*"]
+    assert all(r.in_parentheses for r in reductions)
+    assert reductions[0].expression == "(3 * (3 + 4))"
+
+
+def test_unary_minus():
+    assert trace("-2**2") == [("2 ** 2 = 4", "-4")]
+    assert trace("2*-3+1") == [("2 * -3 = -6", "-6 + 1"), ("-6 + 1 = -5", "-5")]
+
+
+def test_exact_fractions():
+    arithmetic = parse_arithmetic("10/4")
+    assert arithmetic.exact
+    assert arithmetic.value == Fraction(5, 2)
+
+
+def test_worksheet_expression_full_trace():
+    # Una reducción por operador, también con 60 operadores
+    reductions = trace("+".join(["1"] * 61))
+    assert len(reductions) == 60
+    assert reductions[-1] == ("60 + 1 = 61", "61")
+
+
+def test_deep_parentheses():
+    reductions = trace("(" * 500 + "1+1" + ")" * 500)
+    assert len(reductions) == 1
+    assert reductions[0][1] == "2"
+
+
+@pytest.mark.parametrize("expression", ["x + 1", "2 ** x", "sin(1)", "1 +", ""])
+def test_not_arithmetic(expression):
+    assert parse_arithmetic(expression) is None
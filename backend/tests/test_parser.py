@@ -0,0 +1,57 @@
+"""
+Tests del parser propio (app.parser) frente a sympify
+"""
+import pytest
+from sympy import sympify
+
+from app.parser import parse_math, ParseError, MAX_DEPTH
+from benchmarks.parser_bench import corpus
+
+# Casos que no están en los ejemplos de /operations
+EXTRA = [
+    "10 % 3",
+    "x % 3 + 1",
+    "floor(2.5) + ceiling(2.5)",
+    "Mod(10, 3)",
+    "sign(-2) * abs(-3)",
+    "asinh(x) + acosh(x) + atanh(x) + acot(x)",
+    "-x**2",
+    "-2**-2",
+    "2**3**2",
+    "--3",
+    "5!",
+    "x*y/z - (x - y)**2",
+    "log(x, 2)",
+    "1000.5",
+]
+
+
+@pytest.mark.parametrize("expression", corpus() + EXTRA)
+def test_same_result_as_sympify(expression):
+    assert parse_math(expression) == sympify(expression)
+
+
+def test_long_sign_run():
+    # Antes: RecursionError con una racha de signos
+    assert parse_math("-" * 1500 + "2**2") == 4
+
+
+@pytest.mark.parametrize("expression", [
+    "1" + "**1" * 1000,
+    "(" * (MAX_DEPTH + 1) + "1" + ")" * (MAX_DEPTH + 1),
+])
+def test_nesting_limit(expression):
+    with pytest.raises(ParseError):
+        parse_math(expression)
+
+
+@pytest.mark.parametrize("expression", [
+    "__import__('os')",
+    "eval(1)",
+    "x.real",
+    "lambda: 1",
+    "diff(x**2, x)",
+])
+def test_rejects_outside_whitelist(expression):
+    with pytest.raises(ParseError):
+        parse_math(expression)
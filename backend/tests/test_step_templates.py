@@ -0,0 +1,49 @@
+"""
+Tests del formato compacto de pasos: el catálogo reconstruye el texto
+"""
+import pytest
+
+from app.calculator_engine import CalculatorEngine
+from app.step_templates import step_templates
+
+engine = CalculatorEngine()
+
+
+def expand(step, templates):
+    """
+    Texto de un paso compacto, como lo reconstruye el cliente
+    """
+    if "template" not in step:
+        return step
+    template = templates[step["template"]]
+    params = step.get("params", {})
+    text = {name: template[name].format_map(params) for name in ("description", "detail")}
+    return {"step": step["step"], **text, "expression": step.get("expression"),
+            "expression_latex": step.get("expression_latex")}
+
+
+@pytest.mark.parametrize("expression, mode", [
+    ("(2+3)*4-6/2", "auto"),
+    ("144/12", "auto"),
+    ("3*4", "auto"),
+    ("2**3", "auto"),
+    ("8-10", "auto"),
+    ("2*(x+3) - 4", "algebra"),
+    ("x**2=4", "solve"),
+    ("sin(x)", "derivative"),
+    ("x**2", "integral"),
+])
+def test_compact_rebuilds_text(expression, mode):
+    steps = engine.calculate(expression, mode)["steps"]
+    text = step_templates.format_steps(steps, "text")
+    compact = step_templates.format_steps(steps, "compact")
+    templates = step_templates.to_dict()["templates"]
+    rebuilt = [expand(step, templates) for step in compact]
+    assert [{k: v for k, v in step.items() if v is not None} for step in rebuilt] == \
+           [{k: v for k, v in step.items() if v is not None} for step in text]
+    assert all("template" not in step for step in text)
+
+
+def test_wrong_params():
+    with pytest.raises(ValueError):
+        step_templates.step(1, "arithmetic.result")
@@ -0,0 +1,38 @@
+"""
+Tests de POST /calculate/stream: eventos y reintento tras un pool roto
+"""
+import json
+
+from app.executor import engine_executor
+
+
+def _events(client, expression, mode):
+    response = client.post("/calculate/stream", json={"expression": expression, "mode": mode})
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_stream_events(client):
+    events = _events(client, "x**2", "derivative")
+    assert events[0]["event"] == "start"
+    assert [event["step"]["step"] for event in events[1:-1]] == list(range(1, len(events) - 1))
+    assert events[-1] == {"event": "result", "original": "x**2", "result": "d/dx[x**2] = 2*x",
+                          "mode": "derivative", "steps_count": len(events) - 2}
+
+
+def test_stream_retries_broken_pool(client):
+    # Arranca los procesos del pool y los termina: el siguiente stream
+    # encuentra el pool roto, lo recicla y reintenta
+    _events(client, "x**3", "derivative")
+    processes = list((engine_executor._pool._processes or {}).values())
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join()
+    recycled = engine_executor.recycled_pools
+
+    events = _events(client, "x**4", "derivative")
+    assert engine_executor.recycled_pools == recycled + 1
+    assert [event["step"]["step"] for event in events[1:-1]] == list(range(1, len(events) - 1))
+    assert events[-1]["result"] == "d/dx[x**4] = 4*x**3"
+    assert not engine_executor._streams
@@ -0,0 +1,53 @@
+"""
+Tests del sanitizador de expresiones (app.utils)
+"""
+import pytest
+
+from app.utils import scan_expression, sanitize_expression, SanitizeError
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ("  2 +   3\t* x ", "2 + 3 * x"),
+    ("10 % 3", "10 % 3"),
+    ("log(x, 2)", "log(x, 2)"),
+    ("8 ÷ 2 × 3", "8 ÷ 2 × 3"),
+])
+def test_accepts(expression, expected):
+    assert sanitize_expression(expression) == expected
+
+
+@pytest.mark.parametrize("expression, code", [
+    ("", "empty"),
+    ("1, 2", "multiple_expressions"),
+    ("2 $ 3", "invalid_character"),
+    ("__class__", "forbidden"),
+    ("open(1)", "forbidden"),
+    ("2open", "forbidden"),
+    ("EVAL(1)", "forbidden"),
+    ("profile", "forbidden"),
+    ("x²", "invalid_character"),
+    ("٣+1", "invalid_character"),
+    ("ℵ+1", "invalid_character"),
+    ("Ⅻ+1", "invalid_character"),
+    ("θ + 1", "invalid_character"),
+])
+def test_rejects(expression, code):
+    with pytest.raises(SanitizeError) as error:
+        sanitize_expression(expression)
+    assert error.value.diagnostics[0].code == code
+
+
+def test_diagnostic_positions():
+    diagnostics = scan_expression("  2 $ 3 ; x").diagnostics
+    assert [(d.code, d.position) for d in diagnostics] == [("invalid_character", 4), ("invalid_character", 8)]
+
+
+def test_forbidden_positions():
+    diagnostics = scan_expression("2open + execfile").diagnostics
+    assert [(d.code, d.position, d.message.split(": ")[1]) for d in diagnostics] == \
+           [("forbidden", 1, "open"), ("forbidden", 8, "execfile")]
+
+
+def test_too_long():
+    result = scan_expression("1+" * 6000 + "1", max_length=100)
+    assert [d.code for d in result.diagnostics] == ["too_long"]